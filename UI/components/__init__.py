@@ -8,6 +8,7 @@ from .styled_widgets import (
 from .chat_panel import ChatPanel
 from .loading_indicator import LoadingIndicator
 from .template_dialog import TemplateDialog
+from .history_search_dialog import HistorySearchDialog
 
 __all__ = [
     'StyledButton',
@@ -17,5 +18,6 @@ __all__ = [
     'StyledPlainTextEdit',
     'ChatPanel',
     'LoadingIndicator',
-    'TemplateDialog'
+    'TemplateDialog',
+    'HistorySearchDialog'
 ]
\ No newline at end of file
@@ -1,11 +1,20 @@
+from PyQt6.QtCore import pyqtSignal, QTimer
+from PyQt6.QtGui import QTextCursor, QTextBlockFormat, QTextCharFormat
 from PyQt6.QtWidgets import QFrame, QVBoxLayout, QHBoxLayout, QLabel, QWidget
-from .styled_widgets import StyledComboBox, StyledCheckBox, StyledTextEdit
+from .styled_widgets import StyledButton, StyledComboBox, StyledCheckBox, StyledTextEdit
 from .loading_indicator import LoadingIndicator
+from services.payload_builder import PayloadBuilder
 
 class ChatPanel(QFrame):
-    def __init__(self, model_index, models, parent=None):
+    stop_requested = pyqtSignal(int)  # 请求停止当前面板的回复
+
+    def __init__(self, model_index, models, parent=None, history_page_size=50):
         super().__init__(parent)
         self.model_index = model_index
+        # 恢复历史时只显示最后一页，向上滚动到顶部时再显示更早的消息
+        self.history_page_size = max(1, history_page_size)
+        self.history = []
+        self.history_start = 0  # history 中已显示的第一条消息的下标
         self.setFrameStyle(QFrame.Shape.Box | QFrame.Shadow.Raised)
         self.loading_indicator = LoadingIndicator(self)
         self.apply_style()
@@ -38,11 +47,33 @@ class ChatPanel(QFrame):
         self.enable_checkbox = StyledCheckBox("启用")
         self.enable_checkbox.setChecked(True)
 
+        # 勾选后不与其他面板的相同请求共享回复，单独采样
+        self.independent_checkbox = StyledCheckBox("独立采样")
+        self.independent_checkbox.setToolTip("与其他面板使用相同模型和历史时，仍然单独发送请求")
+
+        # 状态提示：重试、对冲、排队等
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("color: #6b7280; font-size: 12px;")
+        self.status_label.setVisible(False)
+
+        self.stop_button = StyledButton("⏹ 停止")
+        self.stop_button.setVisible(False)
+        self.stop_button.clicked.connect(lambda: self.stop_requested.emit(self.model_index))
+
         header_layout.addWidget(title)
         header_layout.addWidget(self.model_combo)
         header_layout.addWidget(self.enable_checkbox)
+        header_layout.addWidget(self.independent_checkbox)
+        header_layout.addWidget(self.status_label)
+        header_layout.addWidget(self.stop_button)
         layout.addWidget(header)
 
+        # 上一次回复的耗时统计，悬停显示该模型的 p50/p95
+        self.metrics_label = QLabel()
+        self.metrics_label.setStyleSheet("color: #6b7280; font-size: 12px;")
+        self.metrics_label.setVisible(False)
+        layout.addWidget(self.metrics_label)
+
         # Chat display
         self.chat_display = StyledTextEdit()
         self.chat_display.setReadOnly(True)
@@ -64,6 +95,7 @@ class ChatPanel(QFrame):
             </html>
         """)
         layout.addWidget(self.chat_display)
+        self.chat_display.verticalScrollBar().valueChanged.connect(self.handle_scroll)
 
     def apply_style(self):
         self.setStyleSheet("""
@@ -81,6 +113,84 @@ class ChatPanel(QFrame):
             }
         """)
 
+    def set_streaming(self, streaming):
+        """切换回复中的状态：加载动画和停止按钮"""
+        if streaming:
+            self.loading_indicator.start()
+        else:
+            self.loading_indicator.stop()
+        self.stop_button.setVisible(streaming)
+        if not streaming:
+            self.set_status("")
+
+    def set_status(self, text):
+        """显示或清除状态提示"""
+        self.status_label.setText(text)
+        self.status_label.setVisible(bool(text))
+
+    def show_metrics(self, summary, details=""):
+        """显示上一次回复的耗时统计"""
+        self.metrics_label.setText(summary)
+        self.metrics_label.setToolTip(details)
+        self.metrics_label.setVisible(True)
+
+    @staticmethod
+    def format_message(message):
+        """历史消息在 chat_display 中的 HTML"""
+        if message["role"] == "user":
+            # 与发送时的显示相同，附件只显示文件名
+            content = PayloadBuilder.strip_attachments(message["content"], label="已上传文件")
+            return f'<div style="color: #2563eb; margin: 8px 0;"><b>您:</b> {content}</div>'
+        return f'<div style="margin: 8px 0;"><b><span style="color: green;">AI助手:</b> {message["content"]}</div>'
+
+    def show_history(self, messages):
+        """
+        显示恢复的对话历史，只渲染最后 history_page_size 条
+        messages 是面板的对话历史列表本身，之后追加的消息由界面直接显示
+        """
+        self.chat_display.clear()
+        self.history = messages
+        self.history_start = max(0, len(messages) - self.history_page_size)
+        for message in messages[self.history_start:]:
+            self.chat_display.append(self.format_message(message))
+        scrollbar = self.chat_display.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+        self.fill_viewport()
+
+    def reset_history(self):
+        """清空对话后不再有可加载的更早消息"""
+        self.history = []
+        self.history_start = 0
+
+    def handle_scroll(self, value):
+        if value == self.chat_display.verticalScrollBar().minimum() and self.history_start > 0:
+            self.load_older_history()
+
+    def load_older_history(self):
+        """在顶部插入上一页消息，保持当前可见的内容不动"""
+        if self.history_start == 0:
+            return
+        start = max(0, self.history_start - self.history_page_size)
+        scrollbar = self.chat_display.verticalScrollBar()
+        old_maximum, old_value = scrollbar.maximum(), scrollbar.value()
+
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.movePosition(QTextCursor.MoveOperation.Start)
+        cursor.beginEditBlock()
+        for message in self.history[start:self.history_start]:
+            cursor.insertHtml(self.format_message(message))
+            cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+        cursor.endEditBlock()
+        self.history_start = start
+
+        scrollbar.setValue(old_value + scrollbar.maximum() - old_maximum)
+        self.fill_viewport()
+
+    def fill_viewport(self):
+        """内容不足一屏时没有滚动条可拖动，继续加载直到出现滚动条或全部显示"""
+        if self.history_start > 0 and self.chat_display.verticalScrollBar().maximum() == 0:
+            QTimer.singleShot(0, self.load_older_history)
+
     def handle_quote_request(self, text):
         # 获取主窗口的输入框并插入引用文本
         main_window = self.window()
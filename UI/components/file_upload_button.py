@@ -1,20 +1,23 @@
 # chat_app/ui/components/file_upload_button.py
 import os
 
-from PyQt6.QtWidgets import QPushButton, QMessageBox, QFileDialog, QLabel, QHBoxLayout, QWidget, QVBoxLayout, \
-    QSizePolicy
+from PyQt6.QtWidgets import QPushButton, QFileDialog, QLabel, QHBoxLayout, QWidget, QVBoxLayout, \
+    QSizePolicy, QInputDialog
 from PyQt6.QtCore import pyqtSignal, Qt
 
-from services.file_service import FileService
+from services.file_ingestor import FileIngestor
+from services.pdf_service import PdfService
 
 
 class FileUploadStatus(QWidget):
     file_removed = pyqtSignal(str)
+    files_changed = pyqtSignal()  # 文件读取完成、失败或被删除
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.init_ui()
         self.files = {}
+        self.discarded = set()  # 读取中被删除的文件，读取完成后丢弃
         self.setVisible(False)
 
     def init_ui(self):
@@ -34,72 +37,146 @@ class FileUploadStatus(QWidget):
         outer_layout.addWidget(container)
         outer_layout.addStretch()
 
-    def add_file(self, file_name, content):
-        """添加新文件"""
-        if file_name not in self.files:
-            file_widget = QWidget()
-            h_layout = QHBoxLayout(file_widget)
-            h_layout.setContentsMargins(0, 0, 0, 0)
-            h_layout.setSpacing(8)
-
-            # 文件图标
-            icon_label = QLabel("📄")
-            icon_label.setStyleSheet("font-size: 16px;")
-
-            # 文件名标签
-            name_label = QLabel(file_name)
-            name_label.setStyleSheet("""
-                color: #3B82F6;  /* 使用蓝色 */
-                font-size: 13px;
-                font-weight: 500;
-            """)
-            name_label.setFixedWidth(name_label.sizeHint().width())
-
-            # 删除按钮
-            delete_btn = QPushButton("✖")
-            delete_btn.setStyleSheet("""
-                QPushButton {
-                    background: transparent;
-                    border: none;
-                    color: #DB2777;
-                    padding: 2px 6px;
-                    font-size: 12px;
-                }
-                QPushButton:hover {
-                    color: #EF4444;
-                }
-            """)
-            delete_btn.clicked.connect(lambda: self.remove_file(file_name))
-
-            h_layout.addWidget(icon_label)
-            h_layout.addWidget(name_label)
-            h_layout.addWidget(delete_btn)
-            h_layout.addStretch()
-
-            self.main_layout.addWidget(file_widget)
-            self.files[file_name] = {
-                'content': content,
-                'widget': file_widget
+    def create_chip(self, file_name):
+        """创建文件标签：图标、文件名和删除按钮"""
+        file_widget = QWidget()
+        h_layout = QHBoxLayout(file_widget)
+        h_layout.setContentsMargins(0, 0, 0, 0)
+        h_layout.setSpacing(8)
+
+        # 文件图标
+        icon_label = QLabel("📄")
+        icon_label.setStyleSheet("font-size: 16px;")
+
+        # 文件名标签
+        name_label = QLabel(file_name)
+        name_label.setStyleSheet("""
+            color: #3B82F6;  /* 使用蓝色 */
+            font-size: 13px;
+            font-weight: 500;
+        """)
+        name_label.setFixedWidth(name_label.sizeHint().width())
+
+        # 删除按钮
+        delete_btn = QPushButton("✖")
+        delete_btn.setStyleSheet("""
+            QPushButton {
+                background: transparent;
+                border: none;
+                color: #DB2777;
+                padding: 2px 6px;
+                font-size: 12px;
             }
+            QPushButton:hover {
+                color: #EF4444;
+            }
+        """)
+        delete_btn.clicked.connect(lambda: self.remove_file(file_name))
+
+        h_layout.addWidget(icon_label)
+        h_layout.addWidget(name_label)
+        h_layout.addWidget(delete_btn)
+        h_layout.addStretch()
+
+        self.main_layout.addWidget(file_widget)
+        self.files[file_name] = {
+            'content': None,
+            'error': None,
+            'widget': file_widget,
+            'label': name_label
+        }
+        self.setVisible(True)
+        return self.files[file_name]
+
+    def set_label(self, file_name, text, color="#3B82F6", tooltip=""):
+        label = self.files[file_name]['label']
+        label.setText(text)
+        label.setToolTip(tooltip)
+        label.setStyleSheet(f"""
+            color: {color};
+            font-size: 13px;
+            font-weight: 500;
+        """)
+        label.setFixedWidth(label.sizeHint().width())
+
+    def is_pending(self, file_name):
+        """文件是否仍在读取"""
+        entry = self.files.get(file_name)
+        return entry is not None and entry['content'] is None and entry['error'] is None
+
+    def pending_files(self):
+        return [name for name in self.files if self.is_pending(name)]
+
+    def start_file(self, file_name):
+        """开始读取文件，读取完成前显示进度，不计入 get_all_files"""
+        self.discarded.discard(file_name)
+        entry = self.files.get(file_name) or self.create_chip(file_name)
+        entry['content'] = None
+        entry['error'] = None
+        self.set_label(file_name, f"{file_name} 读取中…", color="#6b7280")
+
+    def set_progress(self, file_name, done, total, unit="页"):
+        """更新读取进度，PDF 按页、目录按文件"""
+        if file_name in self.discarded or file_name not in self.files:
+            return
+        if self.is_pending(file_name) and total:
+            self.set_label(file_name, f"{file_name} {done}/{total} {unit}", color="#6b7280")
+
+    def add_file(self, file_name, content):
+        """添加新文件，或完成读取中的文件"""
+        if file_name in self.discarded:
+            # 读取完成前已被删除
+            self.discarded.discard(file_name)
+            return
+        entry = self.files.get(file_name) or self.create_chip(file_name)
+        entry['content'] = content
+        entry['error'] = None
+        self.set_label(file_name, file_name)
+        self.files_changed.emit()
 
-            self.setVisible(True)
+    def set_error(self, file_name, error):
+        """读取失败，保留标签显示错误，由用户删除"""
+        if file_name in self.discarded:
+            self.discarded.discard(file_name)
+            return
+        entry = self.files.get(file_name) or self.create_chip(file_name)
+        entry['content'] = None
+        entry['error'] = error
+        self.set_label(file_name, f"{file_name} 读取失败", color="#DC2626", tooltip=error)
+        self.files_changed.emit()
+
+    def drop_pending(self, file_name):
+        """取消读取时移除读取中的文件"""
+        self.discarded.discard(file_name)
+        if self.is_pending(file_name):
+            self.remove_file(file_name)
+            self.discarded.discard(file_name)
 
     def remove_file(self, file_name):
         """删除指定文件"""
         if file_name in self.files:
+            if self.is_pending(file_name):
+                # 仍在读取，读取完成后丢弃
+                self.discarded.add(file_name)
             self.files[file_name]['widget'].deleteLater()
             del self.files[file_name]
             self.file_removed.emit(file_name)
+            self.files_changed.emit()
 
             if not self.files:
                 self.setVisible(False)
 
     def get_all_files(self):
-        """获取所有文件内容"""
-        return {name: data['content'] for name, data in self.files.items()}
+        """获取所有已读取完成的文件内容"""
+        return {name: data['content'] for name, data in self.files.items() if data['content'] is not None}
 
 class FileUploadButton(QPushButton):
-    file_content_ready = pyqtSignal(str)  # 信号：文件内容准备好
+    file_started = pyqtSignal(str)  # 信号：开始读取文件（文件路径）
+    file_progress = pyqtSignal(str, int, int, str)  # 信号：读取进度（文件路径, 已完成, 总数, 单位）
+    file_content_ready = pyqtSignal(str, str)  # 信号：文件内容准备好（文件路径, 内容）
+    file_failed = pyqtSignal(str, str)  # 信号：读取失败（文件路径, 错误信息）
+    file_cancelled = pyqtSignal(str)  # 信号：用户取消了读取（文件路径）
+    ingest_event = pyqtSignal(int, str, str, object)  # 工作线程中的读取事件，转到界面线程处理
 
     def __init__(self, parent=None):
         super().__init__("📄上传文件", parent)
@@ -118,43 +195,78 @@ class FileUploadButton(QPushButton):
             }
         """)
         self.clicked.connect(self.handle_upload)
-        self.file_service = FileService()
+        # 文件在后台线程池中读取，结果通过信号回到界面线程
+        self.ingestor = FileIngestor(self.ingest_event.emit)
+        self.ingest_event.connect(self.handle_ingest_event)
+        self.jobs = {}  # 文件路径 -> 读取任务编号
 
     def handle_upload(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "选择文件",
+            "",
+            "代码和文本文件 (*.txt *.md *.py *.java *.cpp *.c *.js *.html *.css *.json *.xml *.yaml *.sql);;PDF 文件 (*.pdf);;所有文件 (*.*)"
+        )
+        self.add_files(file_paths)
+
+    def handle_folder_upload(self):
+        """上传整个目录，遵循其中的 .gitignore"""
+        folder = QFileDialog.getExistingDirectory(self, "选择文件夹")
+        if folder:
+            self.add_files([folder])
+
+    def add_files(self, file_paths):
+        """把文件或目录交给后台读取，对话框和拖放的文件都从这里进入"""
+        for file_path in file_paths:
+            if file_path in self.jobs:
+                self.ingestor.cancel(self.jobs[file_path])
+            self.jobs[file_path] = self.ingestor.submit(file_path)
+            self.file_started.emit(file_path)
+
+    def cancel_file(self, file_name):
+        """取消指定文件名仍在进行的读取"""
+        for file_path, job_id in list(self.jobs.items()):
+            if os.path.basename(file_path) == file_name:
+                self.ingestor.cancel(job_id)
+                del self.jobs[file_path]
+
+    def handle_ingest_event(self, job_id, file_path, event, data):
+        if self.jobs.get(file_path) != job_id:
+            # 已取消或已重新提交
+            return
+        if event == "progress":
+            self.file_progress.emit(file_path, *data)
+        elif event == "pages":
+            self.choose_pages(file_path, data)
+        elif event == "finished":
+            del self.jobs[file_path]
+            self.file_content_ready.emit(file_path, data)
+        elif event == "error":
+            del self.jobs[file_path]
+            self.file_failed.emit(file_path, data)
+
+    def choose_pages(self, file_path, page_count):
+        """页数较多的 PDF 先选择页码范围，再重新提交"""
+        text, ok = QInputDialog.getText(
+            self,
+            "选择页码",
+            f"{os.path.basename(file_path)} 共 {page_count} 页，请输入要读取的页码范围（如 1-20, 35）：",
+            text=f"1-{page_count}"
+        )
+        if file_path not in self.jobs:
+            # 对话框打开期间文件已被删除
+            return
+        if not ok:
+            del self.jobs[file_path]
+            self.file_cancelled.emit(file_path)
+            return
         try:
-            file_path, _ = QFileDialog.getOpenFileName(
-                self,
-                "选择文件",
-                "",
-                "代码和文本文件 (*.txt *.md *.py *.java *.cpp *.c *.js *.html *.css *.json *.xml *.yaml *.sql);;所有文件 (*.*)"
-            )
-
-            if not file_path:
-                return
-
-            # 保存文件路径用于获取文件名
-            self.setProperty("last_file_path", file_path)
-
-            if not self.file_service.is_file_size_valid(file_path):
-                QMessageBox.warning(
-                    self,
-                    "文件过大",
-                    "文件大小不能超过10MB。"
-                )
-                return
-
-            content = self.file_service.read_file(file_path)
-            if content:
-                self.file_content_ready.emit(content)
-                QMessageBox.information(
-                    self,
-                    "上传成功",
-                    f"文件 {os.path.basename(file_path)} 已成功读取，\n您现在可以发送消息了。"
-                )
-        except Exception as e:
-            QMessageBox.critical(
-                self,
-                "错误",
-                f"读取文件时出错：{str(e)}"
-            )
+            pages = PdfService.parse_page_range(text, page_count)
+        except ValueError as e:
+            del self.jobs[file_path]
+            self.file_failed.emit(file_path, str(e))
+            return
+        self.jobs[file_path] = self.ingestor.submit(file_path, pages, ask_pages=False)
 
+    def shutdown(self):
+        self.ingestor.shutdown()
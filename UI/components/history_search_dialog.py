@@ -0,0 +1,105 @@
+# chat_app/ui/components/history_search_dialog.py
+
+import html
+import time
+from datetime import datetime
+
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QListWidget, QListWidgetItem, \
+    QDialogButtonBox
+
+from services.history_store import HistoryStore
+
+
+class HistorySearchDialog(QDialog):
+    """
+    搜索历史消息
+    输入为空时列出最近的会话；双击结果打开对应会话，会话内容在选中后才读取
+    """
+    session_selected = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("搜索历史")
+        self.setMinimumSize(640, 480)
+
+        layout = QVBoxLayout(self)
+
+        search_layout = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("输入关键词搜索所有会话…")
+        self.search_input.setClearButtonEnabled(True)
+        search_layout.addWidget(self.search_input)
+        layout.addLayout(search_layout)
+
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("color: #6b7280; font-size: 12px;")
+        layout.addWidget(self.status_label)
+
+        self.result_list = QListWidget()
+        self.result_list.setWordWrap(True)
+        self.result_list.setAlternatingRowColors(True)
+        layout.addWidget(self.result_list)
+
+        button_box = QDialogButtonBox()
+        self.open_button = button_box.addButton("打开会话", QDialogButtonBox.ButtonRole.AcceptRole)
+        button_box.addButton(QDialogButtonBox.StandardButton.Close)
+        button_box.accepted.connect(self.open_selected)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+        # 输入停顿后再搜索，避免每个按键都查询一次
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_input.textChanged.connect(lambda: self.search_timer.start())
+        self.result_list.itemDoubleClicked.connect(lambda item: self.open_selected())
+        self.result_list.currentItemChanged.connect(
+            lambda current, previous: self.open_button.setEnabled(current is not None))
+
+        self.run_search()
+
+    def run_search(self):
+        query = self.search_input.text().strip()
+        started = time.perf_counter()
+        try:
+            if query:
+                results = HistoryStore.search(query)
+            else:
+                results = HistoryStore.list_sessions()
+        except Exception as e:
+            self.status_label.setText(f"搜索失败: {e}")
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.result_list.clear()
+        for result in results:
+            if query:
+                header = (f"{result['title'] or '未命名会话'} · 面板 {result['panel'] + 1}"
+                          f"{' · ' + result['model'] if result['model'] else ''} · {self._format_time(result['created_at'])}")
+                text = f"{header}\n{'您' if result['role'] == 'user' else 'AI助手'}: {result['snippet']}"
+            else:
+                text = (f"{result['title'] or '未命名会话'}\n"
+                        f"{self._format_time(result['updated_at'])} · {result['message_count']} 条消息")
+            item = QListWidgetItem(text)
+            item.setData(Qt.ItemDataRole.UserRole, result['session_id'] if query else result['id'])
+            item.setToolTip(html.escape(text))
+            self.result_list.addItem(item)
+
+        if query:
+            self.status_label.setText(f"找到 {len(results)} 条结果（{elapsed:.0f} ms）")
+        else:
+            self.status_label.setText(f"最近 {len(results)} 个会话")
+        self.open_button.setEnabled(self.result_list.currentItem() is not None)
+
+    def open_selected(self):
+        item = self.result_list.currentItem()
+        if item is None:
+            return
+        self.session_selected.emit(item.data(Qt.ItemDataRole.UserRole))
+        self.accept()
+
+    @staticmethod
+    def _format_time(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
@@ -234,6 +234,18 @@ class StyledPlainTextEdit(QPlainTextEdit):
         cursor.insertText(quoted_text)
         self.setFocus()  # 将焦点设置到输入框
 
+    def canInsertFromMimeData(self, source):
+        if self.window is not None and any(url.isLocalFile() for url in source.urls()):
+            return True
+        return super().canInsertFromMimeData(source)
+
+    def insertFromMimeData(self, source):
+        # 拖入的文件作为附件上传，而不是把路径插入输入框
+        if self.window is not None and any(url.isLocalFile() for url in source.urls()):
+            self.window.add_dropped_files(source.urls())
+        else:
+            super().insertFromMimeData(source)
+
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Return and not event.modifiers():
             self.window.send_message()
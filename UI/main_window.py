@@ -1,34 +1,61 @@
-import json
+import html
 import os
 import re
 
 import markdown2
-from PyQt6.QtCore import QSettings, QTimer
+from PyQt6.QtCore import QSettings, QTimer, pyqtSignal
 from PyQt6.QtGui import QAction, QActionGroup
 from PyQt6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QDialog, QMenu, QHBoxLayout, QGridLayout, QScrollArea, \
     QMessageBox
 
-from services import StreamWorker
+from services.stream_bridge import StreamBridge
+from services.delta_buffer import DeltaBuffer
+from services.stream_engine import StreamRequest
+from services.request_policy import RequestPolicy
+from services.payload_builder import PayloadBuilder
 from .components.file_upload_button import FileUploadButton, FileUploadStatus
 from .components.styled_widgets import StyledButton, StyledPlainTextEdit
 from .components.chat_panel import ChatPanel
 from .components.template_dialog import TemplateDialog
-from services.history_service import HistoryService
+from .components.history_search_dialog import HistorySearchDialog
+from services.history_journal import HistoryJournal
+from services.history_store import HistoryStore
+from services.attachment_store import AttachmentStore
+from services.pdf_service import PdfService
 from services.api_service import APIService
+from services.client_pool import ClientPool
+from services.response_cache import ResponseCache
+from services.metrics_service import MetricsService
 from config import ConfigManager
 
 class MultiChatWindow(QMainWindow):
+    history_loaded = pyqtSignal(list)  # 日志写入线程加载完成的对话历史，转到界面线程处理
+
     def __init__(self):
         super().__init__()
         self.models = ConfigManager.get_models()
         self.chat_panels = []
         self.conversation_histories = []
-        self.workers = []
+        self.history_journal = HistoryJournal()  # 对话历史按消息追加写入，不在界面线程写文件
+        self.history_loader = None  # 正在加载或逐个面板显示的历史，完成前不能发送
+        self.pending_sends = []  # 等待文件读取完成的消息: (消息, 发送时的文件名)
+        self.active_requests = []  # 每个面板当前的请求编号
+        # 消息片段按帧率合并刷新，stream_flush_hz 为 0 时逐片段刷新
+        flush_hz = ConfigManager.get_setting("stream_flush_hz", 60)
+        self.delta_buffer = None
+        if flush_hz and flush_hz > 0:
+            self.delta_buffer = DeltaBuffer(flush_hz, self)
+            self.delta_buffer.flushed.connect(self.handle_flushed_deltas)
+        self.stream_bridge = StreamBridge(self.delta_buffer, self)
+        self.stream_bridge.stream_event.connect(self.handle_stream_event)
         self.current_template = ""
         self.templates = ConfigManager.get_templates()
         self.layout_mode = "horizontal"  # 默认横向布局
+        # 恢复历史时每个面板先显示的消息数，更早的消息在向上滚动时显示
+        self.history_page_size = ConfigManager.get_setting("history_page_size", 50)
 
         self.setWindowTitle("智械中心")
+        self.setAcceptDrops(True)  # 拖放文件上传
         self.setGeometry(100, 100, 1600, 700)
         self.setStyleSheet("""
             QMainWindow {
@@ -38,55 +65,115 @@ class MultiChatWindow(QMainWindow):
         self.init_ui()
         self.init_template_menu()
         self.init_theme()
+        self.init_stats_menu()
         self.init_history()
 
 
     def init_history(self):
-        # 检查是否存在历史记录文件，并提示用户是否恢复会话
-        if os.path.exists('./configFiles/history.json'):
-            reply = QMessageBox.question(self, '恢复会话', '是否恢复上次的会话？',
-                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.Yes)
-            if reply == QMessageBox.StandardButton.Yes:
-                self.load_conversation_history()
-            else:
-                self.conversation_histories = [[] for _ in self.chat_panels]
-        else:
-            self.conversation_histories = [[] for _ in self.chat_panels]
+        # 窗口显示后再恢复会话，启动时间不受历史长度影响
+        self.history_loaded.connect(self.on_history_loaded)
+        QTimer.singleShot(0, self.restore_history)
 
         # 添加清除历史记录的菜单选项
         self.clear_history_action = QAction("清除历史记录", self)
         self.settings_menu.addAction(self.clear_history_action)
         self.clear_history_action.triggered.connect(self.clear_history)
 
-        # 定时保存历史记录
-        self.save_timer = QTimer()
-        self.save_timer.timeout.connect(self.save_conversation_history)
-        self.save_timer.start(60000)  # 每分钟保存一次
+        # 搜索所有会话的历史消息
+        self.search_history_action = QAction("搜索历史", self)
+        self.search_history_action.setShortcut("Ctrl+Shift+F")
+        self.settings_menu.addAction(self.search_history_action)
+        self.search_history_action.triggered.connect(self.show_history_search)
 
-    def save_conversation_history(self):
-        """保存对话历史到文件"""
-        with open('./configFiles/history.json', 'w') as f:
-            json.dump(self.conversation_histories, f)
+    def restore_history(self):
+        # 解压快照、重放日志和首次导入数据库都在日志写入线程中进行，完成后通过 history_loaded 回到界面线程
+        self.conversation_histories = [[] for _ in self.chat_panels]
+        self.send_button.setEnabled(False)
+        self.history_loader = iter(())
+        self.history_journal.start(self.history_loaded.emit)
 
+    def on_history_loaded(self, histories):
+        # 有历史消息时提示用户是否恢复会话，清除全部历史后不再提示
+        if any(histories):
+            reply = QMessageBox.question(self, '恢复会话', '是否恢复上次的会话？',
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.Yes)
+            if reply == QMessageBox.StandardButton.Yes:
+                self.load_conversation_history(histories)
+                return
+            self.history_journal.clear()
+        self.history_loader = None
+        self.send_button.setEnabled(True)
+
+    def append_history(self, model_index, message):
+        """追加一条消息到面板的对话历史，并写入历史日志"""
+        self.conversation_histories[model_index].append(message)
+        model = self.models[self.chat_panels[model_index].model_combo.currentIndex()]['name']
+        self.history_journal.append(model_index, message, model)
+
+    def load_conversation_history(self, histories):
+        """
+        逐个面板显示已加载的对话历史
+        每显示一个面板就让出事件循环，不等待所有面板绘制完；显示完成前暂不能发送
+        """
+        self.send_button.setEnabled(False)
+        self.history_loader = enumerate(histories)
+        self.loaded_panel_count = 0
+        QTimer.singleShot(0, self.load_next_panel)
 
-    def load_conversation_history(self):
-        """从文件加载对话历史"""
+    def load_next_panel(self):
         try:
-            with open('./configFiles/history.json', 'r') as f:
-                histories = json.load(f)
-            for i, panel in enumerate(self.chat_panels):
-                if i < len(histories):
-                    self.conversation_histories[i] = histories[i]
-                    # 加载对话到 chat_display
-                    for message in histories[i]:
-                        if message["role"] == "user":
-                            panel.chat_display.append(
-                                f'<div style="color: #2563eb; margin: 8px 0;"><b>您:</b> {message["content"]}</div>')
-                        else:
-                            panel.chat_display.append(
-                                f'<div style="margin: 8px 0;"><b><span style="color: green;">AI助手:</b> {message["content"]}</div>')
+            index, messages = next(self.history_loader)
+        except StopIteration:
+            self.history_loader = None
+            self.send_button.setEnabled(True)
+            if self.loaded_panel_count != len(self.chat_panels):
+                # 面板数量与上次不同，以当前面板为准
+                self.history_journal.replace(
+                    [self.conversation_histories[i] for i in range(len(self.chat_panels))])
+            return
         except Exception as e:
             print(f"加载历史记录失败: {e}")
+            self.history_loader = None
+            self.send_button.setEnabled(True)
+            return
+
+        self.loaded_panel_count = index + 1
+        if index < len(self.chat_panels):
+            self.conversation_histories[index] = messages
+            # 只显示最后一页，更早的消息在向上滚动时显示
+            self.chat_panels[index].show_history(messages)
+        # 让出事件循环，已加载的面板先绘制
+        QTimer.singleShot(0, self.load_next_panel)
+
+    def show_history_search(self):
+        dialog = HistorySearchDialog(self)
+        dialog.session_selected.connect(self.open_session)
+        dialog.exec()
+
+    def open_session(self, session_id):
+        """打开数据库中的会话，之后的消息继续写入该会话"""
+        try:
+            histories = HistoryStore.load_session(session_id)
+            models = HistoryStore.session_models(session_id)
+        except Exception as e:
+            QMessageBox.warning(self, "打开会话失败", str(e))
+            return
+
+        for i in range(len(self.chat_panels)):
+            self.stop_panel(i)
+        while len(self.chat_panels) < len(histories):
+            self.add_chat_panel()
+        # 恢复每个面板当时使用的模型
+        names = [model['name'] for model in self.models]
+        for panel_index, name in models.items():
+            if panel_index < len(self.chat_panels) and name in names:
+                self.chat_panels[panel_index].model_combo.setCurrentIndex(names.index(name))
+
+        histories = [histories[i] if i < len(histories) else [] for i in range(len(self.chat_panels))]
+        self.conversation_histories = histories
+        for panel, messages in zip(self.chat_panels, histories):
+            panel.show_history(messages)
+        self.history_journal.replace(histories, session_id=session_id)
 
     def clear_history(self):
         """清除所有历史记录"""
@@ -95,9 +182,10 @@ class MultiChatWindow(QMainWindow):
                                      QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             self.conversation_histories = [[] for _ in self.chat_panels]
-            with open('./configFiles/history.json', 'w') as f:
-                json.dump([], f)
+            self.history_journal.purge()
+            AttachmentStore.clear()
             for panel in self.chat_panels:
+                panel.reset_history()
                 panel.chat_display.clear()
     def init_theme(self):
         # 定义白天和黑夜模式的样式表
@@ -140,6 +228,30 @@ class MultiChatWindow(QMainWindow):
         else:
             self.setStyleSheet(self.day_style)
 
+    def init_stats_menu(self):
+        # 添加运行统计的菜单选项
+        self.stats_action = QAction("运行统计", self)
+        self.settings_menu.addAction(self.stats_action)
+        self.stats_action.triggered.connect(self.show_runtime_stats)
+
+    def show_runtime_stats(self):
+        """显示客户端连接复用和响应缓存命中情况"""
+        stats = ClientPool.get_stats()
+        cache_stats = ResponseCache.get_stats()
+        cache_state = "已开启" if ResponseCache.is_enabled() else "未开启"
+        QMessageBox.information(
+            self,
+            "运行统计",
+            f"复用连接: {stats['reused']}\n"
+            f"新建连接: {stats['created']}\n"
+            f"空闲回收: {stats['evicted']}\n"
+            f"当前客户端: {stats['active']}\n\n"
+            f"响应缓存: {cache_state}\n"
+            f"内存命中: {cache_stats['memory_hits']}\n"
+            f"磁盘命中: {cache_stats['disk_hits']}\n"
+            f"未命中: {cache_stats['misses']}"
+        )
+
     def set_style(self, style):
         """设置样式并保存主题选择"""
         self.setStyleSheet(style)
@@ -208,8 +320,11 @@ class MultiChatWindow(QMainWindow):
         self.horizontal_action.triggered.connect(lambda: self.change_layout_mode("horizontal"))
         self.grid_action.triggered.connect(lambda: self.change_layout_mode("grid"))
         self.file_upload_btn = FileUploadButton()
+        self.folder_upload_btn = StyledButton("📁上传文件夹")
+        self.folder_upload_btn.clicked.connect(self.file_upload_btn.handle_folder_upload)
 
         toolbar_layout.addWidget(self.file_upload_btn)
+        toolbar_layout.addWidget(self.folder_upload_btn)
         toolbar_layout.addWidget(self.add_model_btn)
         toolbar_layout.addWidget(self.remove_model_btn)
         toolbar_layout.addWidget(self.layout_settings_btn)
@@ -273,8 +388,18 @@ class MultiChatWindow(QMainWindow):
 
 
         # 连接信号
+        self.file_upload_btn.file_started.connect(
+            lambda file_path: self.file_status.start_file(os.path.basename(file_path)))
+        self.file_upload_btn.file_progress.connect(
+            lambda file_path, done, total, unit: self.file_status.set_progress(
+                os.path.basename(file_path), done, total, unit))
         self.file_upload_btn.file_content_ready.connect(self.handle_file_upload)
+        self.file_upload_btn.file_failed.connect(
+            lambda file_path, error: self.file_status.set_error(os.path.basename(file_path), error))
+        self.file_upload_btn.file_cancelled.connect(
+            lambda file_path: self.file_status.drop_pending(os.path.basename(file_path)))
         self.file_status.file_removed.connect(self.handle_file_remove)
+        self.file_status.files_changed.connect(self.flush_pending_sends)
 
         # Send button with consistent height
         self.send_button = StyledButton("发送", "primary")
@@ -319,16 +444,16 @@ class MultiChatWindow(QMainWindow):
         self.add_model_btn.clicked.connect(self.add_chat_panel)
         self.remove_model_btn.clicked.connect(self.remove_chat_panel)
 
-    def handle_file_upload(self, content):
+    def handle_file_upload(self, file_path, content):
         """处理文件上传"""
-        file_name = os.path.basename(self.sender().property("last_file_path"))
-        self.file_status.add_file(file_name, content)
+        self.file_status.add_file(os.path.basename(file_path), content)
 
     def handle_file_remove(self, file_name):
         """
         处理单个文件删除的事件
         file_name: 被删除的文件名
         """
+        self.file_upload_btn.cancel_file(file_name)
         if not self.file_status.files:
             # 没有文件时，重置任何相关的状态
             self.file_status.setVisible(False)
@@ -345,11 +470,12 @@ class MultiChatWindow(QMainWindow):
 
     def add_chat_panel(self):
         panel_index = len(self.chat_panels)
-        panel = ChatPanel(panel_index, self.models)
+        panel = ChatPanel(panel_index, self.models, history_page_size=self.history_page_size)
+        panel.stop_requested.connect(self.stop_panel)
 
         self.chat_panels.append(panel)
         self.conversation_histories.append([])
-        self.workers.append(None)
+        self.active_requests.append(None)
 
         # 根据当前布局模式重新排列面板
         if self.layout_mode == "horizontal":
@@ -371,7 +497,9 @@ class MultiChatWindow(QMainWindow):
         if len(self.chat_panels) > 1:
             panel = self.chat_panels.pop()
             self.conversation_histories.pop()
-            self.workers.pop()
+            self.history_journal.drop_panel(len(self.chat_panels))
+            self.active_requests.pop()
+            self.stream_bridge.cancel(len(self.chat_panels))
             panel.deleteLater()
 
             # 重新排列现有面板
@@ -494,34 +622,75 @@ class MultiChatWindow(QMainWindow):
             self.template_menu.clear()
             self.init_template_menu()
 
+    def dragEnterEvent(self, event):
+        if any(url.isLocalFile() for url in event.mimeData().urls()):
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        self.add_dropped_files(event.mimeData().urls())
+        event.acceptProposedAction()
+
+    def add_dropped_files(self, urls):
+        """拖放到窗口或输入框的文件交给后台读取"""
+        self.file_upload_btn.add_files([url.toLocalFile() for url in urls if url.isLocalFile()])
+
     def send_message(self):
+        if self.history_loader is not None:
+            return
         user_message = self.input_box.toPlainText()
         files = self.file_status.get_all_files()
+        pending = self.file_status.pending_files()
 
-        if not user_message and not files:
+        if not user_message and not files and not pending:
             return
 
         self.input_box.clear()
 
-        # 准备消息内容
-        display_message = user_message
-        api_message = user_message
+        if pending or self.pending_sends:
+            # 还有文件在读取，读取完成后按顺序自动发送，期间可以继续输入
+            self.pending_sends.append((user_message, set(self.file_status.files)))
+            self.update_send_button()
+            return
+        self.dispatch_message(user_message, files)
+
+    def flush_pending_sends(self):
+        """发送所附文件都已读取完成（或失败、被删除）的排队消息"""
+        while self.pending_sends:
+            user_message, names = self.pending_sends[0]
+            if any(self.file_status.is_pending(name) for name in names):
+                break
+            self.pending_sends.pop(0)
+            files = {name: content for name, content in self.file_status.get_all_files().items() if name in names}
+            if user_message or files:
+                self.dispatch_message(user_message, files)
+        self.update_send_button()
+
+    def update_send_button(self):
+        if self.pending_sends:
+            self.send_button.setText("等待文件…")
+            self.send_button.setToolTip(f"{len(self.pending_sends)} 条消息将在文件读取完成后发送")
+        else:
+            self.send_button.setText("发送")
+            self.send_button.setToolTip("")
 
-        # 如果有上传的文件,添加到消息中
+    def dispatch_message(self, user_message, files):
+        # 准备消息内容，上传的文件拼接在消息之后
+        display_message = user_message
         if files:
-            file_names = list(files.keys())
-            display_message = f"{user_message}\n[已上传文件: {', '.join(file_names)}]"
-
-            # 添加所有文件内容
-            api_message = f"{user_message}\n\n文件内容:\n"
-            for name, content in files.items():
-                api_message += f"\n--- {name} ---\n{content}\n"
+            display_message = f"{user_message}\n[已上传文件: {', '.join(files.keys())}]"
+        # 文件内容按哈希保存一次，各面板的历史中只保存引用
+        api_message = PayloadBuilder.compose_user_message(user_message, files, store=True)
 
         for i, panel in enumerate(self.chat_panels):
             if not panel.enable_checkbox.isChecked():
                 continue
 
-            panel.loading_indicator.start()
+            # 面板仍在回复时先停止，保留已收到的部分回复
+            if self.active_requests[i] is not None:
+                self.stream_bridge.cancel(i)
+                self.record_partial_response(i)
+
+            panel.set_streaming(True)
             panel.current_response = ""
 
             # 添加用户消息到聊天显示
@@ -532,29 +701,88 @@ class MultiChatWindow(QMainWindow):
 
             selected_model = self.models[panel.model_combo.currentIndex()]
 
-            # 更新对话历史
-            self.conversation_histories[i].append({"role": "user", "content": api_message})
-
-            # 停止任何正在运行的worker
-            if self.workers[i] and self.workers[i].isRunning():
-                self.workers[i].terminate()
-                self.workers[i].wait()
-
-            # 创建并启动新的worker
-            self.workers[i] = StreamWorker(
-                self.conversation_histories[i].copy(),
-                api_message,
-                selected_model['url'],
-                selected_model['model'],
-                selected_model.get('key', ''),
-                self.current_template,
-                i
-            )
+            # 提交到流式引擎，同一面板未完成的请求会被取消
+            # 历史中不包含当前消息，由 PayloadBuilder 统一追加
+            self.active_requests[i] = self.stream_bridge.submit(i, StreamRequest(
+                conversation_history=self.conversation_histories[i].copy(),
+                user_message=api_message,
+                api_url=selected_model['url'],
+                model_name=selected_model['model'],
+                api_key=selected_model.get('key', ''),
+                prompt=self.current_template,
+                share=not panel.independent_checkbox.isChecked(),
+                policy=RequestPolicy.from_model(selected_model, self.models)
+            ))
+            self.append_history(i, {"role": "user", "content": api_message})
+
+        if self.delta_buffer is not None:
+            self.delta_buffer.start()
+
+    def is_active_request(self, model_index, request_id):
+        return model_index < len(self.active_requests) and self.active_requests[model_index] == request_id
+
+    def handle_flushed_deltas(self, model_index, request_id, text):
+        """每帧一次，把合并后的片段写入面板"""
+        if self.is_active_request(model_index, request_id):
+            self.update_chat_display(text, model_index)
+
+    def handle_stream_event(self, model_index, request_id, event, data):
+        """分发流式引擎的事件，忽略已被取代的请求"""
+        if not self.is_active_request(model_index, request_id):
+            return
 
-            self.workers[i].message_ready.connect(self.update_chat_display)
-            self.workers[i].reply_finished.connect(self.render_final_response)
-            self.workers[i].error_occurred.connect(self.handle_error)
-            self.workers[i].start()
+        if event == "delta":
+            self.update_chat_display(data, model_index)
+            return
+        if event == "status":
+            self.chat_panels[model_index].set_status(data)
+            return
+        if event == "metrics":
+            self.chat_panels[model_index].show_metrics(data.summary(), MetricsService.describe(data.model))
+            return
+
+        if event == "finished":
+            self.drain_pending_deltas(model_index)
+            self.active_requests[model_index] = None
+            self.render_final_response(data, model_index)
+        elif event == "cancelled":
+            self.record_partial_response(model_index)
+        elif event == "error":
+            self.drain_pending_deltas(model_index)
+            self.active_requests[model_index] = None
+            self.handle_error(data, model_index)
+
+        if self.delta_buffer is not None and not any(self.active_requests):
+            self.delta_buffer.stop()
+
+    def drain_pending_deltas(self, model_index):
+        """把缓冲区中尚未刷新的片段写入面板"""
+        request_id = self.active_requests[model_index]
+        if self.delta_buffer is not None and request_id is not None:
+            remaining = self.delta_buffer.take(model_index, request_id)
+            if remaining:
+                self.update_chat_display(remaining, model_index)
+
+    def stop_panel(self, model_index):
+        """停止指定面板的回复，并记录已显示的部分回复"""
+        if model_index < len(self.active_requests) and self.active_requests[model_index] is not None:
+            self.stream_bridge.cancel(model_index)
+            self.record_partial_response(model_index)
+
+    def record_partial_response(self, model_index):
+        """把被取消请求已收到的部分回复写入对话历史"""
+        self.drain_pending_deltas(model_index)
+        self.active_requests[model_index] = None
+        panel = self.chat_panels[model_index]
+
+        if panel.current_response:
+            self.append_history(model_index, {
+                "role": "assistant",
+                "content": panel.current_response
+            })
+        panel.chat_display.append('<div style="color: #9ca3af; margin: 4px 0;">（已停止）</div>')
+        panel.current_response = ""
+        panel.set_streaming(False)
 
     def update_chat_display(self, reply, model_index):
         if model_index < len(self.chat_panels):
@@ -570,9 +798,9 @@ class MultiChatWindow(QMainWindow):
 
     def update_conversation_history(self, reply, model_index):
         if model_index < len(self.conversation_histories):
-            self.conversation_histories[model_index].append({"role": "assistant", "content": reply})
+            self.append_history(model_index, {"role": "assistant", "content": reply})
             # 停止加载动画
-            self.chat_panels[model_index].loading_indicator.stop()
+            self.chat_panels[model_index].set_streaming(False)
 
     import re
 
@@ -613,28 +841,38 @@ class MultiChatWindow(QMainWindow):
                 pass
 
             # 更新对话历史
-            self.conversation_histories[model_index].append({
+            self.append_history(model_index, {
                 "role": "assistant",
                 "content": panel.current_response
             })
 
             # 重置当前响应并停止加载指示器
             panel.current_response = ""
-            panel.loading_indicator.stop()
+            panel.set_streaming(False)
 
             # 自动滚动到底部
             scrollbar = panel.chat_display.verticalScrollBar()
             scrollbar.setValue(scrollbar.maximum())
 
-    def handle_error(self, error):
+    def handle_error(self, error, model_index=None):
         print(f"Error in worker thread: {error}")
-        # 发生错误时停止所有加载动画
+        if model_index is not None and model_index < len(self.chat_panels):
+            panel = self.chat_panels[model_index]
+            panel.chat_display.append(
+                f'<div style="color: #dc2626; margin: 4px 0;">请求失败: {html.escape(str(error))}</div>'
+            )
+            panel.current_response = ""
+            panel.set_streaming(False)
+            return
+        # 无法确定来源时停止所有加载动画
         for panel in self.chat_panels:
-            panel.loading_indicator.stop()
+            panel.set_streaming(False)
 
     def clear_memory(self):
         self.conversation_histories = [[] for _ in self.chat_panels]
+        self.history_journal.clear()
         for panel in self.chat_panels:
+            panel.reset_history()
             panel.chat_display.setHtml("""
                 <html>
                 <head>
@@ -657,5 +895,11 @@ class MultiChatWindow(QMainWindow):
         settings = QSettings("MyCompany", "ChatApp")
         theme = "day" if self.styleSheet() == self.day_style else "night"
         settings.setValue("theme", theme)
-        self.save_conversation_history()
+        # 写完剩余的历史记录
+        self.history_journal.close()
+        self.file_upload_btn.shutdown()
+        PdfService.shutdown()
+        # 停止流式引擎并关闭所有长连接客户端
+        self.stream_bridge.shutdown()
+        ClientPool.shutdown()
         super().closeEvent(event)
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+无界面批量模式：把 JSONL 中的每条提示词发给多个模型，结果逐条写入输出 JSONL
+
+输入每行一个 JSON 对象:
+    {"id": "q1", "prompt": "问题", "template": "提示词模板名称", "files": ["附件路径"], "models": ["模型名称"]}
+也可以用 "system" 直接给出系统提示词；
+只有 prompt 是必填项，id 默认为行号，models 默认为命令行指定的模型（未指定时为全部模型），
+附件路径相对于输入文件所在目录
+
+用法:
+    python batch.py prompts.jsonl -o results.jsonl --models gpt-4o,claude --concurrency 8
+
+输出文件中已成功的 (id, 模型) 会在再次运行时跳过，中断后重新执行同一命令即可继续
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from config import ConfigManager
+from services.file_service import FileService
+from services.payload_builder import PayloadBuilder
+from services.request_policy import RequestPolicy
+from services.stream_engine import StreamEngine, StreamRequest
+from utils.proxy_utils import ProxyUtils
+
+
+def load_jobs(input_path, default_models, templates):
+    """
+    读取输入文件，按 (提示词, 模型) 展开为任务
+
+    Returns:
+        list: [(id, 模型条目, 提示词, 系统提示词, 附件路径列表)]
+    """
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    jobs = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"跳过第 {line_number} 行，无法解析: {e}")
+                continue
+            if isinstance(item, str):
+                item = {"prompt": item}
+
+            item_id = str(item.get("id", line_number))
+            template = item.get("template")
+            system_prompt = item.get("system", "")
+            if template:
+                if template not in templates:
+                    print(f"跳过 {item_id}: 未找到提示词模板 {template}")
+                    continue
+                system_prompt = templates[template]
+            files = [os.path.join(base_dir, path) for path in item.get("files", [])]
+
+            models = default_models
+            if item.get("models"):
+                models = [model for model in default_models if model['name'] in item["models"]]
+            for model in models:
+                jobs.append((item_id, model, item.get("prompt", ""), system_prompt, files))
+    return jobs
+
+
+def load_finished(output_path):
+    """读取已成功完成的 (id, 模型名称)"""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断时可能留下不完整的最后一行
+                continue
+            if not record.get("error"):
+                finished.add((record["id"], record["model"]))
+    return finished
+
+
+class BatchRunner:
+    """
+    复用流式引擎执行任务，引擎负责限流、重试、对冲和缓存
+    每个任务占用引擎中独立的编号，同时进行的任务数受 concurrency 限制
+    """
+
+    def __init__(self, models, output_path, concurrency):
+        self.models = models
+        self.output_path = output_path
+        self.slots = threading.Semaphore(concurrency)
+        self.lock = threading.Lock()
+        self.pending = {}  # 任务编号 -> (id, 模型条目, 开始时间, 耗时统计)
+        self.completed = 0
+        self.failed = 0
+        self.total = 0
+        self.all_done = threading.Event()
+        self.all_done.set()
+        self.attachments = {}  # 路径 -> 内容，多条提示词引用同一文件时只读取一次
+        self.engine = StreamEngine(self.handle_event)
+
+    def read_attachments(self, paths):
+        files = {}
+        for path in paths:
+            if path not in self.attachments:
+                self.attachments[path] = FileService.read_file(path)
+            files[os.path.basename(path)] = self.attachments[path]
+        return files
+
+    def run(self, jobs):
+        self.total = len(jobs)
+        self.output = open(self.output_path, 'a', encoding='utf-8')
+        try:
+            for slot, (item_id, model, prompt, system_prompt, files) in enumerate(jobs):
+                try:
+                    message = PayloadBuilder.compose_user_message(prompt, self.read_attachments(files))
+                except Exception as e:
+                    with self.lock:
+                        self.write_result(item_id, model, time.time(), None, error=str(e))
+                    continue
+
+                self.slots.acquire()
+                with self.lock:
+                    self.all_done.clear()
+                    self.pending[slot] = (item_id, model, time.time(), None)
+                self.engine.submit(slot, StreamRequest(
+                    conversation_history=[],
+                    user_message=message,
+                    api_url=model['url'],
+                    model_name=model['model'],
+                    api_key=model.get('key', ''),
+                    prompt=system_prompt,
+                    policy=RequestPolicy.from_model(model, self.models)
+                ))
+            # 定时醒来以便响应 Ctrl+C
+            while not self.all_done.wait(0.5):
+                pass
+        finally:
+            # 中断时被取消的任务不写入结果，下次运行时重新执行
+            self.engine.shutdown()
+            self.output.close()
+
+    def handle_event(self, slot, request_id, event, data):
+        """在引擎线程中调用"""
+        with self.lock:
+            entry = self.pending.get(slot)
+            if entry is None:
+                return
+            if event == "metrics":
+                self.pending[slot] = entry[:3] + (data,)
+                return
+            if event not in ("finished", "error", "cancelled"):
+                return
+            del self.pending[slot]
+            item_id, model, started, metrics = entry
+            if event == "finished":
+                self.write_result(item_id, model, started, metrics, reply=data)
+            elif event == "error":
+                self.write_result(item_id, model, started, metrics, error=data)
+            if not self.pending:
+                self.all_done.set()
+        self.slots.release()
+
+    def write_result(self, item_id, model, started, metrics, reply="", error=None):
+        """追加一条结果并立即写入磁盘，调用方需持有锁"""
+        record = {
+            "id": item_id,
+            "model": model['name'],
+            "reply": reply,
+            "error": error,
+            "started_at": started,
+            "ttft": metrics.ttft if metrics else None,
+            "total_time": metrics.total_time if metrics else None,
+            "tokens": metrics.tokens if metrics else None,
+            "tokens_per_sec": metrics.tokens_per_sec if metrics else None,
+            "cached": metrics.cached if metrics else False
+        }
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+        self.completed += 1
+        if error:
+            self.failed += 1
+        status = f"失败: {error}" if error else "完成"
+        print(f"[{self.completed}/{self.total}] {item_id} · {model['name']} {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批量模式")
+    parser.add_argument("input", help="提示词 JSONL 文件")
+    parser.add_argument("-o", "--output", help="结果 JSONL 文件，默认为 <输入文件名>.results.jsonl")
+    parser.add_argument("--models", help="逗号分隔的模型名称，默认使用全部模型")
+    parser.add_argument("--template", help="未指定模板的提示词使用的默认模板")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的请求数")
+    parser.add_argument("--restart", action="store_true", help="忽略已有结果，从头开始")
+    args = parser.parse_args()
+
+    models = ConfigManager.get_models()
+    if args.models:
+        names = [name.strip() for name in args.models.split(",")]
+        unknown = [name for name in names if name not in {model['name'] for model in models}]
+        if unknown:
+            parser.error(f"未找到模型: {', '.join(unknown)}")
+        models = [model for model in models if model['name'] in names]
+    if not models:
+        parser.error("没有可用的模型，请检查 configFiles/config.json")
+
+    templates = {t['name']: t['prompt'] for t in ConfigManager.get_templates().get('templates', [])}
+    if args.template and args.template not in templates:
+        parser.error(f"未找到提示词模板: {args.template}")
+
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    if args.restart and os.path.exists(output_path):
+        os.remove(output_path)
+
+    jobs = load_jobs(args.input, models, templates)
+    if args.template:
+        jobs = [(i, m, p, s or templates[args.template], f) for i, m, p, s, f in jobs]
+    finished = load_finished(output_path)
+    remaining = [job for job in jobs if (job[0], job[1]['name']) not in finished]
+    print(f"共 {len(jobs)} 个任务，已完成 {len(jobs) - len(remaining)} 个，本次执行 {len(remaining)} 个")
+    if not remaining:
+        return
+
+    ProxyUtils.get_proxy_settings()
+    runner = BatchRunner(models, output_path, max(1, args.concurrency))
+    try:
+        runner.run(remaining)
+    except KeyboardInterrupt:
+        print("已中断，再次运行同一命令可继续")
+        sys.exit(130)
+    print(f"完成 {runner.completed - runner.failed} 个，失败 {runner.failed} 个，结果已写入 {output_path}")
+    sys.exit(1 if runner.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,14 @@ class ConfigManager:
         config = Settings.load_config()
         return config.get('models', [])
 
+    @staticmethod
+    def get_setting(name, default=None):
+        """读取 config.json 中的顶层设置项"""
+        try:
+            return Settings.load_config().get(name, default)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
     @staticmethod
     def get_templates():
         try:
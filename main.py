@@ -1,6 +1,8 @@
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtGui import QFont
 from UI.main_window import MultiChatWindow
+from utils.proxy_utils import ProxyUtils
+import multiprocessing
 import sys
 
 
@@ -9,10 +11,15 @@ def main():
     font = QFont("阿里巴巴普惠体 R", 10)
     app.setFont(font)
 
+    # 启动时解析一次代理设置，之后的请求直接使用缓存
+    ProxyUtils.get_proxy_settings()
+
     window = MultiChatWindow()
     window.show()
     sys.exit(app.exec())
 
 
 if __name__ == "__main__":
+    # 打包后的程序中 PDF 提取的子进程需要
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
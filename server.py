@@ -0,0 +1,278 @@
+"""
+本地 HTTP 服务模式：不加载界面，通过 SSE 同时向多个模型提问
+
+接口:
+    GET  /v1/models              config.json 中的模型名称
+    POST /v1/fanout              发送消息，返回按模型标记的 SSE 流
+    DELETE /v1/sessions/<id>     清除会话历史
+    GET  /health
+
+POST /v1/fanout 的请求体:
+    {"message": "问题", "models": ["模型名称"], "files": {"文件名": "内容"},
+     "template": "提示词模板名称", "system": "系统提示词", "session": "会话标识",
+     "history": [...], "independent": false}
+只有 message 是必填项；models 默认为全部模型。指定 session 时服务端按模型保存对话历史，
+与界面中每个面板的历史相同；否则使用请求中的 history（所有模型共用）
+
+SSE 事件（data 均为 JSON，带 model 字段）:
+    start / delta / status / metrics / done / error / cancelled / end
+
+用法:
+    python server.py --host 127.0.0.1 --port 8800
+请求体超过 --max-body-mb（默认 64）时直接返回 413
+"""
+import argparse
+import asyncio
+import itertools
+import json
+
+from config import ConfigManager
+from services.payload_builder import PayloadBuilder
+from services.request_policy import RequestPolicy
+from services.stream_engine import StreamEngine, StreamRequest
+from utils.proxy_utils import ProxyUtils
+
+
+class FanoutServer:
+    """
+    所有客户端共用一个事件循环和一个流式引擎
+    每个 (会话, 模型) 相当于界面中的一个面板，同一会话重复提问时取消上一次未完成的回复
+    """
+
+    def __init__(self, host="127.0.0.1", port=8800, max_body_mb=64):
+        self.host = host
+        self.port = port
+        self.max_body_bytes = max_body_mb * 1024 * 1024  # 请求体上限，超出时不读取直接拒绝
+        self.models = ConfigManager.get_models()
+        self.templates = {t['name']: t['prompt'] for t in ConfigManager.get_templates().get('templates', [])}
+        self.engine = None
+        self.sessions = {}  # 会话标识 -> {模型名称: 对话历史}
+        self._slots = itertools.count(1)
+        self._session_slots = {}  # (会话, 模型名称) -> 引擎中的编号
+        self._streams = {}  # (编号, 请求编号) -> _Stream
+        self._active = {}  # 编号 -> 正在进行的 _Stream
+
+    async def serve_forever(self):
+        loop = asyncio.get_running_loop()
+        self.engine = StreamEngine(self._on_event, loop=loop)
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"服务已启动: http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.engine.aclose()
+
+    def _on_event(self, slot, request_id, event, data):
+        """引擎事件，在同一事件循环中调用"""
+        stream = self._streams.get((slot, request_id))
+        if stream is None:
+            return
+        if event == "delta":
+            stream.parts.append(data)
+        elif event in ("finished", "cancelled", "error"):
+            del self._streams[(slot, request_id)]
+            if self._active.get(slot) is stream:
+                del self._active[slot]
+        stream.queue.put_nowait((stream, event, data))
+
+    def _record_partial(self, stream):
+        """与界面停止面板相同：把已收到的部分回复写入历史"""
+        if stream.parts and not stream.detached:
+            stream.history.append({"role": "assistant", "content": "".join(stream.parts)})
+        stream.detached = True
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > self.max_body_bytes:
+                await self._send_error(writer, 413, f"请求体不能超过 {self.max_body_bytes // (1024 * 1024)}MB")
+                return
+            body = await reader.readexactly(length) if length else b""
+            path = path.split("?", 1)[0].rstrip("/")
+
+            if method == "GET" and path == "/health":
+                await self._send_json(writer, 200, {"status": "ok"})
+            elif method == "GET" and path == "/v1/models":
+                await self._send_json(writer, 200, {"data": [{"id": m['name'], "model": m['model']}
+                                                              for m in self.models]})
+            elif method == "DELETE" and path.startswith("/v1/sessions/"):
+                self.sessions.pop(path[len("/v1/sessions/"):], None)
+                await self._send_json(writer, 200, {"status": "ok"})
+            elif method == "POST" and path == "/v1/fanout":
+                try:
+                    request = json.loads(body or b"{}")
+                except json.JSONDecodeError as e:
+                    await self._send_error(writer, 400, f"请求体不是有效的 JSON: {e}")
+                    return
+                await self._handle_fanout(reader, writer, request)
+            else:
+                await self._send_error(writer, 404, f"未知路径 {path}")
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except Exception as e:
+            print(f"处理请求失败: {e}")
+        finally:
+            writer.close()
+
+    async def _handle_fanout(self, reader, writer, request):
+        message = request.get("message") or ""
+        files = request.get("files") or {}
+        if not message and not files:
+            await self._send_error(writer, 400, "message 不能为空")
+            return
+
+        names = list(dict.fromkeys(request.get("models") or [m['name'] for m in self.models]))
+        by_name = {m['name']: m for m in self.models}
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            await self._send_error(writer, 400, f"未找到模型: {', '.join(unknown)}")
+            return
+
+        prompt = request.get("system") or ""
+        if request.get("template"):
+            if request["template"] not in self.templates:
+                await self._send_error(writer, 400, f"未找到提示词模板: {request['template']}")
+                return
+            prompt = self.templates[request["template"]]
+
+        session_id = request.get("session")
+        histories = self.sessions.setdefault(session_id, {}) if session_id else None
+        # 附件压缩写入磁盘较慢，放到线程中，避免阻塞其他连接的流
+        api_message = await asyncio.get_running_loop().run_in_executor(
+            None, PayloadBuilder.compose_user_message, message, files, True)
+
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\n"
+                     b"cache-control: no-cache\r\nconnection: close\r\n\r\n")
+        await self._send_event(writer, "start", {"models": names, "session": session_id})
+
+        queue = asyncio.Queue()
+        pending = set()
+        for name in names:
+            model = by_name[name]
+            if histories is not None:
+                history = histories.setdefault(name, [])
+                slot = self._session_slots.get((session_id, name))
+                if slot is None:
+                    slot = self._session_slots[(session_id, name)] = next(self._slots)
+                previous = self._active.get(slot)
+                if previous is not None:
+                    # 同一会话上一次的回复尚未完成，先记录部分回复，提交时引擎会取消它
+                    self._record_partial(previous)
+            else:
+                history = list(request.get("history") or [])
+                slot = next(self._slots)
+
+            # 与界面相同：历史中不包含当前消息，提交后再记录
+            request_id = self.engine.submit(slot, StreamRequest(
+                conversation_history=history.copy(),
+                user_message=api_message,
+                api_url=model['url'],
+                model_name=model['model'],
+                api_key=model.get('key', ''),
+                prompt=prompt,
+                share=not request.get("independent", False),
+                policy=RequestPolicy.from_model(model, self.models)
+            ))
+            history.append({"role": "user", "content": api_message})
+            stream = _Stream(slot, name, queue, history)
+            self._streams[(slot, request_id)] = stream
+            self._active[slot] = stream
+            pending.add(stream)
+
+        # 客户端断开时取消尚未完成的回复
+        disconnected = asyncio.ensure_future(reader.read())
+        try:
+            while pending:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    break
+                stream, event, data = getter.result()
+                name = stream.name
+                if event == "delta":
+                    await self._send_event(writer, "delta", {"model": name, "text": data})
+                elif event == "status":
+                    await self._send_event(writer, "status", {"model": name, "text": data})
+                elif event == "metrics":
+                    await self._send_event(writer, "metrics", {
+                        "model": name, "ttft": data.ttft, "total_time": data.total_time,
+                        "tokens": data.tokens, "tokens_per_sec": data.tokens_per_sec, "cached": data.cached
+                    })
+                elif event == "error":
+                    pending.discard(stream)
+                    await self._send_event(writer, "error", {"model": name, "error": data})
+                elif event == "finished":
+                    pending.discard(stream)
+                    if data and not stream.detached:
+                        stream.history.append({"role": "assistant", "content": data})
+                    await self._send_event(writer, "done", {"model": name, "reply": data})
+                elif event == "cancelled":
+                    pending.discard(stream)
+                    self._record_partial(stream)
+                    await self._send_event(writer, "cancelled", {"model": name, "reply": data})
+            else:
+                await self._send_event(writer, "end", {})
+        except ConnectionError:
+            pass
+        finally:
+            disconnected.cancel()
+            for stream in pending:
+                self._record_partial(stream)
+                if self._active.get(stream.slot) is stream:
+                    self.engine.cancel(stream.slot)
+
+    @staticmethod
+    async def _send_event(writer, event, data):
+        writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    @staticmethod
+    async def _send_json(writer, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        writer.write((f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                      f"content-type: application/json\r\ncontent-length: {len(body)}\r\n"
+                      f"connection: close\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _send_error(self, writer, status, message):
+        await self._send_json(writer, status, {"error": {"message": message}})
+
+
+class _Stream:
+    """一个模型的一次回复"""
+
+    def __init__(self, slot, name, queue, history):
+        self.slot = slot
+        self.name = name
+        self.queue = queue
+        self.history = history
+        self.parts = []
+        self.detached = False  # 已写入部分回复，之后的结果不再记入历史
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地多模型 SSE 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--max-body-mb", type=int, default=64, help="请求体大小上限（MB）")
+    args = parser.parse_args()
+
+    ProxyUtils.get_proxy_settings()
+    try:
+        asyncio.run(FanoutServer(args.host, args.port, args.max_body_mb).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,40 @@
+import importlib
+
 from .api_service import APIService
 from .history_service import HistoryService
-from .stream_worker import StreamWorker
+from .history_journal import HistoryJournal
+from .history_store import HistoryStore
+from .attachment_store import AttachmentStore
 from .file_service import FileService
+from .pdf_service import PdfService
+from .mapped_text_file import MappedTextFile
+from .folder_scanner import FolderScanner, FolderScan
+from .file_ingestor import FileIngestor
+from .client_pool import ClientPool
+from .stream_engine import StreamEngine, StreamRequest
+from .cancel_token import CancelToken
+from .response_cache import ResponseCache
+from .request_policy import RequestPolicy, LatencyTracker
+from .metrics_service import MetricsService, StreamMetrics
+from .payload_builder import PayloadBuilder, PayloadStats
+from .request_scheduler import RequestScheduler
+
+__all__ = ['APIService', 'HistoryService', 'HistoryJournal', 'HistoryStore', 'AttachmentStore',
+           'StreamWorker', 'FileService', 'PdfService', 'FileIngestor', 'FolderScanner', 'FolderScan', 'MappedTextFile', 'ClientPool',
+           'StreamEngine', 'StreamRequest', 'StreamBridge', 'DeltaBuffer',
+           'CancelToken', 'ResponseCache', 'RequestPolicy', 'LatencyTracker',
+           'MetricsService', 'StreamMetrics', 'PayloadBuilder', 'PayloadStats',
+           'RequestScheduler']
+
+# 依赖 PyQt6 的类在首次使用时才导入，无界面模式（batch.py / server.py）不会加载 Qt
+_qt_exports = {
+    'StreamWorker': '.stream_worker',
+    'StreamBridge': '.stream_bridge',
+    'DeltaBuffer': '.delta_buffer'
+}
+
 
-__all__ = ['APIService', 'HistoryService', 'StreamWorker', 'FileService']
+def __getattr__(name):
+    if name in _qt_exports:
+        return getattr(importlib.import_module(_qt_exports[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
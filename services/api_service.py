@@ -1,10 +1,9 @@
-import os
-import httpx
-from openai import OpenAI
+import asyncio
+import hashlib
+import json
 from utils.proxy_utils import ProxyUtils
-
-os.environ["http_proxy"] = "http://localhost:3467"
-os.environ["https_proxy"] = "http://localhost:3467"
+from .client_pool import ClientPool
+from .payload_builder import PayloadBuilder
 
 
 class APIService:
@@ -23,39 +22,121 @@ class APIService:
         except Exception as e:
             return f"Error processing response: {str(e)}"
 
+    @staticmethod
+    def get_proxy(api_url):
+        """访问端点使用的代理地址，直连时返回 None（代理设置启动后只解析一次）"""
+        return ProxyUtils.get_proxy(api_url)
+
+    @staticmethod
+    def build_messages(conversation_history, user_message, prompt):
+        """组装系统提示词、对话历史和当前消息，不做裁剪"""
+        messages = []
+        if prompt:
+            messages.append({"role": "system", "content": prompt})
+        messages.extend(conversation_history)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    @staticmethod
+    def prepare_payload(conversation_history, user_message, model_name, prompt):
+        """
+        构造完整的请求体，消息按模型的上下文预算裁剪
+
+        Returns:
+            tuple: (请求体, PayloadStats)
+        """
+        messages, stats = PayloadBuilder.build(conversation_history, user_message, model_name, prompt)
+        print(f"{model_name}: 发送 {stats.sent_tokens} tokens，裁剪 {stats.trimmed_tokens} tokens"
+              f"（丢弃 {stats.dropped_messages} 条历史消息，省略 {stats.stripped_attachments} 条消息的附件，"
+              f"{stats.retrieved_attachments} 个附件只发送相关部分"
+              f"{'，当前消息已截断' if stats.truncated else ''}）")
+        payload = {
+            "model": model_name,
+            "messages": messages,
+            "stream": True
+        }
+        return payload, stats
+
+    @staticmethod
+    def build_payload(conversation_history, user_message, model_name, prompt):
+        """构造完整的请求体"""
+        return APIService.prepare_payload(conversation_history, user_message, model_name, prompt)[0]
+
+    @staticmethod
+    def request_key(conversation_history, user_message, api_url, model_name, prompt):
+        """
+        计算请求的内容哈希，端点、模型、提示词和消息完全相同的请求得到相同的键
+        API密钥不参与计算；按裁剪前的消息计算，不需要计数 token
+        """
+        payload = {
+            "model": model_name,
+            "messages": APIService.build_messages(conversation_history, user_message, prompt),
+            "url": api_url
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
     @staticmethod
     def send_request(conversation_history, user_message, api_url, model_name, api_key, prompt):
-        proxy_settings = ProxyUtils.get_win11_proxy_settings()
-
-        proxies = {}
-        if proxy_settings and proxy_settings["enabled"] and proxy_settings["server"]:
-            proxies = {
-                "http://": f"http://{proxy_settings['server']}",
-                "https://": f"https://{proxy_settings['server']}",
-            }
-        client = OpenAI(
-            api_key=api_key,
-            base_url=api_url,
-            # http_client=httpx.Client(proxies=proxies if proxies else None)
-        )
+        # 复用同一端点的客户端，避免每条消息重新握手
+        client = ClientPool.get_client(api_url, api_key, APIService.get_proxy(api_url))
 
         try:
-            messages = []
-            if prompt:
-                messages.append({"role": "system", "content": prompt})
-            messages.extend(conversation_history)
-            messages.append({"role": "user", "content": user_message})
-
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                stream=True
-            )
+            payload = APIService.build_payload(conversation_history, user_message, model_name, prompt)
+            response = client.chat.completions.create(**payload)
             return response
         except Exception as e:
             print(f"API request error: {str(e)}")
             return f"Error: {str(e)}"
 
+    @staticmethod
+    async def send_request_async(conversation_history, user_message, api_url, model_name, api_key, prompt):
+        """
+        异步发送流式请求，需在流式引擎的事件循环中调用
+        出错时直接抛出异常，由调用方处理
+        """
+        # 计数 token 可能较慢（大文件），放到线程中避免阻塞事件循环
+        payload = await asyncio.get_running_loop().run_in_executor(
+            None, APIService.build_payload, conversation_history, user_message, model_name, prompt)
+        return await APIService.send_payload_async(payload, api_url, api_key)
+
+    @staticmethod
+    async def send_payload_async(payload, api_url, api_key):
+        """
+        异步发送已构造好的请求体
+        返回的流关闭时把客户端归还给 ClientPool，调用方必须关闭它
+        """
+        proxy = APIService.get_proxy(api_url)
+        client = ClientPool.get_async_client(api_url, api_key, proxy)
+        try:
+            stream = await client.chat.completions.create(**payload)
+        except BaseException:
+            ClientPool.release_async_client(api_url, api_key, proxy)
+            raise
+        return _PooledStream(stream, lambda: ClientPool.release_async_client(api_url, api_key, proxy))
+
+
+class _PooledStream:
+    """异步流的包装，关闭时归还客户端，进行中的流所在的客户端不会被空闲回收"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __aiter__(self):
+        return self._stream.__aiter__()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
 
 if __name__ == "__main__":
     conversation_history = ''
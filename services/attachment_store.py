@@ -0,0 +1,116 @@
+# chat_app/services/attachment_store.py
+
+import gzip
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# 历史消息中代替附件全文的引用
+ATTACHMENT_REF = re.compile(r"\[\[attachment:([0-9a-f]{64})\]\]")
+
+
+class AttachmentStore:
+    """
+    按内容寻址的附件存储
+    文件内容按 SHA-256 保存为 attachments/<hash>.gz，相同内容只写一次；
+    对话历史中只保存 [[attachment:<hash>]] 引用，组装请求时才展开
+    最近读取的内容缓存在内存中，多个面板同时发送同一附件只解压一次
+    """
+    directory = './configFiles/attachments'
+    cache_chars = 32 * 1024 * 1024  # 内存缓存的最大字符数
+
+    _cache = OrderedDict()  # hash -> 内容
+    _stored = set()  # 已确认写入磁盘的 hash，再次保存时不用访问磁盘
+    _cached_size = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def path_for(cls, digest):
+        return os.path.join(cls.directory, f"{digest}.gz")
+
+    @classmethod
+    def put(cls, content):
+        """
+        保存附件内容
+
+        Returns:
+            str: 内容的 SHA-256
+        """
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in cls._stored:
+            path = cls.path_for(digest)
+            if not os.path.exists(path):
+                os.makedirs(cls.directory, exist_ok=True)
+                temp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=6))
+                os.replace(temp_path, path)
+            cls._stored.add(digest)
+        cls._remember(digest, content)
+        return digest
+
+    @classmethod
+    def get(cls, digest):
+        """读取附件内容，不存在时返回 None"""
+        with cls._lock:
+            content = cls._cache.get(digest)
+            if content is not None:
+                cls._cache.move_to_end(digest)
+                return content
+        try:
+            with open(cls.path_for(digest), 'rb') as f:
+                content = gzip.decompress(f.read()).decode('utf-8')
+        except (OSError, EOFError) as e:
+            print(f"读取附件 {digest[:12]} 失败: {e}")
+            return None
+        cls._remember(digest, content)
+        return content
+
+    @classmethod
+    def reference(cls, content):
+        """保存内容并返回写入历史的引用"""
+        return f"[[attachment:{cls.put(content)}]]"
+
+    @classmethod
+    def expand(cls, text):
+        """把文本中的附件引用替换为全文，没有引用时原样返回"""
+        if not isinstance(text, str) or "[[attachment:" not in text:
+            return text
+
+        def replace(match):
+            content = cls.get(match.group(1))
+            return content if content is not None else "[附件内容已丢失]"
+
+        return ATTACHMENT_REF.sub(replace, text)
+
+    @classmethod
+    def clear(cls):
+        """删除全部附件"""
+        with cls._lock:
+            cls._cache.clear()
+            cls._cached_size = 0
+        cls._stored.clear()
+        if not os.path.isdir(cls.directory):
+            return
+        for name in os.listdir(cls.directory):
+            try:
+                os.remove(os.path.join(cls.directory, name))
+            except OSError as e:
+                print(f"删除附件 {name} 失败: {e}")
+
+    @classmethod
+    def _remember(cls, digest, content):
+        if len(content) > cls.cache_chars:
+            return
+        with cls._lock:
+            if digest in cls._cache:
+                cls._cache.move_to_end(digest)
+                return
+            cls._cache[digest] = content
+            cls._cached_size += len(content)
+            while cls._cached_size > cls.cache_chars:
+                _, evicted = cls._cache.popitem(last=False)
+                cls._cached_size -= len(evicted)
@@ -0,0 +1,44 @@
+# chat_app/services/cancel_token.py
+
+import threading
+
+
+class CancelToken:
+    """
+    协作式取消标记
+    工作线程在处理片段之间检查 cancelled，取消时依次调用注册的回调（如关闭响应流）
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """请求取消，可在任意线程调用"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run(callback)
+
+    def on_cancel(self, callback):
+        """注册取消回调，已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run(callback)
+
+    @staticmethod
+    def _run(callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"取消回调执行失败: {e}")
@@ -0,0 +1,193 @@
+# chat_app/services/client_pool.py
+
+import asyncio
+import threading
+import time
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+
+class ClientPool:
+    """
+    长连接客户端池
+    按 (base_url, api_key, proxy) 复用 OpenAI 客户端及其 httpx 连接池，
+    让多个面板、多轮对话共享 keep-alive 连接，空闲过久的客户端会被回收
+    异步客户端按流计数，流关闭后才算空闲，回收时在流式引擎的事件循环中关闭
+    """
+    idle_timeout = 600  # 客户端空闲回收时间（秒）
+    max_connections = 32  # 每个客户端的最大连接数
+    max_keepalive_connections = 16  # 每个客户端保持的空闲连接数
+
+    _clients = {}
+    _async_clients = {}
+    _closing = set()  # 正在关闭的异步客户端任务，保留引用直到完成
+    _lock = threading.Lock()
+    _stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    @classmethod
+    def get_client(cls, base_url, api_key, proxy=None):
+        """
+        获取（或创建）与端点对应的客户端
+
+        Args:
+            base_url (str): API 端点URL
+            api_key (str): API密钥
+            proxy (str): 代理地址，None 表示直连
+
+        Returns:
+            OpenAI: 可复用的客户端
+        """
+        key = (base_url, api_key, proxy)
+        now = time.monotonic()
+        with cls._lock:
+            cls._evict_idle_locked(now)
+            entry = cls._clients.get(key)
+            if entry is not None:
+                entry["last_used"] = now
+                cls._stats["reused"] += 1
+                return entry["client"]
+
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=cls._create_http_client(proxy)
+            )
+            cls._clients[key] = {"client": client, "last_used": now}
+            cls._stats["created"] += 1
+            return client
+
+    @classmethod
+    def get_async_client(cls, base_url, api_key, proxy=None):
+        """
+        获取（或创建）异步客户端
+        异步客户端绑定在创建它的事件循环上，只能在流式引擎的循环线程中调用
+
+        Args:
+            base_url (str): API 端点URL
+            api_key (str): API密钥
+            proxy (str): 代理地址，None 表示直连
+
+        Returns:
+            AsyncOpenAI: 可复用的异步客户端
+        """
+        key = (base_url, api_key, proxy)
+        now = time.monotonic()
+        with cls._lock:
+            cls._evict_idle_async_locked(now)
+            entry = cls._async_clients.get(key)
+            if entry is not None:
+                entry["last_used"] = now
+                entry["active"] += 1
+                cls._stats["reused"] += 1
+                return entry["client"]
+
+            # 重试由 RequestPolicy 负责，客户端自身不再重试
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(proxy=proxy, trust_env=False, limits=cls._limits())
+            )
+            cls._async_clients[key] = {"client": client, "last_used": now, "active": 1}
+            cls._stats["created"] += 1
+            return client
+
+    @classmethod
+    def release_async_client(cls, base_url, api_key, proxy=None):
+        """流关闭后归还 get_async_client 取得的客户端，从此刻开始计算空闲时间"""
+        with cls._lock:
+            entry = cls._async_clients.get((base_url, api_key, proxy))
+            if entry is not None:
+                entry["active"] = max(0, entry["active"] - 1)
+                entry["last_used"] = time.monotonic()
+
+    @classmethod
+    def _evict_idle_async_locked(cls, now):
+        """回收没有进行中的流且空闲超时的异步客户端，调用方需持有锁并处于流式引擎的事件循环中"""
+        expired = [key for key, entry in cls._async_clients.items()
+                   if not entry["active"] and now - entry["last_used"] > cls.idle_timeout]
+        for key in expired:
+            entry = cls._async_clients.pop(key)
+            task = asyncio.get_running_loop().create_task(cls._aclose_client(entry["client"]))
+            cls._closing.add(task)
+            task.add_done_callback(cls._closing.discard)
+            cls._stats["evicted"] += 1
+
+    @staticmethod
+    async def _aclose_client(client):
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"关闭异步客户端失败: {e}")
+
+    @classmethod
+    async def aclose_async_clients(cls):
+        """关闭所有异步客户端，需在流式引擎的循环线程中等待"""
+        with cls._lock:
+            entries = list(cls._async_clients.values())
+            cls._async_clients.clear()
+            closing = list(cls._closing)
+        for entry in entries:
+            await cls._aclose_client(entry["client"])
+        await asyncio.gather(*closing, return_exceptions=True)
+
+    @classmethod
+    def _create_http_client(cls, proxy):
+        """
+        创建带连接池限制的 httpx 客户端
+        代理由 ProxyUtils 统一解析，不再读取环境变量
+        """
+        return DefaultHttpxClient(proxy=proxy, trust_env=False, limits=cls._limits())
+
+    @classmethod
+    def _limits(cls):
+        return httpx.Limits(
+            max_connections=cls.max_connections,
+            max_keepalive_connections=cls.max_keepalive_connections,
+            keepalive_expiry=cls.idle_timeout
+        )
+
+    @classmethod
+    def _evict_idle_locked(cls, now):
+        """回收空闲超时的客户端，调用方需持有锁"""
+        expired = [key for key, entry in cls._clients.items()
+                   if now - entry["last_used"] > cls.idle_timeout]
+        for key in expired:
+            entry = cls._clients.pop(key)
+            cls._close_client(entry["client"])
+            cls._stats["evicted"] += 1
+
+    @classmethod
+    def evict_idle(cls):
+        """主动回收空闲客户端"""
+        with cls._lock:
+            cls._evict_idle_locked(time.monotonic())
+
+    @classmethod
+    def shutdown(cls):
+        """关闭所有客户端，释放底层连接"""
+        with cls._lock:
+            for entry in cls._clients.values():
+                cls._close_client(entry["client"])
+            cls._clients.clear()
+
+    @staticmethod
+    def _close_client(client):
+        try:
+            client.close()
+        except Exception as e:
+            print(f"关闭客户端失败: {e}")
+
+    @classmethod
+    def get_stats(cls):
+        """
+        获取连接复用统计
+
+        Returns:
+            dict: created 新建数, reused 复用数, evicted 回收数, active 当前客户端数
+        """
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats["active"] = len(cls._clients) + len(cls._async_clients)
+            return stats
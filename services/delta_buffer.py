@@ -0,0 +1,49 @@
+# chat_app/services/delta_buffer.py
+
+import threading
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+
+class DeltaBuffer(QObject):
+    """
+    流式消息片段的合并缓冲区
+    工作线程随时写入片段，界面线程按固定帧率统一取出，
+    每个请求每帧只触发一次界面更新
+    """
+    # 信号定义: (模型索引, 请求编号, 合并后的文本)
+    flushed = pyqtSignal(int, int, str)
+
+    def __init__(self, flush_hz=60, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._pending = {}  # (model_index, request_id) -> [片段]
+        self.timer = QTimer(self)
+        self.timer.setInterval(max(1, int(1000 / flush_hz)))
+        self.timer.timeout.connect(self.flush_all)
+
+    def push(self, model_index, request_id, text):
+        """写入片段，可在任意线程调用"""
+        with self._lock:
+            self._pending.setdefault((model_index, request_id), []).append(text)
+
+    def take(self, model_index, request_id):
+        """立即取出指定请求尚未刷新的文本"""
+        with self._lock:
+            parts = self._pending.pop((model_index, request_id), None)
+        return "".join(parts) if parts else ""
+
+    def flush_all(self):
+        """取出全部缓冲并逐个请求发出 flushed 信号"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for (model_index, request_id), parts in pending.items():
+            self.flushed.emit(model_index, request_id, "".join(parts))
+
+    def start(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.flush_all()
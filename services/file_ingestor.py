@@ -0,0 +1,120 @@
+# chat_app/services/file_ingestor.py
+
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .attachment_store import AttachmentStore
+from .file_service import FileService
+from .folder_scanner import FolderScanner
+from .mapped_text_file import MappedTextFile
+from .pdf_service import PdfService
+
+
+class FileIngestor:
+    """
+    在后台读取上传的文件，有界线程池并发读取、解码并写入 AttachmentStore，界面线程不做任何文件 I/O
+    结果通过 listener(job_id, file_path, event, data) 回调，在工作线程中调用：
+        progress  (已完成, 总数, 单位)，PDF 按页、目录按文件
+        pages     PDF 页数超过 pdf_range_prompt_pages 且未指定页码，需要选择页码后重新提交
+        finished  文件内容
+        error     错误信息
+    超过 max_size_mb 的文本文件以内存映射方式打开，不读入全文：内容为开头和结尾的预览加上原文件引用，
+    发送时由 PayloadBuilder 按问题从原文件中检索相关部分
+    目录由 FolderScanner 扫描，内容为文件清单加上各文件的文本
+    """
+    max_size_mb = 10
+    large_file_max_mb = 2048  # 大文件模式的上限
+    preview_bytes = 32 * 1024  # 大文件预览的开头和结尾各取的字节数
+    pdf_range_prompt_pages = 20  # PDF 超过该页数时先询问读取的页码范围
+
+    def __init__(self, listener, max_workers=4):
+        self.listener = listener
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="FileIngestor")
+        self._ids = itertools.count(1)
+        self._cancelled = set()
+        self._futures = {}  # job_id -> Future，完成后移除
+        self._lock = threading.Lock()
+
+    def submit(self, file_path, pages=None, ask_pages=True):
+        """
+        提交文件，返回任务编号
+
+        Args:
+            pages (list): PDF 中要读取的页码（从 0 开始），None 表示全部
+            ask_pages (bool): 页数较多的 PDF 未指定页码时是否先返回 pages 事件
+        """
+        job_id = next(self._ids)
+        future = self.executor.submit(self._run, job_id, file_path, pages, ask_pages)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+        return job_id
+
+    def cancel(self, job_id):
+        """未开始的任务不再读取，进行中任务的结果被丢弃"""
+        with self._lock:
+            self._cancelled.add(job_id)
+
+    def shutdown(self):
+        # 先取消排队中的任务再关闭，shutdown 的 cancel_futures 参数需要 Python 3.9
+        with self._lock:
+            futures = list(self._futures.values())
+        for future in futures:
+            future.cancel()
+        self.executor.shutdown(wait=False)
+
+    def _emit(self, job_id, file_path, event, data):
+        with self._lock:
+            if job_id in self._cancelled:
+                if event in ("finished", "error", "pages"):
+                    self._cancelled.discard(job_id)
+                return
+        self.listener(job_id, file_path, event, data)
+
+    def _run(self, job_id, file_path, pages, ask_pages):
+        with self._lock:
+            if job_id in self._cancelled:
+                self._cancelled.discard(job_id)
+                return
+        try:
+            if os.path.isdir(file_path):
+                scan = FolderScanner().scan(
+                    file_path, progress=lambda done, total: self._emit(job_id, file_path, "progress", (done, total, "个文件")))
+                content = scan.to_text()
+                print(f"目录 {file_path}: {len(scan.files)} 个文件，耗时 {scan.elapsed:.2f} 秒")
+                AttachmentStore.put(content)
+                self._emit(job_id, file_path, "finished", content)
+                return
+            is_pdf = file_path.lower().endswith('.pdf')
+            if not FileService.is_file_size_valid(file_path, self.max_size_mb):
+                if is_pdf:
+                    raise Exception(f"PDF 文件大小不能超过{self.max_size_mb}MB")
+                if not FileService.is_file_size_valid(file_path, self.large_file_max_mb):
+                    raise Exception(f"文件大小不能超过{self.large_file_max_mb}MB")
+                content = self.read_large_file(file_path)
+                AttachmentStore.put(content)
+                self._emit(job_id, file_path, "finished", content)
+                return
+            if is_pdf and pages is None and ask_pages:
+                page_count = PdfService.page_count(file_path)
+                if page_count > self.pdf_range_prompt_pages:
+                    self._emit(job_id, file_path, "pages", page_count)
+                    return
+            content = FileService.read_file(
+                file_path, pages, progress=lambda done, total: self._emit(job_id, file_path, "progress", (done, total, "页")))
+            # 提前写入附件存储，发送时界面线程只需计算哈希
+            AttachmentStore.put(content)
+        except Exception as e:
+            self._emit(job_id, file_path, "error", str(e))
+            return
+        self._emit(job_id, file_path, "finished", content)
+
+    def read_large_file(self, file_path):
+        """大文件的预览：文件信息、原文件引用，加上开头和结尾"""
+        with MappedTextFile(file_path) as mapped:
+            return (f"[大文件：{mapped.size / (1024 * 1024):.1f} MB，{mapped.count_lines()} 行，"
+                    f"编码 {mapped.encoding}。发送时按问题从全文中检索相关部分，没有问题时只发送以下开头和结尾]\n"
+                    f"{MappedTextFile.reference(file_path)}\n"
+                    f"{mapped.preview(self.preview_bytes, self.preview_bytes)}")
@@ -1,82 +1,104 @@
 # chat_app/services/file_service.py
 
+import codecs
 import os
-from PyQt6.QtWidgets import QFileDialog
-import fitz  # PyMuPDF for PDF files
 import chardet  # 用于检测文件编码
 
+from .pdf_service import PdfService
+
+
+# 带 BOM 的编码，UTF-32 的 BOM 以 UTF-16 LE 的 BOM 开头，需要先判断
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
 
 class FileService:
+    detect_sample_size = 64 * 1024  # 编码检测只看文件开头的这部分
+
     @staticmethod
     def read_text_file(file_path):
-        """读取文本文件内容，使用多重编码尝试"""
-        encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'ascii']
+        """读取文本文件内容，只读取一次，编码检测和解码都在内存中完成"""
+        with open(file_path, 'rb') as file:
+            raw_data = file.read()
+        return FileService.decode_text(raw_data)
+
+    @staticmethod
+    def decode_text(raw_data):
+        """
+        把文件内容解码为文本
+        依次尝试：BOM → UTF-8 → 对开头部分检测到的编码 → 常见中文编码
+        """
+        for bom, encoding in BOMS:
+            if raw_data.startswith(bom):
+                return raw_data.decode(encoding)
 
-        # 首先尝试用 chardet 检测
+        # 绝大多数文件是 UTF-8（包括 ASCII），直接解码最快
         try:
-            with open(file_path, 'rb') as file:
-                raw_data = file.read()
-            detected = chardet.detect(raw_data)
-            if detected['encoding']:
-                encodings.insert(0, detected['encoding'])
-        except:
+            return raw_data.decode('utf-8')
+        except UnicodeDecodeError:
             pass
 
-        # 尝试不同的编码
+        encodings = ['gbk', 'gb2312', 'utf-16']
+        detected = chardet.detect(raw_data[:FileService.detect_sample_size])
+        if detected['encoding'] and detected['encoding'].lower() not in ('ascii', 'utf-8'):
+            encodings.insert(0, detected['encoding'])
+
         for encoding in encodings:
             try:
-                with open(file_path, 'r', encoding=encoding) as file:
-                    return file.read()
-            except UnicodeDecodeError:
-                continue
-            except Exception as e:
+                return raw_data.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
                 continue
 
         # 如果所有编码都失败，则抛出异常
         raise Exception("无法以任何支持的编码方式读取该文件，请确保文件编码正确")
 
     @staticmethod
-    def read_file(file_path):
-        """读取文件内容"""
+    def detect_encoding(sample):
+        """
+        根据文件开头的一部分推断编码，用于不整体读取的大文件
+        sample 可能截断在多字节字符中间，UTF-8 用增量解码器判断
+        """
+        for bom, encoding in BOMS:
+            if sample.startswith(bom):
+                return encoding
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+        detected = chardet.detect(sample)['encoding']
+        try:
+            return codecs.lookup(detected).name if detected else 'gbk'
+        except LookupError:
+            return 'gbk'
+
+    @staticmethod
+    def read_file(file_path, pages=None, progress=None):
+        """
+        读取文件内容
+        pages 和 progress 只用于 PDF：提取的页码（从 0 开始）和进度回调 progress(已完成页数, 总页数)
+        """
         try:
             if file_path.lower().endswith('.pdf'):
-                return FileService._read_pdf(file_path)
+                return FileService._read_pdf(file_path, pages, progress)
             else:
                 return FileService.read_text_file(file_path)
         except Exception as e:
             raise Exception(f"Error reading file: {str(e)}")
 
     @staticmethod
-    def _read_pdf(file_path):
+    def _read_pdf(file_path, pages=None, progress=None):
         """读取PDF文件内容"""
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            return PdfService.extract(file_path, pages, progress)
         except Exception as e:
             raise Exception(f"Error reading PDF: {str(e)}")
 
-    @staticmethod
-    def _read_text_file(file_path):
-        """读取文本文件内容，自动检测编码"""
-        try:
-            # 首先读取文件的二进制内容
-            with open(file_path, 'rb') as file:
-                raw_data = file.read()
-
-            # 检测文件编码
-            result = chardet.detect(raw_data)
-            encoding = result['encoding']
-
-            # 使用检测到的编码读取文件
-            with open(file_path, 'r', encoding=encoding) as file:
-                return file.read()
-        except Exception as e:
-            raise Exception(f"Error reading text file: {str(e)}")
-
     @staticmethod
     def get_file_size(file_path):
         """获取文件大小（以MB为单位）"""
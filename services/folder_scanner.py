@@ -0,0 +1,309 @@
+# chat_app/services/folder_scanner.py
+
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+
+from config import ConfigManager
+from .file_service import FileService
+
+# 按扩展名直接判断为二进制的文件，不用读取
+BINARY_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.svgz', '.psd',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst', '.jar', '.war',
+    '.exe', '.dll', '.so', '.dylib', '.a', '.lib', '.o', '.obj', '.class', '.pyc', '.pyd', '.wasm',
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    '.mp3', '.mp4', '.avi', '.mov', '.mkv', '.wav', '.flac', '.ogg',
+    '.ttf', '.otf', '.woff', '.woff2', '.eot', '.db', '.sqlite', '.bin', '.dat', '.npy', '.pt', '.onnx'
+}
+SNIFF_BYTES = 8192  # 前这么多字节中有 NUL 即视为二进制
+
+SKIP_REASONS = {
+    "ignored": "被忽略",
+    "binary": "二进制",
+    "too_large": "过大",
+    "extension": "扩展名不符",
+    "undecodable": "无法解码",
+    "error": "读取失败",
+}
+
+
+def compile_gitignore(lines):
+    """
+    把 .gitignore 的规则转换为正则
+
+    Returns:
+        list: [(正则, 是否为 ! 规则, 是否只匹配目录)]
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip("\r")
+        if not line.strip() or line.startswith("#"):
+            continue
+        line = line.rstrip() if not line.endswith("\\ ") else line
+        negate = line.startswith("!")
+        if negate or line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # 中间或开头有 / 的规则相对于 .gitignore 所在目录，否则匹配任意层级
+        anchored = "/" in line
+        line = line.lstrip("/")
+
+        regex = ""
+        i = 0
+        while i < len(line):
+            if line.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+            elif line.startswith("/**", i) and i + 3 == len(line):
+                regex += "/.*"
+                i += 3
+            elif line.startswith("**", i):
+                regex += ".*"
+                i += 2
+            elif line[i] == "*":
+                regex += "[^/]*"
+                i += 1
+            elif line[i] == "?":
+                regex += "[^/]"
+                i += 1
+            elif line[i] == "[":
+                end = line.find("]", i + 1)
+                if end == -1:
+                    regex += re.escape(line[i])
+                    i += 1
+                else:
+                    body = line[i + 1:end]
+                    if body.startswith("!"):
+                        body = "^" + body[1:]
+                    regex += f"[{body}]"
+                    i = end + 1
+            else:
+                regex += re.escape(line[i])
+                i += 1
+        prefix = "^" if anchored else "^(?:.*/)?"
+        rules.append((re.compile(prefix + regex + "$"), negate, dir_only))
+    return rules
+
+
+def is_ignored(chain, rel_path, is_dir):
+    """
+    按各级 .gitignore 判断路径是否被忽略，后面（更深）的规则优先
+
+    Args:
+        chain (list): [(规则所在目录的相对路径, 规则)]，从根目录到当前目录
+        rel_path (str): 相对于扫描根目录的路径，以 / 分隔
+    """
+    ignored = False
+    for base, rules in chain:
+        path = rel_path[len(base) + 1:] if base else rel_path
+        for regex, negate, dir_only in rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(path):
+                ignored = not negate
+    return ignored
+
+
+@dataclass
+class FolderScan:
+    """一次目录扫描的结果"""
+    root: str
+    files: list = field(default_factory=list)  # [(相对路径, 字节数)]，不含被跳过的文件
+    contents: dict = field(default_factory=dict)  # 相对路径 -> 文本，按路径排序
+    skipped: Counter = field(default_factory=Counter)  # 原因 -> 文件数
+    omitted: int = 0  # 超出总大小限制、只列出未包含内容的文件数
+    elapsed: float = 0.0
+
+    def manifest(self):
+        """精简的文件清单：每个目录一行"""
+        total_size = sum(size for _, size in self.files)
+        lines = [f"目录 {os.path.basename(os.path.abspath(self.root))}：共 {len(self.files)} 个文件"
+                 f"（{total_size / 1024:.0f} KB），包含 {len(self.contents)} 个文件的内容"]
+        if self.omitted:
+            lines[0] += f"，{self.omitted} 个文件超出大小限制只列出文件名"
+        skipped = [f"{SKIP_REASONS[reason]} {count} 个" for reason, count in self.skipped.items() if count]
+        if skipped:
+            lines.append(f"已跳过：{'，'.join(skipped)}")
+
+        by_dir = {}
+        for rel_path, _ in self.files:
+            directory, _, name = rel_path.rpartition("/")
+            by_dir.setdefault(directory, []).append(name)
+        for directory in sorted(by_dir):
+            names = by_dir[directory]
+            lines.append(f"{directory or '.'}/ ({len(names)}): {', '.join(names)}")
+        return "\n".join(lines)
+
+    def to_text(self):
+        """清单加上各文件内容，每个文件以 "=== 路径 ===" 开头，便于检索时按文件切分"""
+        parts = [self.manifest()]
+        for rel_path, text in self.contents.items():
+            parts.append(f"=== {rel_path} ===\n{text}")
+        return "\n\n".join(parts)
+
+
+class FolderScanner:
+    """
+    上传整个目录
+    多线程并行遍历子目录，遵循各级 .gitignore，按大小和扩展名过滤，
+    用前几 KB 中是否有 NUL 快速判断二进制文件，再并发读取和解码
+    config.json 中的 folder_upload 可调整:
+        "folder_upload": {"max_file_kb": 512, "max_total_mb": 20, "extensions": [".py", ".md"],
+                          "exclude": ["*.min.js"], "workers": 16}
+    """
+    defaults = {
+        "max_file_kb": 512,  # 单个文件的大小上限
+        "max_total_mb": 20,  # 包含内容的文件总大小上限，超出的文件只列在清单中
+        "extensions": [],  # 只包含这些扩展名，为空时不限制
+        "exclude": [],  # 额外的忽略规则，写法与 .gitignore 相同
+        "workers": 16
+    }
+    # 始终跳过的目录
+    skip_dirs = {'.git', '.hg', '.svn', '__pycache__', 'node_modules', '.venv', 'venv', '.idea', '.vs'}
+
+    def __init__(self, config=None):
+        self.config = dict(self.defaults)
+        self.config.update(config if config is not None else (ConfigManager.get_setting("folder_upload", {}) or {}))
+        self.extensions = {ext.lower() if ext.startswith(".") else f".{ext.lower()}"
+                           for ext in self.config["extensions"]}
+        self.max_file_bytes = self.config["max_file_kb"] * 1024
+
+    def scan(self, root, progress=None):
+        """
+        扫描并读取目录
+
+        Args:
+            progress (callable): progress(已读取文件数, 待读取文件数)，在调用线程中调用
+
+        Returns:
+            FolderScan
+        """
+        started = time.perf_counter()
+        result = FolderScan(root)
+        with ThreadPoolExecutor(max_workers=self.config["workers"], thread_name_prefix="FolderScanner") as pool:
+            candidates = self._walk(pool, root, result.skipped)
+            candidates.sort()
+
+            # 按路径顺序选出总大小不超过上限的文件，只读取这些文件
+            budget = self.config["max_total_mb"] * 1024 * 1024
+            selected = []
+            for rel_path, size in candidates:
+                if size <= budget:
+                    selected.append(rel_path)
+                    budget -= size
+            result.omitted = len(candidates) - len(selected)
+
+            texts = {}
+            if progress:
+                progress(0, len(selected))
+            futures = {pool.submit(self._read, os.path.join(root, rel_path)): rel_path for rel_path in selected}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    text, reason = future.result()
+                    if reason:
+                        result.skipped[reason] += 1
+                    else:
+                        texts[futures[future]] = text
+                if progress:
+                    progress(len(selected) - len(pending), len(selected))
+
+        skipped_paths = set(selected) - set(texts)
+        result.files = [(rel_path, size) for rel_path, size in candidates if rel_path not in skipped_paths]
+        result.contents = {rel_path: texts[rel_path] for rel_path in selected if rel_path in texts}
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def _walk(self, pool, root, skipped):
+        """并行遍历，每个目录一个任务，返回 [(相对路径, 字节数)]"""
+        exclude = compile_gitignore(self.config["exclude"])
+        chain = [("", exclude)] if exclude else []
+        files = []
+        pending = {pool.submit(self._scan_dir, root, "", chain)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_files, subdirs, dir_skipped = future.result()
+                files.extend(dir_files)
+                skipped.update(dir_skipped)
+                for rel_dir, dir_chain in subdirs:
+                    pending.add(pool.submit(self._scan_dir, root, rel_dir, dir_chain))
+        return files
+
+    def _scan_dir(self, root, rel_dir, chain):
+        path = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            with open(os.path.join(path, ".gitignore"), 'r', encoding='utf-8', errors='replace') as f:
+                rules = compile_gitignore(f)
+            if rules:
+                chain = chain + [(rel_dir, rules)]
+        except OSError:
+            pass
+
+        files, subdirs, skipped = [], [], Counter()
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            skipped["error"] += 1
+            return files, subdirs, skipped
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir():
+                    if entry.name in self.skip_dirs or is_ignored(chain, rel_path, True):
+                        skipped["ignored"] += 1
+                    else:
+                        subdirs.append((rel_path, chain))
+                    continue
+                if not entry.is_file():
+                    continue
+                if is_ignored(chain, rel_path, False):
+                    skipped["ignored"] += 1
+                    continue
+                extension = os.path.splitext(entry.name)[1].lower()
+                if extension in BINARY_EXTENSIONS:
+                    skipped["binary"] += 1
+                    continue
+                if self.extensions and extension not in self.extensions:
+                    skipped["extension"] += 1
+                    continue
+                size = entry.stat().st_size
+                if size > self.max_file_bytes:
+                    skipped["too_large"] += 1
+                    continue
+                files.append((rel_path, size))
+            except OSError:
+                skipped["error"] += 1
+        return files, subdirs, skipped
+
+    @staticmethod
+    def _read(path):
+        """
+        读取并解码文件，只打开一次
+
+        Returns:
+            tuple: (文本, 跳过原因)
+        """
+        try:
+            with open(path, 'rb') as f:
+                raw_data = f.read()
+        except OSError:
+            return None, "error"
+        if b"\0" in raw_data[:SNIFF_BYTES]:
+            # UTF-16/32 文本带 BOM，其中的 NUL 不代表二进制
+            if not raw_data.startswith((b"\xff\xfe", b"\xfe\xff")):
+                return None, "binary"
+        try:
+            return FileService.decode_text(raw_data), None
+        except Exception:
+            return None, "undecodable"
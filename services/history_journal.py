@@ -0,0 +1,467 @@
+# chat_app/services/history_journal.py
+
+import gzip
+import io
+import json
+import os
+import queue
+import threading
+import time
+
+from config import ConfigManager
+from .history_store import HistoryStore
+
+try:
+    import zstandard  # 可选依赖，快照使用 zstd 压缩时需要
+except ImportError:
+    zstandard = None
+
+
+class HistoryJournal:
+    """
+    追加式对话历史日志
+    每条消息写一行到 history.journal.jsonl，由后台线程批量写入并 fsync；
+    日志超过快照大小的一定比例后在后台压缩：重放为完整历史，原子替换快照，再清空日志
+    记录带递增序号，快照保存已合并的最大序号，压缩中途崩溃也不会重复重放
+    同一批记录随后写入 HistoryStore（SQLite），用于多会话浏览和全文搜索
+
+    快照为逐行 JSON：第一行是 {"version": 2, "seq": ...}，之后每个面板一行，可以逐个面板解析；
+    按 config.json 中的 history_compression（"gzip" / "zstd" / "none"，默认 gzip）压缩，
+    旧版本的 history.json 会在启动后的第一次压缩时迁移为新格式
+    """
+    legacy_snapshot_path = './configFiles/history.json'
+    snapshot_path = './configFiles/history.snapshot.jsonl'  # 压缩时加上 .gz / .zst 后缀
+    snapshot_suffixes = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+    journal_path = './configFiles/history.journal.jsonl'
+    batch_window = 0.2  # 收集同一批记录的最长时间（秒），每批只 fsync 一次
+    compact_min_bytes = 1024 * 1024  # 日志至少达到该大小才压缩
+    compact_ratio = 0.5  # 日志超过快照大小的该比例时压缩
+
+    _STOP = object()
+
+    def __init__(self, use_store=True, compression=None):
+        self.use_store = use_store
+        if compression is None:
+            compression = ConfigManager.get_setting("history_compression", "gzip")
+        if compression == "zstd" and zstandard is None:
+            print("未安装 zstandard，历史快照改用 gzip 压缩")
+            compression = "gzip"
+        if compression not in self.snapshot_suffixes:
+            print(f"未知的历史压缩方式 {compression}，改用 gzip")
+            compression = "gzip"
+        self.snapshot_file = self.snapshot_path + self.snapshot_suffixes[compression]
+        self._migrate = False
+        self._queue = queue.Queue()
+        self._seq = None  # 最后一条记录的序号，只在写入线程中分配，历史加载完成前为 None
+        self._journal = None
+        self._thread = None
+
+    # ---------- 读取 ----------
+
+    @classmethod
+    def exists(cls):
+        """是否有可恢复的历史：快照加上日志重放后至少有一条消息（需读取全部历史，不要在界面线程调用）"""
+        if cls.find_snapshot() is None and not os.path.exists(cls.journal_path):
+            return False
+        _, histories = cls.load_histories()
+        return any(histories)
+
+    @classmethod
+    def snapshot_files(cls):
+        """所有可能的快照文件，新格式在前"""
+        return [cls.snapshot_path + suffix for suffix in cls.snapshot_suffixes.values()] + [cls.legacy_snapshot_path]
+
+    @classmethod
+    def find_snapshot(cls):
+        """当前使用的快照：新格式中最近写入的一个，没有时为旧版本的 history.json"""
+        existing = [path for path in cls.snapshot_files()[:-1] if os.path.exists(path)]
+        if existing:
+            return max(existing, key=os.path.getmtime)
+        if os.path.exists(cls.legacy_snapshot_path):
+            return cls.legacy_snapshot_path
+        return None
+
+    @staticmethod
+    def open_snapshot(path):
+        """按后缀以文本方式打开快照用于读取"""
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise OSError("读取 zstd 压缩的快照需要安装 zstandard")
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+            return io.TextIOWrapper(stream, encoding='utf-8')
+        if path.endswith(".gz"):
+            return gzip.open(path, 'rt', encoding='utf-8')
+        return open(path, 'r', encoding='utf-8')
+
+    @classmethod
+    def iter_snapshot(cls):
+        """
+        逐个面板读取快照
+        先返回已合并的最大序号，之后依次返回各面板的对话历史
+        """
+        path = cls.find_snapshot()
+        if path is None:
+            yield 0
+            return
+        if path == cls.legacy_snapshot_path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                yield 0
+                return
+            if isinstance(data, list):
+                # 更早的版本直接保存历史列表
+                yield 0
+                yield from data
+            else:
+                yield data.get("seq", 0)
+                yield from data.get("histories", [])
+            return
+
+        try:
+            f = cls.open_snapshot(path)
+        except OSError as e:
+            print(f"读取历史快照失败: {e}")
+            yield 0
+            return
+        with f:
+            try:
+                header = json.loads(f.readline() or "{}")
+            except json.JSONDecodeError:
+                header = {}
+            yield header.get("seq", 0)
+            for line in f:
+                yield json.loads(line)
+
+    @classmethod
+    def read_snapshot(cls):
+        """
+        读取快照
+
+        Returns:
+            tuple: (已合并的最大序号, 各面板的对话历史)
+        """
+        stream = cls.iter_snapshot()
+        seq = next(stream)
+        return seq, list(stream)
+
+    @classmethod
+    def read_journal(cls, after_seq=0):
+        """按顺序读取序号大于 after_seq 的日志记录，跳过崩溃时写了一半的行"""
+        records = []
+        try:
+            with open(cls.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record.get("seq", 0) > after_seq:
+                        records.append(record)
+        except FileNotFoundError:
+            pass
+        return records
+
+    @staticmethod
+    def apply(histories, record):
+        """把一条日志记录应用到历史上"""
+        op = record["op"]
+        if op == "append":
+            panel = record["panel"]
+            while len(histories) <= panel:
+                histories.append([])
+            histories[panel].append(record["message"])
+        elif op == "drop_panel":
+            if record["panel"] < len(histories):
+                del histories[record["panel"]]
+        elif op in ("clear", "purge"):
+            histories.clear()
+        elif op == "replace":
+            histories[:] = record["histories"]
+
+    @classmethod
+    def load_histories(cls):
+        """快照加上日志重放后的完整历史，以及最后一条记录的序号"""
+        seq, histories = cls.read_snapshot()
+        for record in cls.read_journal(seq):
+            cls.apply(histories, record)
+            seq = record["seq"]
+        return seq, histories
+
+    @classmethod
+    def last_seq(cls):
+        """最后一条记录的序号，只读取快照的第一行和日志"""
+        seq = next(cls.iter_snapshot())
+        records = cls.read_journal(seq)
+        return records[-1]["seq"] if records else seq
+
+    # ---------- 写入 ----------
+
+    def load(self):
+        """加载历史并启动后台写入线程，新记录的序号接在已有记录之后"""
+        return [messages for _, messages in self.load_panels()]
+
+    def load_panels(self):
+        """
+        逐个面板加载历史，返回 (面板序号, 对话历史)，界面可以每读完一个面板就显示
+        日志中只有追加记录时（通常如此）按面板合并到快照上；
+        有其他记录时先读完整个快照再重放。全部返回后启动后台写入线程
+        """
+        stream = self.iter_snapshot()
+        seq = next(stream)
+        records = self.read_journal(seq)
+        last_seq = records[-1]["seq"] if records else seq
+        # 加载过程中界面可能已经写入记录（如 drop_panel / replace），这些记录先留在队列中，
+        # 写入线程启动后接在已有记录之后分配序号
+
+        histories = []
+        if all(record["op"] == "append" for record in records):
+            appends = {}
+            for record in records:
+                appends.setdefault(record["panel"], []).append(record["message"])
+            for index, messages in enumerate(stream):
+                messages.extend(appends.pop(index, []))
+                histories.append(messages)
+                yield index, messages
+            # 快照之后新增面板中的消息
+            while appends:
+                index = len(histories)
+                histories.append(appends.pop(index, []))
+                yield index, histories[index]
+        else:
+            histories = list(stream)
+            for record in records:
+                self.apply(histories, record)
+            yield from enumerate(histories)
+        # 界面会继续修改返回的历史，写入线程同步数据库时使用副本
+        self._start((last_seq, [list(messages) for messages in histories]))
+
+    def start(self, on_loaded=None):
+        """
+        启动后台写入线程，快照解压、日志重放和数据库同步都在该线程中进行，不阻塞调用线程
+        加载完成后在写入线程中调用 on_loaded(各面板的对话历史)；之前提交的记录接在已有记录之后写入
+        """
+        self._start(None, on_loaded)
+
+    def _start(self, loaded, on_loaded=None):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(loaded, on_loaded), name="HistoryJournal", daemon=True)
+        self._thread.start()
+
+    def _prepare(self, loaded, on_loaded):
+        """写入线程启动后先加载历史（未加载时）、通知调用方并同步数据库"""
+        if loaded is None:
+            try:
+                loaded = self.load_histories()
+            except Exception as e:
+                print(f"加载历史记录失败: {e}")
+                loaded = (self.last_seq(), [])
+        seq, histories = loaded
+        self._seq = seq
+        # 快照不是当前配置的格式（包括旧版本的 history.json）时先压缩一次完成迁移
+        self._migrate = self.find_snapshot() not in (None, self.snapshot_file)
+        if on_loaded is not None:
+            try:
+                # 交给调用方的是副本，之后界面对历史的修改不影响同步数据库
+                on_loaded([list(messages) for messages in histories])
+            except Exception as e:
+                print(f"通知历史加载完成失败: {e}")
+        if self.use_store:
+            try:
+                self._sync_store(seq, histories)
+            except Exception as e:
+                print(f"同步历史数据库失败: {e}")
+
+    def _sync_store(self, seq, histories):
+        """启动时把数据库追上日志：首次使用时导入已有历史，否则补上崩溃前未写入的记录"""
+        _, applied = HistoryStore.journal_state()
+        if HistoryStore.is_empty():
+            if any(histories):
+                # 导入的会话就是当前对话，之后追加的消息继续写入它
+                HistoryStore.set_current_session(HistoryStore.save_session(histories))
+            HistoryStore.reset_journal_seq(seq)
+        elif applied > seq:
+            # 日志文件被删除后序号从头开始
+            HistoryStore.reset_journal_seq(seq)
+        else:
+            HistoryStore.apply_journal(self.read_journal(applied))
+
+    def append(self, panel, message, model=""):
+        record = {"op": "append", "panel": panel, "message": message}
+        if model:
+            record["model"] = model
+        self._write(record)
+
+    def drop_panel(self, panel):
+        self._write({"op": "drop_panel", "panel": panel})
+
+    def clear(self):
+        """开始新的对话，之前的会话仍保留在数据库中"""
+        self._write({"op": "clear"})
+
+    def purge(self):
+        """清除全部历史，包括数据库中的所有会话"""
+        self._write({"op": "purge"})
+
+    def replace(self, histories, session_id=None):
+        """
+        整体替换历史（写入一条记录，下次压缩时合并）
+        指定 session_id 时之后的消息写入数据库中的该会话
+        """
+        record = {"op": "replace", "histories": histories}
+        if session_id is not None:
+            record["session"] = session_id
+        self._write(record)
+
+    def flush(self, timeout=5):
+        """等待已提交的记录写入磁盘"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        """写完剩余记录后停止后台线程；线程尚未启动（如面板仍在加载）时直接写入日志"""
+        if self._thread is None:
+            self._write_pending()
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _write_pending(self):
+        """在调用线程中写入队列中的记录，数据库在下次启动时从日志补上"""
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        lines = [item for item in items if isinstance(item, str)]
+        if lines:
+            if self._seq is None:
+                self._seq = self.last_seq()
+            self._append_lines([self._number(line) for line in lines])
+        for item in items:
+            if isinstance(item, threading.Event):
+                item.set()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write(self, record):
+        # 在调用线程中序列化，之后对历史列表的修改不会影响已提交的记录
+        self._queue.put(json.dumps(record, ensure_ascii=False))
+
+    def _number(self, line):
+        """给序列化好的记录加上序号，序号在写入时分配，历史仍在加载时提交的记录也接在已有记录之后"""
+        self._seq += 1
+        return f'{{"seq": {self._seq}, {line[1:]}'
+
+    def _run(self, loaded, on_loaded):
+        self._prepare(loaded, on_loaded)
+        if self._migrate:
+            self.compact()
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            # 在时间窗口内继续收集记录，遇到 flush / close 时立即写入
+            deadline = time.monotonic() + self.batch_window
+            while isinstance(items[-1], str):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            lines = [self._number(item) for item in items if isinstance(item, str)]
+            if lines:
+                self._append_lines(lines)
+                stored = True
+                if self.use_store:
+                    try:
+                        HistoryStore.apply_journal([json.loads(line) for line in lines])
+                    except Exception as e:
+                        # 保留日志不压缩，下次启动时从日志补上
+                        print(f"写入历史数据库失败: {e}")
+                        stored = False
+                if stored:
+                    self._maybe_compact()
+            for item in items:
+                if item is self._STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    item.set()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _append_lines(self, lines):
+        try:
+            if self._journal is None:
+                os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write("\n".join(lines) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        except OSError as e:
+            print(f"写入历史日志失败: {e}")
+
+    def _maybe_compact(self):
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+            snapshot = self.find_snapshot()
+            snapshot_size = os.path.getsize(snapshot) if snapshot else 0
+        except OSError:
+            return
+        if journal_size >= self.compact_min_bytes and journal_size >= snapshot_size * self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """把日志合并进快照，只在后台线程（或线程未启动时）调用"""
+        seq, histories = self.load_histories()
+        try:
+            self.write_snapshot(seq, histories, self.snapshot_file)
+        except OSError as e:
+            print(f"压缩历史日志失败: {e}")
+            return
+        # 删除其他格式的快照，旧版本的 history.json 至此迁移完成
+        for path in self.snapshot_files():
+            if path != self.snapshot_file and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"删除旧的历史快照失败: {e}")
+        # 快照已包含全部记录，清空日志
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+
+    @classmethod
+    def write_snapshot(cls, seq, histories, path=None):
+        """写入临时文件并 fsync 后原子替换快照，path 的后缀决定压缩方式"""
+        path = path or cls.snapshot_path + cls.snapshot_suffixes["gzip"]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as raw:
+            # 压缩流关闭时写入结尾，但不关闭 raw，之后还要 fsync
+            if path.endswith(".zst"):
+                stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+            elif path.endswith(".gz"):
+                stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+            else:
+                stream = None
+            out = stream if stream is not None else raw
+            out.write(json.dumps({"version": 2, "seq": seq, "panels": len(histories)}).encode('utf-8') + b"\n")
+            for messages in histories:
+                out.write(json.dumps(messages, ensure_ascii=False).encode('utf-8') + b"\n")
+            if stream is not None:
+                stream.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_path, path)
@@ -1,20 +1,47 @@
 import json
 
+from .history_journal import HistoryJournal
+from .history_store import HistoryStore
+
+
 class HistoryService:
+    """HistoryStore 的简单封装，session_id 为 None 时操作最近的会话"""
+
+    @staticmethod
+    def save_history(conversation_histories, session_id=None, models=None):
+        """保存各面板的对话历史，返回会话编号"""
+        return HistoryStore.save_session(conversation_histories, session_id, models)
+
+    @staticmethod
+    def load_history(session_id=None):
+        return HistoryStore.load_session(session_id)
+
+    @staticmethod
+    def clear_history(session_id=None):
+        """删除指定会话，未指定时删除全部会话"""
+        if session_id is None:
+            HistoryStore.clear_all()
+        else:
+            HistoryStore.delete_session(session_id)
+
     @staticmethod
-    def save_history(conversation_histories):
-        with open('./configFiles/history.json', 'w') as f:
-            json.dump(conversation_histories, f)
+    def search_history(query, limit=100):
+        return HistoryStore.search(query, limit)
 
     @staticmethod
-    def load_history():
-        try:
-            with open('./configFiles/history.json', 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+    def export_history(path, session_id=None):
+        """把会话导出为快照文件，后缀为 .gz / .zst 时压缩"""
+        HistoryJournal.write_snapshot(0, HistoryStore.load_session(session_id), path)
 
     @staticmethod
-    def clear_history():
-        with open('./configFiles/history.json', 'w') as f:
-            json.dump([], f)
\ No newline at end of file
+    def import_history(path, models=None):
+        """导入 export_history 导出的快照（或旧版本的 history.json）为新会话，返回会话编号"""
+        if path.endswith(".json"):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            histories = data if isinstance(data, list) else data.get("histories", [])
+        else:
+            with HistoryJournal.open_snapshot(path) as f:
+                f.readline()
+                histories = [json.loads(line) for line in f]
+        return HistoryStore.save_session(histories, models=models)
@@ -0,0 +1,349 @@
+# chat_app/services/history_store.py
+
+import os
+import sqlite3
+import threading
+import time
+
+
+class HistoryStore:
+    """
+    基于 SQLite（WAL 模式）的多会话历史
+    表: sessions（会话）、panels（面板使用的模型）、messages（消息），messages_fts 为消息内容的 FTS5 索引
+    每个线程使用独立的连接，后台写入与界面线程的搜索互不阻塞
+    """
+    db_path = './configFiles/history.db'
+    title_length = 40  # 会话标题取第一条用户消息的前若干个字符
+
+    _local = threading.local()
+    _init_lock = threading.Lock()
+    _initialized = set()  # 已建表的数据库路径
+    _fts = None  # FTS5 索引的分词器，不可用时为 None，搜索退化为 LIKE
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL DEFAULT '',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS panels (
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            panel INTEGER NOT NULL,
+            model TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (session_id, panel)
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            panel INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            model TEXT NOT NULL DEFAULT '',
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS messages_session ON messages(session_id, panel, id);
+        CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated_at);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        );
+    """
+
+    # ---------- 连接 ----------
+
+    @classmethod
+    def connection(cls):
+        """当前线程的连接，首次使用时建表"""
+        conn = getattr(cls._local, "conn", None)
+        if conn is not None and getattr(cls._local, "path", None) == cls.db_path:
+            return conn
+        os.makedirs(os.path.dirname(cls.db_path), exist_ok=True)
+        conn = sqlite3.connect(cls.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        with cls._init_lock:
+            if cls.db_path not in cls._initialized:
+                cls._create_schema(conn)
+                cls._initialized.add(cls.db_path)
+        cls._local.conn = conn
+        cls._local.path = cls.db_path
+        return conn
+
+    @classmethod
+    def _create_schema(cls, conn):
+        conn.executescript(cls.SCHEMA)
+        # trigram 分词支持中文等无空格文本的子串搜索（SQLite 3.34+），不可用时退回默认分词
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                    f"content, content='messages', content_rowid='id', tokenize='{tokenizer}')"
+                )
+                conn.executescript("""
+                    CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                    END;
+                """)
+                row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+                cls._fts = "trigram" if "trigram" in row[0] else "unicode61"
+                break
+            except sqlite3.OperationalError as e:
+                print(f"FTS5 分词器 {tokenizer} 不可用: {e}")
+        conn.commit()
+
+    # ---------- 写入 ----------
+
+    @classmethod
+    def create_session(cls, title=""):
+        conn = cls.connection()
+        now = time.time()
+        with conn:
+            cursor = conn.execute("INSERT INTO sessions (title, created_at, updated_at) VALUES (?, ?, ?)",
+                                  (title, now, now))
+        return cursor.lastrowid
+
+    @classmethod
+    def add_messages(cls, session_id, messages):
+        """
+        在一个事务中追加多条消息
+
+        Args:
+            messages (list): [(面板序号, 消息 dict, 模型名称)]
+        """
+        conn = cls.connection()
+        with conn:
+            cls._insert_messages(conn, session_id, messages)
+
+    @classmethod
+    def _insert_messages(cls, conn, session_id, messages):
+        if not messages:
+            return
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO messages (session_id, panel, role, content, model, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(session_id, panel, message["role"], cls._text(message.get("content")), model or "", now)
+             for panel, message, model in messages]
+        )
+        conn.executemany(
+            "INSERT INTO panels (session_id, panel, model) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id, panel) DO UPDATE SET model = excluded.model",
+            {(session_id, panel, model) for panel, _, model in messages if model}
+        )
+        title_row = conn.execute("SELECT title FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        title = title_row["title"] if title_row else ""
+        if not title:
+            title = next((cls._text(m.get("content"))[:cls.title_length].strip()
+                          for _, m, _ in messages if m["role"] == "user"), "")
+        conn.execute("UPDATE sessions SET updated_at = ?, title = ? WHERE id = ?", (now, title, session_id))
+
+    @classmethod
+    def apply_journal(cls, records):
+        """
+        在一个事务中应用 HistoryJournal 的记录，由日志写入线程调用
+        当前会话和已应用的最大序号保存在 meta 表中，序号不大于它的记录会被跳过，
+        因此崩溃后可以安全地重放日志
+        """
+        conn = cls.connection()
+        with conn:
+            session_id = cls._get_meta(conn, "current_session")
+            applied = cls._get_meta(conn, "journal_seq") or 0
+            pending = []
+            for record in records:
+                if record["seq"] <= applied:
+                    continue
+                applied = record["seq"]
+                op = record["op"]
+                if op == "append":
+                    if session_id is None:
+                        now = time.time()
+                        session_id = conn.execute(
+                            "INSERT INTO sessions (title, created_at, updated_at) VALUES ('', ?, ?)", (now, now)
+                        ).lastrowid
+                    pending.append((record["panel"], record["message"], record.get("model", "")))
+                    continue
+                cls._insert_messages(conn, session_id, pending)
+                pending = []
+                if op == "clear":
+                    # 新对话写入新的会话，旧会话仍可搜索
+                    session_id = None
+                elif op == "purge":
+                    conn.execute("DELETE FROM messages")
+                    conn.execute("DELETE FROM panels")
+                    conn.execute("DELETE FROM sessions")
+                    session_id = None
+                elif op == "replace" and "session" in record:
+                    session_id = record["session"]
+            cls._insert_messages(conn, session_id, pending)
+            cls._set_meta(conn, "current_session", session_id)
+            cls._set_meta(conn, "journal_seq", applied)
+
+    @classmethod
+    def journal_state(cls):
+        """(当前会话编号, 已应用的日志序号)"""
+        conn = cls.connection()
+        return cls._get_meta(conn, "current_session"), cls._get_meta(conn, "journal_seq") or 0
+
+    @classmethod
+    def set_current_session(cls, session_id):
+        """之后日志中的消息写入该会话"""
+        conn = cls.connection()
+        with conn:
+            cls._set_meta(conn, "current_session", session_id)
+
+    @classmethod
+    def reset_journal_seq(cls, seq):
+        """日志文件被删除后序号会从头开始，需同步回退"""
+        conn = cls.connection()
+        with conn:
+            cls._set_meta(conn, "journal_seq", seq)
+
+    @staticmethod
+    def _get_meta(conn, key):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) "
+                     "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+    @classmethod
+    def save_session(cls, histories, session_id=None, models=None):
+        """
+        整体写入一个会话，已有会话的消息会被替换
+
+        Args:
+            histories (list): 各面板的对话历史
+            models (list): 各面板的模型名称
+
+        Returns:
+            int: 会话编号
+        """
+        if session_id is None:
+            session_id = cls.create_session()
+        else:
+            conn = cls.connection()
+            with conn:
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                conn.execute("UPDATE sessions SET title = '' WHERE id = ?", (session_id,))
+        models = models or []
+        cls.add_messages(session_id, [
+            (panel, message, models[panel] if panel < len(models) else "")
+            for panel, history in enumerate(histories) for message in history
+        ])
+        return session_id
+
+    @classmethod
+    def delete_session(cls, session_id):
+        conn = cls.connection()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    @classmethod
+    def clear_all(cls):
+        conn = cls.connection()
+        with conn:
+            conn.execute("DELETE FROM messages")
+            conn.execute("DELETE FROM panels")
+            conn.execute("DELETE FROM sessions")
+
+    # ---------- 读取 ----------
+
+    @classmethod
+    def latest_session(cls):
+        row = cls.connection().execute("SELECT id FROM sessions ORDER BY updated_at DESC, id DESC LIMIT 1").fetchone()
+        return row["id"] if row else None
+
+    @classmethod
+    def list_sessions(cls, limit=200):
+        rows = cls.connection().execute(
+            "SELECT s.id, s.title, s.created_at, s.updated_at, "
+            "(SELECT COUNT(*) FROM messages m WHERE m.session_id = s.id) AS message_count "
+            "FROM sessions s ORDER BY s.updated_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @classmethod
+    def load_session(cls, session_id=None):
+        """
+        读取会话的全部消息，session_id 为 None 时读取最近的会话
+
+        Returns:
+            list: 各面板的对话历史
+        """
+        if session_id is None:
+            session_id = cls.latest_session()
+            if session_id is None:
+                return []
+        histories = []
+        for row in cls.connection().execute(
+                "SELECT panel, role, content FROM messages WHERE session_id = ? ORDER BY id", (session_id,)):
+            while len(histories) <= row["panel"]:
+                histories.append([])
+            histories[row["panel"]].append({"role": row["role"], "content": row["content"]})
+        return histories
+
+    @classmethod
+    def session_models(cls, session_id):
+        """会话中各面板使用的模型名称"""
+        rows = cls.connection().execute("SELECT panel, model FROM panels WHERE session_id = ?", (session_id,))
+        return {row["panel"]: row["model"] for row in rows}
+
+    @classmethod
+    def search(cls, query, limit=100):
+        """
+        全文搜索消息内容
+
+        Returns:
+            list: [{message_id, session_id, title, panel, role, model, snippet, created_at}]，按时间倒序
+        """
+        query = query.strip()
+        if not query:
+            return []
+        conn = cls.connection()
+        columns = ("m.id AS message_id, m.session_id, s.title, m.panel, m.role, m.model, m.created_at")
+        terms = query.split()
+        # trigram 分词要求每个词至少 3 个字符，更短的词用 LIKE 匹配
+        if cls._fts and (cls._fts != "trigram" or all(len(term) >= 3 for term in terms)):
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            rows = conn.execute(
+                f"SELECT {columns}, snippet(messages_fts, 0, '[', ']', '…', 16) AS snippet "
+                "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN sessions s ON s.id = m.session_id "
+                "WHERE messages_fts MATCH ? ORDER BY m.id DESC LIMIT ?", (match, limit)
+            ).fetchall()
+        else:
+            where = " AND ".join("m.content LIKE ? ESCAPE '\\'" for _ in terms)
+            params = ["%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                      for term in terms]
+            rows = conn.execute(
+                f"SELECT {columns}, m.content AS content FROM messages m "
+                f"JOIN sessions s ON s.id = m.session_id WHERE {where} ORDER BY m.id DESC LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+            rows = [dict(row, snippet=cls._like_snippet(row["content"], terms[0])) for row in rows]
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _like_snippet(content, term, radius=40):
+        index = content.lower().find(term.lower())
+        start = max(0, index - radius)
+        end = index + len(term) + radius
+        return ("…" if start > 0 else "") + content[start:index] + f"[{content[index:index + len(term)]}]" \
+            + content[index + len(term):end] + ("…" if end < len(content) else "")
+
+    @staticmethod
+    def _text(content):
+        if isinstance(content, str):
+            return content
+        return "" if content is None else str(content)
+
+    @classmethod
+    def is_empty(cls):
+        return cls.connection().execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
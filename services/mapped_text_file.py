@@ -0,0 +1,155 @@
+# chat_app/services/mapped_text_file.py
+
+import codecs
+import mmap
+import os
+import re
+
+from .file_service import FileService, BOMS
+
+# 大文件附件中指向原文件的引用，发送时按问题从原文件中检索
+FILE_REF = re.compile(r"\[\[file:(.+?)\]\]\n?")
+
+
+class MappedTextFile:
+    """
+    以内存映射方式打开的大文本文件，不把全文读入内存
+    按块惰性解码：iter_chunks 供检索逐块处理，head / tail / preview 用于预览
+    编码只根据文件开头的一部分推断
+    """
+    chunk_bytes = 1024 * 1024  # 每块的大致字节数，块边界取在换行处
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        sample = self._map[:FileService.detect_sample_size]
+        self.encoding, self.data_start = self._resolve_encoding(FileService.detect_encoding(sample), sample)
+        self.unit = 4 if "32" in self.encoding else 2 if "16" in self.encoding else 1  # 每个字符的最小字节数
+        self.newline = "\n".encode(self.encoding)
+
+    @staticmethod
+    def _resolve_encoding(encoding, sample):
+        """
+        换成不依赖 BOM 的编码，从任意位置开始解码时字节序不变
+
+        Returns:
+            tuple: (编码, 正文起始字节)
+        """
+        explicit = {
+            codecs.BOM_UTF8: 'utf-8',
+            codecs.BOM_UTF32_LE: 'utf-32-le',
+            codecs.BOM_UTF32_BE: 'utf-32-be',
+            codecs.BOM_UTF16_LE: 'utf-16-le',
+            codecs.BOM_UTF16_BE: 'utf-16-be',
+        }
+        for bom, _ in BOMS:
+            if sample.startswith(bom):
+                return explicit[bom], len(bom)
+        if encoding in ('utf-16', 'utf-32'):
+            return f"{encoding}-le", 0
+        return encoding, 0
+
+    @staticmethod
+    def reference(file_path):
+        return f"[[file:{os.path.abspath(file_path)}]]"
+
+    @staticmethod
+    def strip_references(text):
+        """去掉文本中的原文件引用，只保留预览"""
+        if not isinstance(text, str) or "[[file:" not in text:
+            return text
+        return FILE_REF.sub("", text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _boundary(self, offset, limit):
+        """
+        offset 之后、limit 之前的第一个换行之后的位置，作为块的边界
+        范围内没有换行时退回到字符边界
+        """
+        if offset >= self.size:
+            return self.size
+        offset -= (offset - self.data_start) % self.unit
+        index = self._map.find(self.newline, offset, limit)
+        while index != -1 and (index - self.data_start) % self.unit:
+            index = self._map.find(self.newline, index + 1, limit)
+        if index != -1:
+            return index + len(self.newline)
+        if self.encoding == 'utf-8':
+            # 不从 UTF-8 多字节字符的中间切开
+            while offset > self.data_start and 0x80 <= self._map[offset] < 0xC0:
+                offset -= 1
+        return offset
+
+    def _decode(self, start, end):
+        return self._map[start:end].decode(self.encoding, errors='replace')
+
+    def iter_chunks(self, chunk_bytes=None):
+        """
+        逐块解码全文
+
+        Yields:
+            tuple: (块的起始字节, 文本)
+        """
+        chunk_bytes = chunk_bytes or self.chunk_bytes
+        start = self.data_start
+        while start < self.size:
+            end = self._boundary(start + chunk_bytes, start + chunk_bytes * 2)
+            if end <= start:
+                end = min(start + chunk_bytes, self.size)
+            yield start, self._decode(start, end)
+            start = end
+
+    def head(self, max_bytes):
+        """文件开头不超过 max_bytes 字节的文本，截断在换行处"""
+        end = self.data_start + max_bytes
+        if end >= self.size:
+            return self._decode(self.data_start, self.size)
+        boundary = self._map.rfind(self.newline, self.data_start, end)
+        end = boundary + len(self.newline) if boundary > self.data_start else self._boundary(end, end)
+        return self._decode(self.data_start, end)
+
+    def tail(self, max_bytes):
+        """文件结尾不超过 max_bytes 字节的文本，从完整的一行开始"""
+        start = self.size - max_bytes
+        if start <= self.data_start:
+            return self._decode(self.data_start, self.size)
+        return self._decode(self._boundary(start, self.size), self.size)
+
+    def count_lines(self, block_bytes=16 * 1024 * 1024):
+        """
+        统计行数
+        单字节换行的编码（UTF-8、GBK 等）逐块扫描字节，不解码；
+        UTF-16 / UTF-32 的换行字节可能跨字符出现，逐块解码后再数
+        """
+        if self.size <= self.data_start:
+            return 0
+        if self.unit > 1:
+            lines = sum(text.count("\n") for _, text in self.iter_chunks(block_bytes))
+        else:
+            lines = 0
+            for start in range(self.data_start, self.size, block_bytes):
+                lines += self._map[start:start + block_bytes].count(self.newline)
+        if self._map[self.size - len(self.newline):self.size] != self.newline:
+            lines += 1
+        return lines
+
+    def preview(self, head_bytes, tail_bytes):
+        """开头和结尾的文本，中间部分以说明代替"""
+        if self.size - self.data_start <= head_bytes + tail_bytes:
+            return self._decode(self.data_start, self.size)
+        head = self.head(head_bytes)
+        tail = self.tail(tail_bytes)
+        omitted = self.size - len(head.encode(self.encoding)) - len(tail.encode(self.encoding))
+        return f"{head}\n…（中间省略约 {omitted / (1024 * 1024):.1f} MB）…\n{tail}"
@@ -0,0 +1,169 @@
+# chat_app/services/metrics_service.py
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+
+@dataclass
+class StreamMetrics:
+    """单次流式回复的耗时统计，时间均为 time.monotonic() 读数"""
+    model: str = ""
+    endpoint: str = ""
+    request_start: float = 0.0
+    connected: Optional[float] = None  # 收到响应头
+    first_token: Optional[float] = None
+    last_token: Optional[float] = None
+    chunks: int = 0
+    tokens: int = 0
+    cached: bool = False  # 由响应缓存回放
+
+    @property
+    def ttft(self):
+        """首字延迟（秒）"""
+        if self.first_token is None:
+            return None
+        return self.first_token - self.request_start
+
+    @property
+    def total_time(self):
+        end = self.last_token if self.last_token is not None else self.connected
+        if end is None:
+            return None
+        return end - self.request_start
+
+    @property
+    def tokens_per_sec(self):
+        """首字之后的生成速度"""
+        if self.first_token is None or self.last_token is None or self.last_token <= self.first_token:
+            return None
+        return max(self.tokens - 1, 0) / (self.last_token - self.first_token)
+
+    def mark_token(self, now):
+        if self.first_token is None:
+            self.first_token = now
+        self.last_token = now
+        self.chunks += 1
+
+    def to_record(self):
+        """转换为写入日志的记录"""
+        record = asdict(self)
+        for name in ('connected', 'first_token', 'last_token'):
+            if record[name] is not None:
+                record[name] = round(record[name] - self.request_start, 4)
+        record['request_start'] = time.time()
+        record['ttft'] = self.ttft
+        record['total_time'] = self.total_time
+        record['tokens_per_sec'] = self.tokens_per_sec
+        return record
+
+    def summary(self):
+        """面板标题栏显示的简要统计"""
+        parts = []
+        if self.cached:
+            parts.append("缓存")
+        if self.ttft is not None:
+            parts.append(f"首字 {self.ttft:.2f}s")
+        if self.tokens_per_sec is not None:
+            parts.append(f"{self.tokens_per_sec:.1f} tok/s")
+        if self.total_time is not None:
+            parts.append(f"共 {self.total_time:.1f}s")
+        parts.append(f"{self.tokens} tokens")
+        return " · ".join(parts)
+
+
+class MetricsService:
+    """
+    流式耗时日志
+    每次回复追加一行到 configFiles/metrics.jsonl，并按模型维护最近样本的 p50/p95
+    """
+    log_path = './configFiles/metrics.jsonl'
+    window = 200  # 每个模型保留的样本数
+    preload_bytes = 1024 * 1024  # 启动时从日志末尾读取的字节数
+
+    _lock = threading.Lock()
+    _samples = None  # model -> deque(记录)
+
+    @classmethod
+    def _load_locked(cls):
+        if cls._samples is not None:
+            return
+        cls._samples = {}
+        try:
+            with open(cls.log_path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                offset = max(0, f.tell() - cls.preload_bytes)
+                f.seek(offset)
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        if offset > 0:
+            # 第一行可能不完整
+            lines = lines[1:]
+        for line in lines:
+            try:
+                cls._add_locked(json.loads(line))
+            except (ValueError, KeyError):
+                continue
+
+    @classmethod
+    def _add_locked(cls, record):
+        if record.get('cached'):
+            return
+        cls._samples.setdefault(record['model'], deque(maxlen=cls.window)).append(record)
+
+    @classmethod
+    def record(cls, metrics: StreamMetrics):
+        """记录一次回复，写入日志文件"""
+        record = metrics.to_record()
+        with cls._lock:
+            cls._load_locked()
+            cls._add_locked(record)
+            try:
+                os.makedirs(os.path.dirname(cls.log_path), exist_ok=True)
+                with open(cls.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"写入耗时日志失败: {e}")
+
+    @classmethod
+    def get_percentiles(cls, model):
+        """
+        获取模型最近样本的分位数
+
+        Returns:
+            dict: {字段: (p50, p95)}，字段为 ttft / tokens_per_sec / total_time，没有样本时为空
+        """
+        with cls._lock:
+            cls._load_locked()
+            records = list(cls._samples.get(model, ()))
+        result = {}
+        for name in ('ttft', 'tokens_per_sec', 'total_time'):
+            values = sorted(r[name] for r in records if r.get(name) is not None)
+            if values:
+                result[name] = (cls._percentile(values, 50), cls._percentile(values, 95))
+        result['count'] = len(records)
+        return result
+
+    @staticmethod
+    def _percentile(values, percentile):
+        index = min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))
+        return values[index]
+
+    @classmethod
+    def describe(cls, model):
+        """模型分位数的文字说明"""
+        stats = cls.get_percentiles(model)
+        if not stats.get('count'):
+            return f"{model}: 暂无数据"
+        lines = [f"{model}（最近 {stats['count']} 次）"]
+        labels = {'ttft': ("首字", "s"), 'tokens_per_sec': ("速度", " tok/s"), 'total_time': ("总耗时", "s")}
+        for name, (label, unit) in labels.items():
+            if name in stats:
+                p50, p95 = stats[name]
+                lines.append(f"{label} p50 {p50:.2f}{unit} / p95 {p95:.2f}{unit}")
+        return "\n".join(lines)
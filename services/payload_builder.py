@@ -0,0 +1,343 @@
+# chat_app/services/payload_builder.py
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from config import ConfigManager
+from services.attachment_store import AttachmentStore
+from services.mapped_text_file import MappedTextFile, FILE_REF
+from utils.token_utils import TokenUtils
+
+# 用户消息中附件内容的起始标记，之后每个文件以 "--- 文件名 ---" 开头
+ATTACHMENT_MARKER = "\n\n文件内容:\n"
+ATTACHMENT_NAME = re.compile(r"^--- (.+) ---$", re.MULTILINE)
+ATTACHMENT_BLOCK = re.compile(r"\n--- (.+) ---\n")
+
+
+@dataclass
+class PayloadStats:
+    """一次请求的 token 统计"""
+    sent_tokens: int = 0
+    trimmed_tokens: int = 0
+    dropped_messages: int = 0  # 丢弃的历史消息条数
+    stripped_attachments: int = 0  # 被省略附件的历史消息条数
+    retrieved_attachments: int = 0  # 只发送了相关部分的附件数
+    truncated: bool = False  # 当前消息是否被截断
+
+
+class PayloadBuilder:
+    """
+    组装请求消息：系统提示词 + 对话历史 + 当前消息，各只出现一次
+    按模型的上下文预算裁剪，config.json 中的 context_budget 可调整:
+        "context_budget": {"max_tokens": 32000, "reserve_tokens": 4000,
+                           "keep_attachments": 2, "models": {"gpt-4o": 128000}}
+    裁剪顺序：省略较早消息中的附件 → 当前消息的附件只保留与问题相关的部分 → 从最早的轮次开始丢弃 → 截断当前消息
+    检索由 TextProcessor 完成，config.json 中的 retrieval 可覆盖 ProcessorConfig 的默认值:
+        "retrieval": {"default_chunk_size": 2000, "min_similarity_score": 0.3, "max_chunks_to_combine": 5}
+    """
+    defaults = {
+        "max_tokens": 32000,  # 模型上下文长度
+        "reserve_tokens": 4000,  # 为回复预留的 token 数
+        "keep_attachments": 2,  # 保留附件全文的最近几条历史用户消息
+        "models": {}  # 按模型名称覆盖 max_tokens
+    }
+    message_overhead = 4  # 每条消息的格式开销
+
+    retrieval_cache_size = 16
+    chunk_index_cache_size = 4  # 保留切块结果的大文件数
+
+    _config = None
+    _retrieval_config = None
+    _retrievals = OrderedDict()  # (内容摘要, 问题, 预算, 模型) -> 检索结果
+    _chunk_indexes = OrderedDict()  # ("index", 路径, 大小, 修改时间, 模型) -> 大文件的切块结果（不含文本）
+    _retrieval_pending = {}  # 正在计算的 key -> Future，相同的请求等待同一个结果
+    _retrieval_lock = threading.Lock()  # 只保护上面两个字典，不在持锁时计算
+
+    @classmethod
+    def get_config(cls):
+        if cls._config is None:
+            config = dict(cls.defaults)
+            config.update(ConfigManager.get_setting("context_budget", {}) or {})
+            cls._config = config
+        return cls._config
+
+    @classmethod
+    def get_retrieval_config(cls):
+        if cls._retrieval_config is None:
+            from text_processor.config import ProcessorConfig
+            cls._retrieval_config = ProcessorConfig(**(ConfigManager.get_setting("retrieval", {}) or {}))
+        return cls._retrieval_config
+
+    @classmethod
+    def get_budget(cls, model_name):
+        """请求消息可用的 token 数"""
+        config = cls.get_config()
+        max_tokens = config["models"].get(model_name, config["max_tokens"])
+        return max(max_tokens - config["reserve_tokens"], 0)
+
+    @staticmethod
+    def compose_user_message(user_message, files, store=False):
+        """
+        把上传的文件拼接到用户消息之后
+        store 为 True 时文件内容存入 AttachmentStore，消息中只保存引用，
+        写入对话历史的消息应使用这种形式，请求时由 build 展开
+        """
+        if not files:
+            return user_message
+        message = f"{user_message}{ATTACHMENT_MARKER}"
+        for name, content in files.items():
+            if store:
+                content = AttachmentStore.reference(content)
+            message += f"\n--- {name} ---\n{content}\n"
+        return message
+
+    @staticmethod
+    def strip_attachments(content, label="已省略文件"):
+        """把消息中的附件全文替换为文件名列表，没有附件时原样返回"""
+        if not isinstance(content, str) or ATTACHMENT_MARKER not in content:
+            return content
+        text, attachments = content.split(ATTACHMENT_MARKER, 1)
+        names = ATTACHMENT_NAME.findall(attachments)
+        return f"{text}\n[{label}: {', '.join(names)}]"
+
+    @classmethod
+    def count_message(cls, message, model_name):
+        return _count_tokens(message.get("content") or "", model_name) + cls.message_overhead
+
+    @classmethod
+    def build(cls, conversation_history, user_message, model_name, prompt, budget=None):
+        """
+        组装并裁剪请求消息
+
+        Args:
+            conversation_history (list): 之前的对话，不包含当前消息
+            user_message (str): 当前消息（含附件或附件引用）
+            model_name (str): 模型名称，用于选择编码和预算
+            prompt (str): 系统提示词
+            budget (int): token 预算，None 时按配置计算
+
+        Returns:
+            tuple: (消息列表, PayloadStats)
+        """
+        if budget is None:
+            budget = cls.get_budget(model_name)
+        stats = PayloadStats()
+        history = [dict(message) for message in conversation_history or []]
+
+        # 较早消息中的附件已过时，只保留文件名
+        keep = cls.get_config()["keep_attachments"]
+        user_indexes = [i for i, message in enumerate(history) if message.get("role") == "user"]
+        stale = user_indexes[:-keep] if keep > 0 else user_indexes
+        for i in stale:
+            stripped = cls.strip_attachments(history[i]["content"])
+            if stripped is not history[i]["content"]:
+                stats.trimmed_tokens += (_count_tokens(history[i]["content"], model_name)
+                                         - _count_tokens(stripped, model_name))
+                stats.stripped_attachments += 1
+                history[i]["content"] = stripped
+
+        # 保留的附件引用展开为全文，被省略的附件不会从磁盘读取；历史中的大文件只发送预览
+        for message in history:
+            message["content"] = MappedTextFile.strip_references(AttachmentStore.expand(message["content"]))
+        system = [{"role": "system", "content": prompt}] if prompt else []
+        sizes = [cls.count_message(message, model_name) for message in history]
+        fixed = sum(cls.count_message(message, model_name) for message in system)
+        # 当前消息的附件放不下时只保留与问题相关的部分，较早的历史最多让出一半预算
+        available = max(budget - fixed - sum(sizes), budget // 2) - cls.message_overhead
+        current = {"role": "user", "content": cls.fit_attachments(user_message, available, model_name, stats)}
+        fixed += cls.count_message(current, model_name)
+        used = fixed + sum(sizes)
+
+        # 从最早的轮次开始丢弃，一轮为一条用户消息及其后的回复
+        start = 0
+        while used > budget and start < len(history):
+            end = start + 1
+            while end < len(history) and history[end].get("role") != "user":
+                end += 1
+            dropped = sum(sizes[start:end])
+            used -= dropped
+            stats.trimmed_tokens += dropped
+            stats.dropped_messages += end - start
+            start = end
+        history = history[start:]
+
+        # 只剩当前消息仍超出预算时截断其末尾
+        if used > budget:
+            content = current["content"]
+            excess = used - budget
+            keep_tokens = _count_tokens(content, model_name) - excess - 16
+            truncated = TokenUtils.truncate(content, keep_tokens, model_name)
+            current["content"] = f"{truncated}\n…（内容过长，已截断约 {excess} tokens）"
+            stats.trimmed_tokens += excess
+            stats.truncated = True
+            used = budget
+
+        stats.sent_tokens = used
+        return system + history + [current], stats
+
+    @classmethod
+    def fit_attachments(cls, user_message, available, model_name, stats):
+        """
+        展开当前消息中的附件，超出 available 个 token 且消息中有问题时，按问题检索各附件的相关部分：
+        从小到大依次分配剩余预算，放得下的附件保留全文，放不下的只保留检索结果
+        大文件附件只有预览和原文件引用，有问题且原文件仍在时总是从原文件全文中检索，否则只发送预览
+        """
+        content = AttachmentStore.expand(user_message)
+        if not isinstance(user_message, str) or ATTACHMENT_MARKER not in user_message:
+            return content
+        text, attachments = user_message.split(ATTACHMENT_MARKER, 1)
+        query = text.strip()
+        blocks = cls.split_attachments(attachments)
+        large = {}  # 附件序号 -> 原文件引用
+        if query:
+            for i, (_, body) in enumerate(blocks):
+                match = FILE_REF.search(body)
+                if match and os.path.isfile(match.group(1)):
+                    large[i] = match
+        if not large and (not query or _count_tokens(content, model_name) <= available):
+            return MappedTextFile.strip_references(content)
+
+        sizes = [float("inf") if i in large else _count_tokens(body, model_name) for i, (_, body) in enumerate(blocks)]
+        remaining = available - _count_tokens(text + ATTACHMENT_MARKER, model_name)
+        remaining -= sum(_count_tokens(f"\n--- {name} ---\n\n", model_name) for name, _ in blocks)
+        order = sorted(range(len(blocks)), key=lambda i: sizes[i])
+        for position, i in enumerate(order):
+            share = max(int(remaining // (len(order) - position)), 0)
+            if sizes[i] > share:
+                name, body = blocks[i]
+                if i in large:
+                    # 保留文件信息，预览换成从全文中检索的结果
+                    match = large[i]
+                    body = body[:match.start()] + cls.retrieve_file(match.group(1), query, share, model_name)
+                else:
+                    original = sizes[i]
+                    body = cls.retrieve(body, query, share, model_name)
+                    stats.trimmed_tokens += original - _count_tokens(body, model_name)
+                blocks[i] = (name, body)
+                sizes[i] = _count_tokens(body, model_name)
+                stats.retrieved_attachments += 1
+            remaining -= sizes[i]
+        return MappedTextFile.strip_references(
+            f"{text}{ATTACHMENT_MARKER}" + "".join(f"\n--- {name} ---\n{body}\n" for name, body in blocks))
+
+    @staticmethod
+    def split_attachments(attachments):
+        """
+        拆分 compose_user_message 拼接的附件，附件引用展开为全文
+
+        Returns:
+            list: [(文件名, 内容)]
+        """
+        matches = list(ATTACHMENT_BLOCK.finditer(attachments))
+        blocks = []
+        for match, following in zip(matches, matches[1:] + [None]):
+            end = following.start() if following else len(attachments)
+            body = attachments[match.end():end]
+            if body.endswith("\n"):
+                body = body[:-1]
+            blocks.append((match.group(1), AttachmentStore.expand(body)))
+        return blocks
+
+    @classmethod
+    def retrieve(cls, content, query, max_tokens, model_name):
+        """从附件全文中检索与问题相关的部分"""
+        key = (hashlib.sha256(content.encode('utf-8')).digest(), query, max_tokens, model_name)
+        result = cls._cached_retrieval(key, content, query, max_tokens, model_name)
+        return f"[文件较大，以下只包含与问题相关的部分]\n{result}"
+
+    @classmethod
+    def retrieve_file(cls, file_path, query, max_tokens, model_name):
+        """
+        从大文件原文中检索与问题相关的部分，通过 MappedTextFile 逐块读取，不把全文读入内存
+        切块和 token 计数按文件缓存（只保存位置），换一个问题时只需重新读取和打分
+        """
+        stat = os.stat(file_path)
+        file_key = (file_path, stat.st_size, stat.st_mtime_ns)
+
+        def read_chunks():
+            with MappedTextFile(file_path) as mapped:
+                yield from mapped.iter_chunks()
+
+        def build_index():
+            return cls._processor(model_name, max_tokens).index_chunks(read_chunks())
+
+        index = cls._cached(cls._chunk_indexes, cls.chunk_index_cache_size,
+                            ("index",) + file_key + (model_name,), build_index)
+        result = cls._cached_retrieval(file_key + (query, max_tokens, model_name),
+                                       read_chunks(), query, max_tokens, model_name, index)
+        return f"[以下为全文中与问题相关的部分]\n{result}"
+
+    @classmethod
+    def _processor(cls, model_name, max_tokens):
+        # scikit-learn 导入较慢，只在需要检索时加载
+        from text_processor.processor import TextProcessor
+        return TextProcessor(model_name, max_tokens, cls.get_retrieval_config())
+
+    @classmethod
+    def _cached_retrieval(cls, key, source, query, max_tokens, model_name, index=None):
+        """
+        用 TextProcessor 检索，结果按内容和问题缓存，多个面板同时发送同一附件时只检索一次
+        source 为全文，或逐块返回 (偏移, 文本) 的迭代器；index 为 source 的切块结果
+        """
+        def run():
+            return cls._processor(model_name, max_tokens).process_file_content(source, query, index)
+
+        return cls._cached(cls._retrievals, cls.retrieval_cache_size, key, run)
+
+    @classmethod
+    def _cached(cls, cache, size, key, compute):
+        """
+        返回 cache 中 key 对应的结果，没有时调用 compute() 计算并保留最近的 size 个
+        计算可能需要数秒，在锁外进行：同一 key 正在计算时等待它的结果，不同 key 互不阻塞
+        """
+        with cls._retrieval_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+            future = cls._retrieval_pending.get(key)
+            owner = future is None
+            if owner:
+                future = cls._retrieval_pending[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with cls._retrieval_lock:
+                del cls._retrieval_pending[key]
+            future.set_exception(e)
+            raise
+        with cls._retrieval_lock:
+            cache[key] = result
+            if len(cache) > size:
+                cache.popitem(last=False)
+            del cls._retrieval_pending[key]
+        future.set_result(result)
+        return result
+
+
+_token_counts = OrderedDict()  # (内容摘要, 模型) -> token 数
+_token_counts_lock = threading.Lock()
+_token_counts_size = 4096
+
+
+def _count_tokens(text, model_name):
+    # 历史消息每轮都会重新计数，按内容摘要缓存结果，不持有消息和附件的全文
+    key = (hashlib.sha256(text.encode('utf-8')).digest(), model_name)
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = TokenUtils.count_tokens(text, model_name)
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > _token_counts_size:
+            _token_counts.popitem(last=False)
+    return count
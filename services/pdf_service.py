@@ -0,0 +1,164 @@
+# chat_app/services/pdf_service.py
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz  # PyMuPDF for PDF files
+
+
+def _extract_pages(file_path, page_numbers):
+    """在子进程中提取一组页面的文本"""
+    doc = fitz.open(file_path)
+    try:
+        return [(number, doc[number].get_text()) for number in page_numbers]
+    finally:
+        doc.close()
+
+
+class PdfService:
+    """
+    PDF 文本提取
+    页数较多时按页分组交给进程池并行提取，结果按页码拼接一次；
+    每页的文本缓存在 pdf_cache 中，以 (路径, 大小, 修改时间) 区分文件、以页码区分页面，
+    再次上传同一文件时只提取缓存中没有的页面
+    """
+    cache_dir = './configFiles/pdf_cache'
+    parallel_min_pages = 16  # 少于该页数时在当前进程提取，省去启动子进程的开销
+    chunk_pages = 8  # 每个子任务提取的页数，越小进度越细
+    max_workers = min(os.cpu_count() or 1, 8)
+
+    _executor = None
+    _futures = set()  # 尚未完成的子任务，退出时取消
+    _lock = threading.Lock()
+
+    @staticmethod
+    def page_count(file_path):
+        doc = fitz.open(file_path)
+        try:
+            return doc.page_count
+        finally:
+            doc.close()
+
+    @staticmethod
+    def parse_page_range(text, page_count):
+        """
+        解析页码范围，如 "1-5, 8, 10-"，页码从 1 开始
+
+        Returns:
+            list: 从 0 开始的页码，为空或无效时返回全部页面
+        """
+        pages = []
+        for part in text.replace("，", ",").split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                if "-" in part:
+                    start, end = part.split("-", 1)
+                    start = int(start) if start.strip() else 1
+                    end = int(end) if end.strip() else page_count
+                else:
+                    start = end = int(part)
+            except ValueError:
+                raise ValueError(f"无效的页码范围: {part}")
+            pages.extend(range(max(start, 1) - 1, min(end, page_count)))
+        return sorted(set(pages)) or list(range(page_count))
+
+    @classmethod
+    def extract(cls, file_path, pages=None, progress=None):
+        """
+        提取 PDF 文本
+
+        Args:
+            file_path (str): PDF 路径
+            pages (list): 从 0 开始的页码，None 表示全部页面
+            progress (callable): progress(已完成页数, 总页数)，在调用线程中调用
+
+        Returns:
+            str: 各页文本按页码顺序拼接
+        """
+        if pages is None:
+            pages = list(range(cls.page_count(file_path)))
+        total = len(pages)
+        cache_path = cls._cache_path(file_path)
+        cached = cls._read_cache(cache_path)
+        texts = {page: cached[str(page)] for page in pages if str(page) in cached}
+        missing = [page for page in pages if page not in texts]
+        if progress:
+            progress(len(texts), total)
+
+        if missing:
+            if len(missing) < cls.parallel_min_pages:
+                for page, text in _extract_pages(file_path, missing):
+                    texts[page] = text
+                    if progress:
+                        progress(len(texts), total)
+            else:
+                chunks = [missing[i:i + cls.chunk_pages] for i in range(0, len(missing), cls.chunk_pages)]
+                futures = [cls.submit(file_path, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    texts.update(future.result())
+                    if progress:
+                        progress(len(texts), total)
+
+            cached.update({str(page): texts[page] for page in missing})
+            cls._write_cache(cache_path, cached)
+
+        return "".join(texts[page] for page in pages)
+
+    @classmethod
+    def get_executor(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(max_workers=cls.max_workers)
+            return cls._executor
+
+    @classmethod
+    def submit(cls, file_path, page_numbers):
+        future = cls.get_executor().submit(_extract_pages, file_path, page_numbers)
+        with cls._lock:
+            cls._futures.add(future)
+        future.add_done_callback(cls._futures.discard)
+        return future
+
+    @classmethod
+    def shutdown(cls):
+        """退出时关闭进程池"""
+        with cls._lock:
+            # 先取消排队中的任务再关闭，shutdown 的 cancel_futures 参数需要 Python 3.9
+            for future in list(cls._futures):
+                future.cancel()
+            cls._futures.clear()
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False)
+                cls._executor = None
+
+    @classmethod
+    def _cache_path(cls, file_path):
+        stat = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return os.path.join(cls.cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + ".json.gz")
+
+    @staticmethod
+    def _read_cache(cache_path):
+        """读取缓存的页面文本: {页码: 文本}"""
+        try:
+            with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, EOFError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _write_cache(cache_path, pages):
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump(pages, f, ensure_ascii=False)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            print(f"写入 PDF 缓存失败: {e}")
@@ -0,0 +1,118 @@
+# chat_app/services/request_policy.py
+
+import random
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import openai
+
+
+@dataclass
+class RequestPolicy:
+    """
+    单个模型条目的请求策略，来自 config.json 中模型条目的 retry / hedge 字段:
+        "retry": {"max_retries": 2, "base_delay": 0.5, "max_delay": 8}
+        "hedge": {"fallback": "备用模型名称", "percentile": 95,
+                  "min_delay": 1, "max_delay": 15, "default_delay": 5}
+    rate_limit 字段（{"rpm": 60, "tpm": 90000}）原样交给 RequestScheduler
+    """
+    max_retries: int = 2
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    hedge_target: Optional[Dict] = None  # 对冲请求使用的备用模型条目
+    hedge_percentile: float = 95
+    hedge_min_delay: float = 1.0
+    hedge_max_delay: float = 15.0
+    hedge_default_delay: float = 5.0
+    rate_limit: Optional[Dict] = None  # 每分钟请求数 / token 数上限
+
+    @staticmethod
+    def from_model(model, models):
+        """
+        根据模型条目构造策略
+
+        Args:
+            model (dict): 当前模型条目
+            models (list): 全部模型条目，用于按名称查找备用端点
+        """
+        policy = RequestPolicy()
+        retry = model.get('retry') or {}
+        policy.max_retries = retry.get('max_retries', policy.max_retries)
+        policy.base_delay = retry.get('base_delay', policy.base_delay)
+        policy.max_delay = retry.get('max_delay', policy.max_delay)
+
+        hedge = model.get('hedge') or {}
+        fallback = hedge.get('fallback')
+        if fallback:
+            policy.hedge_target = next((m for m in models if m['name'] == fallback), None)
+            if policy.hedge_target is None:
+                print(f"未找到对冲使用的备用模型: {fallback}")
+        policy.hedge_percentile = hedge.get('percentile', policy.hedge_percentile)
+        policy.hedge_min_delay = hedge.get('min_delay', policy.hedge_min_delay)
+        policy.hedge_max_delay = hedge.get('max_delay', policy.hedge_max_delay)
+        policy.hedge_default_delay = hedge.get('default_delay', policy.hedge_default_delay)
+        policy.rate_limit = model.get('rate_limit')
+        return policy
+
+    @staticmethod
+    def is_retryable(error):
+        """限流、超时、连接错误和服务端错误可以重试"""
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in (408, 409, 429) or error.status_code >= 500
+        return False
+
+    @staticmethod
+    def retry_after(error):
+        """读取服务端返回的 Retry-After（秒），没有时返回 None"""
+        response = getattr(error, 'response', None)
+        if response is None:
+            return None
+        headers = response.headers
+        try:
+            if 'retry-after-ms' in headers:
+                return float(headers['retry-after-ms']) / 1000
+            if 'retry-after' in headers:
+                return float(headers['retry-after'])
+        except ValueError:
+            pass
+        return None
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """带随机抖动的指数退避，服务端给出 Retry-After 时以其为准"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay * 4)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def hedge_delay(self, tracker, endpoint):
+        """根据端点历史首字延迟的分位数决定何时发出对冲请求"""
+        delay = tracker.percentile(endpoint, self.hedge_percentile)
+        if delay is None:
+            delay = self.hedge_default_delay
+        return max(self.hedge_min_delay, min(self.hedge_max_delay, delay))
+
+
+class LatencyTracker:
+    """按端点记录最近的首字延迟样本"""
+    min_samples = 5
+
+    def __init__(self, window=50):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            self._samples.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, endpoint, percentile):
+        """样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+        return samples[index]
@@ -0,0 +1,203 @@
+# chat_app/services/request_scheduler.py
+
+import asyncio
+import math
+import time
+from urllib.parse import urlparse
+
+from config import ConfigManager
+
+
+class TokenBucket:
+    """令牌桶，容量为每分钟的额度，按秒匀速补充"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """取出 amount 个令牌还需等待的秒数"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """
+    按端点限流的请求调度器，只在流式引擎的事件循环中使用
+    模型条目可配置 "rate_limit": {"rpm": 60, "tpm": 90000}，按 (url, model) 分别计数；
+    同一主机的并发流数受 config.json 中 scheduler.max_streams_per_host 限制；
+    排队的请求按面板轮流放行，服务端返回 Retry-After 时暂停该端点
+    """
+    defaults = {
+        "max_streams_per_host": 4  # 每个主机同时进行的流数，0 表示不限制
+    }
+
+    def __init__(self, config=None):
+        if config is None:
+            config = dict(self.defaults)
+            config.update(ConfigManager.get_setting("scheduler", {}) or {})
+        self.config = config
+        self._endpoints = {}  # (url, model) -> _Endpoint
+        self._hosts = {}  # 主机 -> _Host
+
+    async def acquire(self, target, tokens=0, owner=None, on_wait=None):
+        """
+        等待端点额度和主机并发名额
+
+        Args:
+            target (dict): 模型条目，包含 url / model / rate_limit
+            tokens (int): 请求消耗的 token 数，用于 tpm 限流
+            owner: 发起请求的面板，用于在面板之间轮流放行
+            on_wait (callable): 需要排队时调用一次，参数为提示文字
+
+        Returns:
+            Lease: 流结束后调用 release() 归还名额
+        """
+        endpoint = self._endpoint(target)
+        host = self._host(target['url'])
+        waiter = _Waiter(owner, tokens, endpoint)
+        host.waiters.append(waiter)
+        notified = False
+        try:
+            while True:
+                delay, reason = self._check(host, waiter, time.monotonic())
+                if delay == 0:
+                    break
+                if not notified and on_wait is not None:
+                    on_wait(reason)
+                    notified = True
+                waiter.event.clear()
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), None if math.isinf(delay) else delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            host.waiters.remove(waiter)
+            self._wake(host)
+
+        now = time.monotonic()
+        if endpoint.requests is not None:
+            endpoint.requests.take(1, now)
+        if endpoint.tokens is not None:
+            endpoint.tokens.take(tokens, now)
+        host.active += 1
+        host.granted[owner] = host.granted.get(owner, 0) + 1
+        return Lease(self, host)
+
+    def penalize(self, target, seconds):
+        """服务端要求等待时暂停该端点的所有请求"""
+        endpoint = self._endpoint(target)
+        endpoint.blocked_until = max(endpoint.blocked_until, time.monotonic() + seconds)
+
+    def get_stats(self):
+        return {host: {"active": state.active, "waiting": len(state.waiters)}
+                for host, state in self._hosts.items()}
+
+    def _endpoint(self, target):
+        key = (target['url'], target['model'])
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = self._endpoints[key] = _Endpoint(target.get('rate_limit') or {})
+        return endpoint
+
+    def _host(self, url):
+        name = urlparse(url).netloc or url
+        host = self._hosts.get(name)
+        if host is None:
+            host = self._hosts[name] = _Host(name)
+        return host
+
+    def _limit(self):
+        return self.config.get("max_streams_per_host") or 0
+
+    def _check(self, host, waiter, now):
+        """
+        判断能否放行
+
+        Returns:
+            tuple: (需等待的秒数，inf 表示等待其他请求结束, 排队原因)
+        """
+        limit = self._limit()
+        if limit and host.active >= limit:
+            return math.inf, f"排队中：{host.name} 已有 {host.active} 个请求"
+
+        delay = waiter.endpoint.wait_time(waiter.tokens, now)
+        if delay > 0:
+            return delay, f"排队中：触发限流，约 {delay:.1f} 秒后发送"
+
+        # 多个请求同时可放行时，优先放行已放行次数最少的面板，次数相同时先到先得
+        rank = (host.granted.get(waiter.owner, 0), host.waiters.index(waiter))
+        for position, other in enumerate(host.waiters):
+            if other is waiter:
+                continue
+            if (host.granted.get(other.owner, 0), position) < rank \
+                    and other.endpoint.wait_time(other.tokens, now) == 0:
+                return math.inf, "排队中：等待其他面板的请求"
+        return 0, ""
+
+    def _release(self, host):
+        host.active -= 1
+        self._wake(host)
+
+    @staticmethod
+    def _wake(host):
+        for waiter in host.waiters:
+            waiter.event.set()
+
+
+class Lease:
+    """主机并发名额，可重复调用 release()"""
+
+    def __init__(self, scheduler, host):
+        self._scheduler = scheduler
+        self._host = host
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self._host)
+
+
+class _Endpoint:
+    def __init__(self, limits):
+        self.requests = TokenBucket(limits['rpm']) if limits.get('rpm') else None
+        self.tokens = TokenBucket(limits['tpm']) if limits.get('tpm') else None
+        self.blocked_until = 0.0  # Retry-After 到期时间
+
+    def wait_time(self, tokens, now):
+        delay = max(0.0, self.blocked_until - now)
+        if self.requests is not None:
+            delay = max(delay, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.wait_time(tokens, now))
+        return delay
+
+
+class _Host:
+    def __init__(self, name):
+        self.name = name
+        self.active = 0
+        self.waiters = []
+        self.granted = {}  # owner -> 已放行次数
+
+
+class _Waiter:
+    def __init__(self, owner, tokens, endpoint):
+        self.owner = owner
+        self.tokens = tokens
+        self.endpoint = endpoint
+        self.event = asyncio.Event()
@@ -0,0 +1,209 @@
+# chat_app/services/response_cache.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import ConfigManager
+
+
+class ResponseCache:
+    """
+    按请求内容哈希缓存完整回复（需在 config.json 中开启 response_cache.enabled）
+    内存中保留最近使用的条目，磁盘上保存在 configFiles/cache/responses 下，
+    两者都受容量上限和过期时间约束
+    """
+    cache_dir = './configFiles/cache/responses'
+    defaults = {
+        "enabled": False,
+        "max_entries": 256,  # 内存中的最大条目数
+        "max_disk_mb": 200,  # 磁盘缓存的容量上限
+        "ttl_hours": 72  # 过期时间
+    }
+
+    _lock = threading.RLock()
+    _memory = OrderedDict()  # key -> (创建时间, 回复)
+    _config = None
+    _disk_size = None
+    _stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+    @classmethod
+    def get_config(cls):
+        if cls._config is None:
+            config = dict(cls.defaults)
+            config.update(ConfigManager.get_setting("response_cache", {}) or {})
+            cls._config = config
+        return cls._config
+
+    @classmethod
+    def is_enabled(cls):
+        return bool(cls.get_config()["enabled"])
+
+    @classmethod
+    def _ttl(cls):
+        return cls.get_config()["ttl_hours"] * 3600
+
+    @classmethod
+    def _path(cls, key):
+        return os.path.join(cls.cache_dir, f"{key}.json")
+
+    @classmethod
+    def get(cls, key):
+        """
+        查找缓存的回复
+
+        Returns:
+            str: 命中时返回完整回复，否则返回 None
+        """
+        now = time.time()
+        with cls._lock:
+            entry = cls._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= cls._ttl():
+                    cls._memory.move_to_end(key)
+                    cls._stats["memory_hits"] += 1
+                    return entry[1]
+                del cls._memory[key]
+
+            entry = cls._read_disk(key, now)
+            if entry is None:
+                cls._stats["misses"] += 1
+                return None
+            cls._remember(key, entry)
+            cls._stats["disk_hits"] += 1
+            return entry[1]
+
+    @classmethod
+    def put(cls, key, reply):
+        """保存完整回复"""
+        if not reply:
+            return
+        entry = (time.time(), reply)
+        with cls._lock:
+            cls._remember(key, entry)
+            cls._write_disk(key, entry)
+            cls._stats["stores"] += 1
+
+    @classmethod
+    def _remember(cls, key, entry):
+        cls._memory[key] = entry
+        cls._memory.move_to_end(key)
+        while len(cls._memory) > cls.get_config()["max_entries"]:
+            cls._memory.popitem(last=False)
+
+    @classmethod
+    def _read_disk(cls, key, now):
+        path = cls._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            created, reply = data["created"], data["reply"]
+            expired = now - created > cls._ttl()
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            # 写了一半或格式不对的条目按未命中处理
+            cls._discard(path)
+            return None
+
+        if expired:
+            cls._discard(path)
+            return None
+        # 更新访问时间，磁盘淘汰按最近使用排序
+        os.utime(path)
+        return created, reply
+
+    @classmethod
+    def _write_disk(cls, key, entry):
+        try:
+            os.makedirs(cls.cache_dir, exist_ok=True)
+            path = cls._path(key)
+            # 写入前取得总大小（首次时扫描目录），覆盖已有条目时减去旧文件的大小
+            size = cls._get_disk_size() - cls._file_size(path)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"created": entry[0], "reply": entry[1]}, f, ensure_ascii=False)
+            cls._disk_size = size + os.path.getsize(path)
+            cls._evict_disk()
+        except OSError as e:
+            print(f"写入响应缓存失败: {e}")
+
+    @classmethod
+    def _get_disk_size(cls):
+        if cls._disk_size is None:
+            cls._disk_size = sum(entry.stat().st_size for entry in cls._scan_disk())
+        return cls._disk_size
+
+    @classmethod
+    def _scan_disk(cls):
+        try:
+            return [entry for entry in os.scandir(cls.cache_dir) if entry.name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+
+    @classmethod
+    def _evict_disk(cls):
+        """超出容量时按最近使用时间淘汰，降到上限的九成"""
+        limit = cls.get_config()["max_disk_mb"] * 1024 * 1024
+        if cls._disk_size <= limit:
+            return
+        entries = sorted(cls._scan_disk(), key=lambda entry: entry.stat().st_mtime)
+        size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if size <= limit * 0.9:
+                break
+            size -= entry.stat().st_size
+            cls._remove_file(entry.path)
+            cls._memory.pop(entry.name[:-len('.json')], None)
+            cls._stats["evicted"] += 1
+        cls._disk_size = size
+
+    @classmethod
+    def _discard(cls, path):
+        """删除条目并更新磁盘占用"""
+        size = cls._file_size(path)
+        cls._remove_file(path)
+        if cls._disk_size is not None:
+            cls._disk_size = max(0, cls._disk_size - size)
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def split_reply(reply, size=256):
+        """把缓存的回复切成片段，按正常的流式路径回放"""
+        return [reply[i:i + size] for i in range(0, len(reply), size)]
+
+    @classmethod
+    def clear(cls):
+        """清空内存和磁盘缓存"""
+        with cls._lock:
+            cls._memory.clear()
+            for entry in cls._scan_disk():
+                cls._remove_file(entry.path)
+            cls._disk_size = 0
+
+    @classmethod
+    def get_stats(cls):
+        """
+        获取缓存命中统计
+
+        Returns:
+            dict: memory_hits/disk_hits 命中数, misses 未命中数, stores 写入数, evicted 淘汰数, entries 内存条目数
+        """
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats["entries"] = len(cls._memory)
+            return stats
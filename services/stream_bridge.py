@@ -0,0 +1,35 @@
+# chat_app/services/stream_bridge.py
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from .stream_engine import StreamEngine
+
+
+class StreamBridge(QObject):
+    """
+    流式引擎与 Qt 之间的桥接
+    引擎线程中的所有事件都经由同一个信号排队投递到界面线程；
+    设置了 delta_buffer 时，消息片段改为写入缓冲区，由界面按帧率统一刷新
+    """
+    # 信号定义: (模型索引, 请求编号, 事件类型, 数据)
+    stream_event = pyqtSignal(int, int, str, object)
+
+    def __init__(self, delta_buffer=None, parent=None):
+        super().__init__(parent)
+        self.delta_buffer = delta_buffer
+        self.engine = StreamEngine(self._dispatch)
+
+    def _dispatch(self, model_index, request_id, event, data):
+        if event == "delta" and self.delta_buffer is not None:
+            self.delta_buffer.push(model_index, request_id, data)
+        else:
+            self.stream_event.emit(model_index, request_id, event, data)
+
+    def submit(self, model_index, request):
+        return self.engine.submit(model_index, request)
+
+    def cancel(self, model_index):
+        self.engine.cancel(model_index)
+
+    def shutdown(self):
+        self.engine.shutdown()
@@ -0,0 +1,368 @@
+# chat_app/services/stream_engine.py
+
+import asyncio
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .api_service import APIService
+from utils.token_utils import TokenUtils
+from .client_pool import ClientPool
+from .metrics_service import MetricsService, StreamMetrics
+from .request_policy import RequestPolicy, LatencyTracker
+from .request_scheduler import RequestScheduler
+from .response_cache import ResponseCache
+
+
+@dataclass
+class StreamRequest:
+    """一次流式请求所需的全部参数"""
+    conversation_history: List[Dict] = field(default_factory=list)
+    user_message: str = ""
+    api_url: str = ""
+    model_name: str = ""
+    api_key: str = ""
+    prompt: str = ""
+    share: bool = True  # 是否允许与其他面板的相同请求共享同一条流
+    policy: Optional[RequestPolicy] = None  # 重试与对冲策略，None 时使用默认策略
+
+
+class StreamEngine:
+    """
+    基于 asyncio 的流式引擎
+    所有面板的流式请求都复用同一个后台事件循环线程，
+    事件通过 listener(model_index, request_id, event, data) 回调发出，
+    event 取值: delta（消息片段）、finished（完整回复）、error（错误信息）、
+    cancelled（被取消，携带已收到的部分回复）、status（重试/对冲等状态提示）、
+    metrics（StreamMetrics 耗时统计，在 finished 之前发出）
+    发送前经 RequestScheduler 按端点限流，排队时通过 status 事件提示
+    请求内容完全相同且允许共享时，只发出一次请求，片段广播给所有订阅的面板
+    """
+
+    def __init__(self, listener: Callable[[int, int, str, object], None], loop=None):
+        """
+        Args:
+            listener: 事件回调，在事件循环线程中调用
+            loop: 使用已有的事件循环（如 server.py），None 时在后台线程中创建
+        """
+        self.listener = listener
+        self._ids = itertools.count(1)
+        self._tasks = {}  # model_index -> (request_id, _Flight)
+        self._flights = {}  # 请求哈希 -> 可共享的 _Flight
+        self.latency = LatencyTracker()  # 各端点的首字延迟
+        self.scheduler = RequestScheduler()
+        self._thread = None
+        if loop is not None:
+            self._loop = loop
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="StreamEngine", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, model_index, request: StreamRequest):
+        """
+        提交一个流式请求，同一面板正在进行的请求会被取消
+
+        Returns:
+            int: 请求编号，用于过滤过期事件
+        """
+        request_id = next(self._ids)
+        self._loop.call_soon_threadsafe(self._start_task, model_index, request_id, request)
+        return request_id
+
+    def cancel(self, model_index):
+        """取消指定面板正在进行的请求"""
+        self._loop.call_soon_threadsafe(self._cancel_task, model_index)
+
+    def is_busy(self, model_index):
+        """面板是否有正在进行的请求"""
+        return model_index in self._tasks
+
+    def shutdown(self, timeout=5):
+        """取消所有请求，关闭异步客户端并停止事件循环；使用外部事件循环时改用 aclose()"""
+        if self._thread is None or not self._loop.is_running():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            print(f"关闭流式引擎失败: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+    async def aclose(self):
+        """在外部事件循环中取消所有请求并关闭异步客户端"""
+        await self._shutdown()
+
+    async def _shutdown(self):
+        tasks = [flight.task for flight in set(flight for _, flight in self._tasks.values())]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await ClientPool.aclose_async_clients()
+
+    def _start_task(self, model_index, request_id, request):
+        self._cancel_task(model_index)
+
+        key = None
+        if request.share or ResponseCache.is_enabled():
+            key = APIService.request_key(
+                request.conversation_history,
+                request.user_message,
+                request.api_url,
+                request.model_name,
+                request.prompt
+            )
+
+        # 相同请求正在进行时作为订阅者加入，共享同一条流
+        flight = self._flights.get(key) if request.share else None
+        if flight is not None:
+            flight.subscribers[model_index] = request_id
+            if flight.parts:
+                self._emit(model_index, request_id, "delta", "".join(flight.parts))
+        else:
+            flight = _Flight(key, request.share, model_index)
+            flight.subscribers[model_index] = request_id
+            if request.share:
+                self._flights[key] = flight
+            flight.task = self._loop.create_task(self._stream(flight, request))
+        self._tasks[model_index] = (request_id, flight)
+
+    def _cancel_task(self, model_index):
+        entry = self._tasks.pop(model_index, None)
+        if entry is None:
+            return
+        request_id, flight = entry
+        flight.subscribers.pop(model_index, None)
+        self._emit(model_index, request_id, "cancelled", "".join(flight.parts))
+        # 其他面板仍在订阅时只让当前面板退出，否则取消整条流
+        if not flight.subscribers:
+            if flight.shared and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight.task.cancel()
+
+    async def _stream(self, flight, request):
+        response = None
+        lease = None
+        metrics = StreamMetrics(model=request.model_name, endpoint=request.api_url,
+                                request_start=time.monotonic())
+        try:
+            if flight.key is not None and ResponseCache.is_enabled():
+                cached = await self._loop.run_in_executor(None, ResponseCache.get, flight.key)
+                if cached is not None:
+                    # 命中缓存时按正常流式事件回放
+                    metrics.cached = True
+                    for piece in ResponseCache.split_reply(cached):
+                        metrics.mark_token(time.monotonic())
+                        flight.parts.append(piece)
+                        self._broadcast(flight, "delta", piece)
+                    await self._report_metrics(flight, metrics, cached)
+                    self._finish(flight, "finished", cached)
+                    return
+
+            response, iterator, first, target, connected, lease = await self._open_stream(flight, request)
+            metrics.model = target['model']
+            metrics.endpoint = target['url']
+            metrics.connected = connected
+            if first:
+                metrics.mark_token(time.monotonic())
+                flight.parts.append(first)
+                self._broadcast(flight, "delta", first)
+
+            async for chunk in iterator:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    metrics.mark_token(time.monotonic())
+                    flight.parts.append(content)
+                    self._broadcast(flight, "delta", content)
+
+            reply = "".join(flight.parts)
+            # 缓存键按请求的模型计算，由对冲端点回复时不写入缓存，以免之后的相同请求拿到其他模型的回复
+            answered_by_request = target['url'] == request.api_url and target['model'] == request.model_name
+            if flight.key is not None and answered_by_request and ResponseCache.is_enabled():
+                await self._loop.run_in_executor(None, ResponseCache.put, flight.key, reply)
+            await self._report_metrics(flight, metrics, reply)
+            self._finish(flight, "finished", reply)
+        except asyncio.CancelledError:
+            self._finish(flight, "cancelled", "".join(flight.parts))
+            raise
+        except Exception as e:
+            print(f"Streaming error: {str(e)}")
+            self._finish(flight, "error", str(e))
+        finally:
+            if response is not None:
+                # 关闭响应，把连接归还连接池
+                await response.close()
+            if lease is not None:
+                lease.release()
+            if flight.shared and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    async def _open_stream(self, flight, request):
+        """
+        打开流并等到第一个片段
+        主端点在首字延迟阈值内没有返回（或已失败）时，向备用端点发出对冲请求，
+        先返回者胜出，另一个被取消
+
+        Returns:
+            tuple: (响应, 片段迭代器, 第一个片段, 实际使用的模型条目, 收到响应头的时间, 并发名额)
+        """
+        policy = request.policy or RequestPolicy()
+        primary_target = {"name": request.model_name, "url": request.api_url,
+                          "model": request.model_name, "key": request.api_key,
+                          "rate_limit": policy.rate_limit}
+        primary = self._loop.create_task(self._attempt_with_retry(flight, request, primary_target, policy))
+        if policy.hedge_target is None:
+            return await primary
+
+        hedge_target = policy.hedge_target
+        hedge = None
+        winner = None
+        try:
+            # 等待对冲延迟期间也可能被取消（停止按钮、同一面板重新发送），取消时由 finally 清理主请求
+            delay = policy.hedge_delay(self.latency, (request.api_url, request.model_name))
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done and primary.exception() is None:
+                winner = primary
+                return primary.result()
+
+            if done:
+                self._broadcast(flight, "status", f"请求失败，改由 {hedge_target['name']} 回复")
+            else:
+                self._broadcast(flight, "status", f"{delay:.1f} 秒内无响应，已向 {hedge_target['name']} 发出对冲请求")
+            hedge = self._loop.create_task(self._attempt_with_retry(flight, request, hedge_target, policy))
+            pending = {hedge} if done else {primary, hedge}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+            if winner is None:
+                # 两个请求都失败，抛出主端点的错误
+                raise primary.exception()
+        finally:
+            # 未胜出的请求：已打开的流关闭并归还名额，未完成的取消（取消时由 _attempt_with_retry 自行清理）
+            for task in (primary, hedge):
+                if task is None or task is winner:
+                    continue
+                if task.done():
+                    if not task.cancelled() and task.exception() is None:
+                        loser = task.result()
+                        await loser[0].close()
+                        loser[-1].release()
+                else:
+                    task.cancel()
+
+        if winner is hedge:
+            self._broadcast(flight, "status", f"由 {hedge_target['name']} 回复")
+        return winner.result()
+
+    async def _attempt_with_retry(self, flight, request, target, policy):
+        """
+        向单个端点发出请求，首个片段到达前的可重试错误按指数退避重试
+        每次发送前向调度器申请名额，流结束时由调用方归还
+        """
+        # 计数 token 可能较慢（大文件），放到线程中避免阻塞事件循环
+        payload, stats = await self._loop.run_in_executor(
+            None,
+            APIService.prepare_payload,
+            request.conversation_history,
+            request.user_message,
+            target['model'],
+            request.prompt
+        )
+        attempt = 0
+        while True:
+            response = None
+            queued = []
+
+            def on_wait(reason):
+                # 排队时在面板上显示等待状态，放行后清除
+                queued.append(reason)
+                self._broadcast(flight, "status", reason)
+
+            lease = await self.scheduler.acquire(target, stats.sent_tokens, flight.owner, on_wait)
+            if queued:
+                self._broadcast(flight, "status", "")
+            started = self._loop.time()
+            try:
+                response = await APIService.send_payload_async(payload, target['url'], target.get('key', ''))
+                connected = time.monotonic()
+                iterator = response.__aiter__()
+                first = await self._read_first(iterator)
+                self.latency.record((target['url'], target['model']), self._loop.time() - started)
+                return response, iterator, first, target, connected, lease
+            except asyncio.CancelledError:
+                if response is not None:
+                    await response.close()
+                lease.release()
+                raise
+            except Exception as e:
+                if response is not None:
+                    await response.close()
+                lease.release()
+                retry_after = RequestPolicy.retry_after(e)
+                if retry_after is not None:
+                    # 服务端要求等待时，同一端点排队的其他请求也一起等待
+                    self.scheduler.penalize(target, retry_after)
+                if attempt >= policy.max_retries or not RequestPolicy.is_retryable(e):
+                    raise
+                delay = policy.backoff_delay(attempt, retry_after)
+                attempt += 1
+                print(f"{target['name']} 请求失败，{delay:.1f} 秒后重试: {e}")
+                self._broadcast(flight, "status", f"请求失败，{delay:.1f} 秒后第 {attempt} 次重试")
+                await asyncio.sleep(delay)
+
+    async def _report_metrics(self, flight, metrics, reply):
+        """统计 token 数、写入耗时日志并通知订阅者"""
+        metrics.tokens = await self._loop.run_in_executor(None, TokenUtils.count_tokens, reply, metrics.model)
+        await self._loop.run_in_executor(None, MetricsService.record, metrics)
+        self._broadcast(flight, "metrics", metrics)
+
+    @staticmethod
+    async def _read_first(iterator):
+        """读到第一个有内容的片段，流直接结束时返回 None"""
+        async for chunk in iterator:
+            if chunk.choices and chunk.choices[0].delta.content:
+                return chunk.choices[0].delta.content
+        return None
+
+    def _broadcast(self, flight, event, data):
+        for model_index, request_id in list(flight.subscribers.items()):
+            self._emit(model_index, request_id, event, data)
+
+    def _finish(self, flight, event, data):
+        """向所有订阅者发送结束事件并解除订阅"""
+        if flight.shared and self._flights.get(flight.key) is flight:
+            # 结束后不再接受新的订阅者
+            del self._flights[flight.key]
+        subscribers, flight.subscribers = flight.subscribers, {}
+        for model_index, request_id in subscribers.items():
+            entry = self._tasks.get(model_index)
+            if entry is not None and entry[0] == request_id:
+                del self._tasks[model_index]
+            self._emit(model_index, request_id, event, data)
+
+    def _emit(self, model_index, request_id, event, data):
+        try:
+            self.listener(model_index, request_id, event, data)
+        except Exception as e:
+            print(f"分发流式事件失败: {e}")
+
+
+class _Flight:
+    """一条实际发出的流，可被多个面板订阅"""
+
+    def __init__(self, key, shared, owner=None):
+        self.key = key
+        self.shared = shared
+        self.owner = owner  # 发起请求的面板，用于调度器轮流放行
+        self.task = None
+        self.parts = []
+        self.subscribers = {}  # model_index -> request_id
@@ -1,8 +1,13 @@
 # chat_app/services/stream_worker.py
 
-from PyQt6.QtCore import QThread, pyqtSignal
 import time
+
+from PyQt6.QtCore import QThread, pyqtSignal
+from utils.token_utils import TokenUtils
 from .api_service import APIService
+from .cancel_token import CancelToken
+from .response_cache import ResponseCache
+from .metrics_service import MetricsService, StreamMetrics
 
 
 class StreamWorker(QThread):
@@ -14,8 +19,11 @@ class StreamWorker(QThread):
     message_ready = pyqtSignal(str, int)  # 单个消息片段准备好
     reply_finished = pyqtSignal(str, int)  # 完整回复结束
     error_occurred = pyqtSignal(str)  # 发生错误
+    cancelled = pyqtSignal(str, int)  # 被取消，携带已收到的部分回复
+    metrics_ready = pyqtSignal(object, int)  # 耗时统计（StreamMetrics），在 reply_finished 之前发出
 
-    def __init__(self, conversation_history, user_message, api_url, model_name, api_key, prompt, model_index):
+    def __init__(self, conversation_history, user_message, api_url, model_name, api_key, prompt, model_index,
+                 delta_buffer=None, request_id=0):
         """
         初始化流式处理工作线程
 
@@ -27,6 +35,8 @@ class StreamWorker(QThread):
             api_key (str): API密钥
             prompt (str): 系统提示词
             model_index (int): 模型索引
+            delta_buffer (DeltaBuffer): 可选的片段合并缓冲区，设置后片段写入缓冲区而非逐个发信号
+            request_id (int): 写入缓冲区时使用的请求编号
         """
         super().__init__()
         self.conversation_history = conversation_history
@@ -36,6 +46,9 @@ class StreamWorker(QThread):
         self.api_key = api_key
         self.prompt = prompt
         self.model_index = model_index
+        self.delta_buffer = delta_buffer
+        self.request_id = request_id
+        self.cancel_token = CancelToken()
         self.reply = ''
 
     def run(self):
@@ -43,7 +56,28 @@ class StreamWorker(QThread):
         线程执行的主要逻辑
         发送API请求并处理流式响应
         """
+        metrics = StreamMetrics(model=self.model_name, endpoint=self.api_url, request_start=time.monotonic())
         try:
+            cache_key = None
+            if ResponseCache.is_enabled():
+                cache_key = APIService.request_key(
+                    self.conversation_history,
+                    self.user_message,
+                    self.api_url,
+                    self.model_name,
+                    self.prompt
+                )
+                cached = ResponseCache.get(cache_key)
+                if cached is not None:
+                    # 命中缓存时按正常流式信号回放
+                    metrics.cached = True
+                    for piece in ResponseCache.split_reply(cached):
+                        metrics.mark_token(time.monotonic())
+                        self._deliver(piece)
+                    self._report_metrics(metrics, cached)
+                    self.reply_finished.emit(cached, self.model_index)
+                    return
+
             # 使用APIService发送请求
             response = APIService.send_request(
                 self.conversation_history,
@@ -53,33 +87,67 @@ class StreamWorker(QThread):
                 self.api_key,
                 self.prompt
             )
+            metrics.connected = time.monotonic()
 
             # 检查是否返回了错误字符串
             if isinstance(response, str):
                 self.message_ready.emit(response, self.model_index)
                 return
 
+            # 取消时关闭响应流，阻塞中的读取会随之结束
+            self.cancel_token.on_cancel(response.close)
+
             # 处理流式响应
             for chunk in response:
+                if self.cancel_token.cancelled:
+                    break
+                if not chunk.choices:
+                    continue
                 if hasattr(chunk.choices[0].delta, 'content'):
                     content = chunk.choices[0].delta.content
                     if content:
+                        metrics.mark_token(time.monotonic())
                         self.reply += content
-                        self.message_ready.emit(content, self.model_index)
-                        time.sleep(0.01)  # 控制输出速度
+                        self._deliver(content)
 
-            # 发送完整回复信号
-            self.reply_finished.emit(self.reply, self.model_index)
+            if self.cancel_token.cancelled:
+                response.close()
+                self.cancelled.emit(self.reply, self.model_index)
+            else:
+                if cache_key is not None:
+                    ResponseCache.put(cache_key, self.reply)
+                self._report_metrics(metrics, self.reply)
+                # 发送完整回复信号
+                self.reply_finished.emit(self.reply, self.model_index)
             # 清空回复缓存
             self.reply = ''
 
         except Exception as e:
+            if self.cancel_token.cancelled:
+                # 关闭响应流导致的读取异常属于正常取消
+                self.cancelled.emit(self.reply, self.model_index)
+                self.reply = ''
+                return
             print(f"Streaming error: {str(e)}")
             self.error_occurred.emit(str(e))
 
-    def stop(self):
+    def _report_metrics(self, metrics, reply):
+        """统计 token 数、写入耗时日志并发出 metrics_ready"""
+        metrics.tokens = TokenUtils.count_tokens(reply, self.model_name)
+        MetricsService.record(metrics)
+        self.metrics_ready.emit(metrics, self.model_index)
+
+    def _deliver(self, content):
+        """发送消息片段，设置了缓冲区时写入缓冲区"""
+        if self.delta_buffer is not None:
+            self.delta_buffer.push(self.model_index, self.request_id, content)
+        else:
+            self.message_ready.emit(content, self.model_index)
+
+    def stop(self, timeout=5000):
         """
-        停止当前工作线程
+        协作式停止当前工作线程
+        设置取消标记并关闭响应流，等待线程自行退出
         """
-        self.terminate()
-        self.wait()
\ No newline at end of file
+        self.cancel_token.cancel()
+        self.wait(timeout)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from services.api_service import APIService
+from services.payload_builder import PayloadStats
+from services.request_policy import RequestPolicy
+from services.stream_engine import StreamEngine, StreamRequest
+
+
+class _SilentStream:
+    """收到响应头后迟迟不返回第一个片段的流"""
+
+    def __init__(self):
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.closed = True
+
+
+class HedgeCancelTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.streams = []
+        self.events = []
+
+        async def send_payload_async(payload, api_url, api_key):
+            stream = _SilentStream()
+            self.streams.append(stream)
+            return stream
+
+        patches = [
+            mock.patch.object(APIService, "prepare_payload", lambda *args: ({}, PayloadStats())),
+            mock.patch.object(APIService, "send_payload_async", send_payload_async),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.engine = StreamEngine(lambda *event: self.events.append(event), loop=asyncio.get_running_loop())
+
+    async def asyncTearDown(self):
+        await self.engine.aclose()
+
+    def _request(self):
+        fallback = {"name": "备用", "url": "http://fallback.invalid/v1", "model": "fallback", "key": ""}
+        return StreamRequest(user_message="你好", api_url="http://primary.invalid/v1", model_name="primary",
+                             share=False, policy=RequestPolicy(hedge_target=fallback, hedge_default_delay=5))
+
+    def _active(self, host="primary.invalid"):
+        return self.engine.scheduler.get_stats().get(host, {}).get("active", 0)
+
+    async def _wait_for(self, condition):
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("等待超时")
+
+    async def test_cancel_during_hedge_delay_releases_primary(self):
+        self.engine.submit(0, self._request())
+        # 主请求已取得名额并打开流，仍在对冲延迟内
+        await self._wait_for(lambda: self._active() == 1 and self.streams)
+
+        self.engine.cancel(0)
+        await self._wait_for(lambda: self._active() == 0)
+        self.assertTrue(all(stream.closed for stream in self.streams))
+        self.assertEqual(self.events[-1][2], "cancelled")
+        self.assertFalse(self.engine.is_busy(0))
+
+    async def test_cancel_before_primary_connects(self):
+        self.engine.submit(0, self._request())
+        self.engine.cancel(0)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self._active(), 0)
+        self.assertEqual(self.streams, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
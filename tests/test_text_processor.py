@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from services.mapped_text_file import MappedTextFile
+from text_processor.config import ProcessorConfig
+from text_processor.processor import TextProcessor
+from utils.token_utils import TokenUtils
+
+
+class TextProcessorTest(unittest.TestCase):
+
+    def setUp(self):
+        lines = [f"2024-01-01 00:{i // 60:02d}:{i % 60:02d} INFO 第{i}次请求处理完成 request_id={i}\n"
+                 for i in range(20000)]
+        lines[12345] = "2024-01-01 03:25:45 ERROR 数据库连接池耗尽 connection pool exhausted\n"
+        self.text = "".join(lines)
+        fd, self.path = tempfile.mkstemp(suffix=".log")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(self.text)
+        self.processor = TextProcessor(config=ProcessorConfig(default_chunk_size=500, chunk_overlap=50))
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_chunks_from_mapped_file(self):
+        with MappedTextFile(self.path) as mapped:
+            chunks = self.processor.split_into_chunks(mapped.iter_chunks(64 * 1024))
+            size = mapped.size
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk["tokens"] <= 500 for chunk in chunks))
+        offsets = [chunk["offset"] for chunk in chunks]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertTrue(all(0 <= offset < size for offset in offsets))
+        # 去掉重叠后按顺序拼接即为原文
+        self.assertEqual(self.processor.combine_chunks(chunks, ""), self.text)
+
+    def test_retrieve_from_mapped_file(self):
+        with MappedTextFile(self.path) as mapped:
+            result = self.processor.process_file_content(mapped.iter_chunks(64 * 1024), "数据库连接池 exhausted")
+        self.assertIn("connection pool exhausted", result)
+        self.assertLess(len(result), len(self.text) // 10)
+
+    def test_indexed_chunks_match(self):
+        # 按索引取出的块与重新切块的结果相同，换一个问题时不必再切块
+        with MappedTextFile(self.path) as mapped:
+            chunks = self.processor.split_into_chunks(mapped.iter_chunks(64 * 1024))
+            index = self.processor.index_chunks(mapped.iter_chunks(64 * 1024))
+            indexed = list(self.processor.iter_indexed_chunks(index, mapped.iter_chunks(64 * 1024)))
+            result = self.processor.process_file_content(mapped.iter_chunks(64 * 1024), "数据库连接池 exhausted", index)
+
+        self.assertEqual(indexed, chunks)
+        self.assertTrue(any(chunk["span"][0] != chunk["span"][2] for chunk in chunks))
+        self.assertIn("connection pool exhausted", result)
+
+    def test_string_input(self):
+        chunks = self.processor.split_into_chunks(self.text)
+        self.assertEqual(chunks[0]["offset"], 0)
+        self.assertEqual(self.processor.combine_chunks(chunks, ""), self.text)
+        result = self.processor.process_file_content(self.text, "连接池耗尽")
+        self.assertIn("数据库连接池耗尽", result)
+
+    def test_fallback_chunk_within_budget(self):
+        # 预算小于块大小且没有块达到阈值时，取分数最高的一块也不能超出预算
+        config = ProcessorConfig(default_chunk_size=500, chunk_overlap=50, min_similarity_score=2.0)
+        processor = TextProcessor(max_tokens=100, config=config)
+        chunks = processor.split_into_chunks(self.text)
+        selected = processor.find_relevant_chunks("连接池耗尽", chunks, processor.vectorize_chunks(chunks))
+
+        self.assertEqual(len(selected), 1)
+        self.assertLessEqual(selected[0]["tokens"], 100)
+        self.assertLessEqual(TokenUtils.count_tokens(selected[0]["text"]), 100)
+        self.assertTrue(chunks[selected[0]["index"]]["text"].startswith(selected[0]["text"]))
+
+    def test_empty_content(self):
+        self.assertEqual(self.processor.process_file_content("", "问题"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,5 +3,7 @@ from dataclasses import dataclass
 @dataclass
 class ProcessorConfig:
     default_chunk_size: int = 2000
+    chunk_overlap: int = 200
     min_similarity_score: float = 0.3
-    max_chunks_to_combine: int = 5
\ No newline at end of file
+    max_chunks_to_combine: int = 5
+    candidate_chunks: int = 50
\ No newline at end of file
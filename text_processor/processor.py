@@ -1,21 +1,271 @@
-from typing import List, Dict
-import tiktoken
+import heapq
+import math
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+
+from utils.token_utils import TokenUtils
 from .config import ProcessorConfig
 from .utils import timing_decorator
 
+# 依次尝试的自然边界：段落、行、句子，都切不开时再按 token 硬切
+BOUNDARIES = [
+    re.compile(r".*?(?:\n[ \t]*\n\s*|\Z)", re.S),
+    re.compile(r".*?(?:\n|\Z)", re.S),
+    re.compile(r".*?(?:[。！？；!?;]|\.\s|\Z)", re.S),
+]
+
+# 中日韩文字没有空格分词，取相邻两字（可重叠）作为词；其余文字按连续的字母数字切词
+CJK = r"぀-ヿ㐀-鿿가-힯"
+TOKEN_PATTERN = rf"(?u)(?=([{CJK}]{{2}}|(?<![^\W{CJK}])[^\W{CJK}]{{2,}}))"
+
+# 文本、按顺序排列的多段文本，或 (偏移, 文本) 序列（MappedTextFile.iter_chunks 的结果）
+Content = Union[str, Iterable[str], Iterable[Tuple[int, str]]]
+# 不含文本的块位置：(token 数, 重叠字符数, 起始段, 段内起始字符, 结束段, 段内结束字符)
+ChunkIndex = List[Tuple[int, int, int, int, int, int]]
+
 
 class TextProcessor:
-    def __init__(self, model_name="gpt-3.5-turbo", max_tokens=60000):
-        self.encoding = tiktoken.encoding_for_model(model_name)
+    """
+    从大段文本中检索与问题相关的部分，只发送这部分内容
+    按 token 数切块（块之间有重叠），TF-IDF 打分后取分数最高的几块，再按原文顺序拼接
+    多段输入（如逐块读取的大文件）时先按问题中的词粗筛出 candidate_chunks 块，全文不会留在内存中
+    切块和 token 计数只与输入有关，index_chunks 的结果可以在同一输入的不同问题之间复用
+    """
+
+    def __init__(self, model_name="gpt-3.5-turbo", max_tokens=60000, config: Optional[ProcessorConfig] = None):
+        # 编码无法加载（如离线）时为 None，按字符数估算 token
+        self.model_name = model_name
+        self.encoding = TokenUtils.get_encoding(model_name)
         self.max_tokens = max_tokens
-        self.vectorizer = TfidfVectorizer()
+        self.config = config or ProcessorConfig()
+        self.vectorizer = TfidfVectorizer(token_pattern=TOKEN_PATTERN, sublinear_tf=True)
 
     @timing_decorator
-    def process_file_content(self, file_content: str, user_query: str) -> str:
-        chunks = self.split_into_chunks(file_content)
+    def process_file_content(self, file_content: Content, user_query: str, index: Optional[ChunkIndex] = None) -> str:
+        """index 为同一输入的 index_chunks 结果时按它取块，不再切块和计算 token"""
+        if index is not None:
+            chunks = self.find_candidate_chunks(self.iter_indexed_chunks(index, file_content), user_query)
+        elif isinstance(file_content, str):
+            chunks = self.split_into_chunks(file_content)
+        else:
+            chunks = self.find_candidate_chunks(self.iter_chunks(file_content), user_query)
+        if not chunks:
+            return ""
         chunk_vectors = self.vectorize_chunks(chunks)
         relevant_chunks = self.find_relevant_chunks(user_query, chunks, chunk_vectors)
-        return self.combine_chunks(relevant_chunks, user_query)
\ No newline at end of file
+        return self.combine_chunks(relevant_chunks, user_query)
+
+    def split_into_chunks(self, file_content: Content) -> List[Dict]:
+        """
+        按 token 数切块，块尽量在段落、行、句子处结束，相邻块重叠 chunk_overlap 个 token
+
+        Returns:
+            list: [{"index": 序号, "text": 文本, "tokens": token 数,
+                    "overlap": 开头与上一块重复的字符数, "offset": 块开头的位置,
+                    "span": (起始段, 段内起始字符, 结束段, 段内结束字符)}]
+            输入为 (偏移, 文本) 序列时 offset 是块开头所在输入段的偏移（iter_chunks 给出的字节位置），
+            否则为块开头在全文中的字符位置
+        """
+        return list(self.iter_chunks(file_content))
+
+    def iter_chunks(self, file_content: Content) -> Iterator[Dict]:
+        """逐块返回 split_into_chunks 的结果"""
+        chunk_size = self.config.default_chunk_size
+        overlap = min(self.config.chunk_overlap, chunk_size // 2)
+        index = 0
+        position = 0  # 字符串输入时已处理的字符数
+        current, current_tokens = [], 0  # [(片段, token 数, 偏移, (段号, 段内起始字符))]
+        kept = 0  # current 开头从上一块保留下来的片段数
+        for block, text, block_offset in self._blocks(file_content):
+            start = 0
+            for piece, count in self._segments(text):
+                if current_tokens + count > chunk_size and len(current) > kept:
+                    yield self._make_chunk(index, current, current_tokens, kept)
+                    index += 1
+                    # 上一块末尾不超过 overlap 个 token 的片段作为下一块的开头
+                    kept, kept_tokens = 0, 0
+                    for _, segment_tokens, _, _ in reversed(current):
+                        if kept_tokens + segment_tokens > min(overlap, chunk_size - count):
+                            break
+                        kept += 1
+                        kept_tokens += segment_tokens
+                    current, current_tokens = current[len(current) - kept:], kept_tokens
+                current.append((piece, count, position if block_offset is None else block_offset, (block, start)))
+                current_tokens += count
+                position += len(piece)
+                start += len(piece)
+        if len(current) > kept:
+            yield self._make_chunk(index, current, current_tokens, kept)
+
+    @staticmethod
+    def _blocks(file_content: Content):
+        """把输入统一为 (段号, 文本, 偏移)：(偏移, 文本) 输入以偏移作为段号，其余按顺序编号、偏移为 None"""
+        texts = [file_content] if isinstance(file_content, str) else file_content
+        for number, text in enumerate(texts):
+            if isinstance(text, tuple):
+                yield text[0], text[1], text[0]
+            else:
+                yield number, text, None
+
+    @staticmethod
+    def _make_chunk(index, segments, tokens, kept):
+        first_block, first_start = segments[0][3]
+        last_block, last_start = segments[-1][3]
+        return {
+            "index": index,
+            "text": "".join(piece for piece, _, _, _ in segments),
+            "tokens": tokens,
+            "overlap": sum(len(piece) for piece, _, _, _ in segments[:kept]),
+            "offset": segments[0][2],
+            "span": (first_block, first_start, last_block, last_start + len(segments[-1][0]))
+        }
+
+    def index_chunks(self, file_content: Content) -> ChunkIndex:
+        """切块并计算 token，只保留各块的位置，不保留文本"""
+        return [(chunk["tokens"], chunk["overlap"], *chunk["span"]) for chunk in self.iter_chunks(file_content)]
+
+    def iter_indexed_chunks(self, index: ChunkIndex, file_content: Content) -> Iterator[Dict]:
+        """
+        按 index_chunks 的结果从同一输入中逐块取出文本，只保留当前块用到的段
+        offset 为块开头所在段的偏移，字符串输入时为 None
+        """
+        blocks = {}  # 段号 -> (文本, 偏移)，按读入顺序
+        source = self._blocks(file_content)
+        for number, (tokens, overlap, first, start, last, end) in enumerate(index):
+            while last not in blocks:
+                block = next(source, None)
+                if block is None:
+                    # 输入与切块时不一致（如文件已被修改）
+                    return
+                blocks[block[0]] = block[1:]
+            if first not in blocks:
+                return
+            keys = list(blocks)
+            for key in keys[:keys.index(first)]:
+                del blocks[key]
+            keys = keys[keys.index(first):keys.index(last) + 1]
+            if len(keys) == 1:
+                text = blocks[first][0][start:end]
+            else:
+                text = (blocks[first][0][start:] + "".join(blocks[key][0] for key in keys[1:-1])
+                        + blocks[last][0][:end])
+            yield {"index": number, "text": text, "tokens": tokens, "overlap": overlap,
+                   "offset": blocks[first][1], "span": (first, start, last, end)}
+
+    def _segments(self, text, level=0):
+        """把文本切成不超过 default_chunk_size 个 token 的片段，返回 (片段, token 数)"""
+        if level == len(BOUNDARIES):
+            yield from self._split_by_tokens(text)
+            return
+        pieces = [piece for piece in BOUNDARIES[level].findall(text) if piece]
+        for piece, count in zip(pieces, self._count_tokens(pieces)):
+            if count <= self.config.default_chunk_size:
+                yield piece, count
+            else:
+                yield from self._segments(piece, level + 1)
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """批量计算 token 数"""
+        if self.encoding is None:
+            return [TokenUtils.estimate_tokens(text) for text in texts]
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=())]
+
+    def _split_by_tokens(self, text):
+        """没有自然边界的长文本按 token 数硬切"""
+        chunk_size = self.config.default_chunk_size
+        if self.encoding is None:
+            total = TokenUtils.estimate_tokens(text)
+            step = max(1, len(text) * chunk_size // total)
+            for start in range(0, len(text), step):
+                piece = text[start:start + step]
+                yield piece, TokenUtils.estimate_tokens(piece)
+            return
+        tokens = self.encoding.encode(text, disallowed_special=())
+        for start in range(0, len(tokens), chunk_size):
+            window = tokens[start:start + chunk_size]
+            yield self.encoding.decode(window), len(window)
+
+    def find_candidate_chunks(self, chunks: Iterable[Dict], user_query: str) -> List[Dict]:
+        """
+        逐块粗筛，按块中出现的问题词种数和次数保留得分最高的 candidate_chunks 块，按原文顺序返回
+        其余块读过即丢弃，之后的 TF-IDF 只在候选块上计算；没有块包含问题中的词时返回第一块
+        """
+        terms = set(self.vectorizer.build_analyzer()(user_query))
+        heap = []  # 最小堆: ((种数, 次数), -序号, 块)
+        first = None
+        for chunk in chunks:
+            if first is None:
+                first = chunk
+            if not terms:
+                break
+            text = chunk["text"].lower()
+            hits = [text.count(term) for term in terms]
+            matched = sum(1 for count in hits if count)
+            if not matched:
+                continue
+            item = ((matched, sum(math.log1p(count) for count in hits)), -chunk["index"], chunk)
+            if len(heap) < self.config.candidate_chunks:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heappushpop(heap, item)
+        if not heap:
+            return [first] if first is not None else []
+        return sorted((chunk for _, _, chunk in heap), key=lambda c: c["index"])
+
+    def vectorize_chunks(self, chunks: List[Dict]):
+        """计算各块的 TF-IDF 向量，没有可用的词时返回 None"""
+        try:
+            return self.vectorizer.fit_transform([chunk["text"] for chunk in chunks])
+        except ValueError:
+            # 词表为空，例如全是标点或空白
+            return None
+
+    def find_relevant_chunks(self, user_query: str, chunks: List[Dict], chunk_vectors) -> List[Dict]:
+        """
+        取与问题相似度不低于 min_similarity_score 的块，按分数从高到低，
+        最多 max_chunks_to_combine 块，总 token 数不超过 max_tokens
+        没有块达到阈值时只取分数最高的一块，超出 max_tokens 时截取其开头
+        """
+        if chunk_vectors is None:
+            return [self._fit_chunk(chunks[0], 0.0)]
+        scores = cosine_similarity(self.vectorizer.transform([user_query]), chunk_vectors).ravel()
+        order = np.argsort(-scores, kind="stable")
+
+        selected, total_tokens = [], 0
+        for i in order:
+            if scores[i] < self.config.min_similarity_score or len(selected) >= self.config.max_chunks_to_combine:
+                break
+            chunk = chunks[i]
+            if total_tokens + chunk["tokens"] > self.max_tokens:
+                continue
+            selected.append(dict(chunk, score=float(scores[i])))
+            total_tokens += chunk["tokens"]
+        if not selected:
+            selected.append(self._fit_chunk(chunks[order[0]], float(scores[order[0]])))
+        return selected
+
+    def _fit_chunk(self, chunk, score):
+        """单独选中的块超出 max_tokens 时截取开头"""
+        chunk = dict(chunk, score=score)
+        if chunk["tokens"] > self.max_tokens:
+            chunk["text"] = TokenUtils.truncate(chunk["text"], self.max_tokens, self.model_name)
+            chunk["tokens"] = self._count_tokens([chunk["text"]])[0]
+        return chunk
+
+    def combine_chunks(self, relevant_chunks: List[Dict], user_query: str) -> str:
+        """按原文顺序拼接，相邻块去掉重叠部分，不相邻的块之间标明省略"""
+        parts = []
+        previous = None
+        for chunk in sorted(relevant_chunks, key=lambda c: c["index"]):
+            text = chunk["text"]
+            if previous is not None and chunk["index"] == previous + 1:
+                text = text[chunk["overlap"]:]
+            elif previous is not None or chunk["index"] > 0:
+                parts.append("\n…（省略）…\n")
+            parts.append(text)
+            previous = chunk["index"]
+        return "".join(parts)
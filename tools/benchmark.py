@@ -0,0 +1,259 @@
+"""
+离线端到端基准测试
+在无界面（offscreen）模式下启动 MultiChatWindow，把 N 个面板指向本地模拟服务，
+逐轮发送消息并统计界面可见的首字延迟、总耗时、吞吐、CPU 时间和界面事件循环延迟
+
+用法:
+    python tools/benchmark.py --panels 8 --rounds 5 --token-rate 200
+    python tools/benchmark.py --mode worker --max-ttft-p95 1.0 --max-lag-p95 0.05
+
+mode=engine 走 asyncio 流式引擎，mode=worker 每个面板一个 StreamWorker 线程；
+超出 --max-* 阈值时以非零状态退出，可用于性能回归检查
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import MockServer, add_option_arguments, options_from_args  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def prepare_workdir(base_url, panels, flush_hz, same_model, direct):
+    """在临时目录中生成配置文件，界面和服务都从当前目录读取 configFiles"""
+    workdir = tempfile.mkdtemp(prefix="aicopilot-bench-")
+    os.makedirs(os.path.join(workdir, "configFiles"))
+    models = [{"name": f"mock-{i}", "url": base_url, "model": "mock" if same_model else f"mock-{i}", "key": "mock"}
+              for i in range(panels)]
+    config = {"models": models, "stream_flush_hz": flush_hz}
+    if direct:
+        # 本地模拟服务不经过系统代理
+        config["proxy"] = False
+    with open(os.path.join(workdir, "configFiles", "config.json"), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    with open(os.path.join(workdir, "configFiles", "prompts.json"), 'w', encoding='utf-8') as f:
+        json.dump({"templates": []}, f)
+    return workdir
+
+
+def create_worker_bridge(window):
+    """用 StreamWorker 替换流式引擎，事件仍交给窗口的 handle_stream_event 处理"""
+    from services.stream_worker import StreamWorker
+
+    class WorkerBridge:
+        def __init__(self):
+            self.workers = {}
+            self.next_id = 0
+
+        def submit(self, model_index, request):
+            self.cancel(model_index)
+            self.next_id += 1
+            request_id = self.next_id
+            worker = StreamWorker(request.conversation_history, request.user_message, request.api_url,
+                                  request.model_name, request.api_key, request.prompt, model_index,
+                                  delta_buffer=window.delta_buffer, request_id=request_id)
+            worker.message_ready.connect(
+                lambda text, i, rid=request_id: window.handle_stream_event(i, rid, "delta", text))
+            worker.metrics_ready.connect(
+                lambda metrics, i, rid=request_id: window.handle_stream_event(i, rid, "metrics", metrics))
+            worker.reply_finished.connect(
+                lambda reply, i, rid=request_id: window.handle_stream_event(i, rid, "finished", reply))
+            worker.cancelled.connect(
+                lambda reply, i, rid=request_id: window.handle_stream_event(i, rid, "cancelled", reply))
+            worker.error_occurred.connect(
+                lambda error, i=model_index, rid=request_id: window.handle_stream_event(i, rid, "error", error))
+            self.workers[model_index] = worker
+            worker.start()
+            return request_id
+
+        def cancel(self, model_index):
+            worker = self.workers.pop(model_index, None)
+            if worker is not None:
+                worker.stop()
+
+        def shutdown(self):
+            for model_index in list(self.workers):
+                self.cancel(model_index)
+
+    return WorkerBridge()
+
+
+def run_benchmark(args, base_url):
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication
+    from UI.main_window import MultiChatWindow
+    from utils.token_utils import TokenUtils
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = MultiChatWindow()
+    while len(window.chat_panels) < args.panels:
+        window.add_chat_panel()
+    for i, panel in enumerate(window.chat_panels):
+        panel.model_combo.setCurrentIndex(i)
+    if args.mode == "worker":
+        window.stream_bridge.shutdown()
+        window.stream_bridge = create_worker_bridge(window)
+    window.show()
+
+    # 记录界面可见的首字和完成时间
+    first_visible = {}
+    finished_at = {}
+    replies = {}
+    original_update = window.update_chat_display
+    original_render = window.render_final_response
+
+    def update_chat_display(reply, model_index):
+        first_visible.setdefault(model_index, time.perf_counter())
+        original_update(reply, model_index)
+
+    def render_final_response(reply, model_index):
+        finished_at[model_index] = time.perf_counter()
+        replies[model_index] = window.chat_panels[model_index].current_response
+        original_render(reply, model_index)
+
+    window.update_chat_display = update_chat_display
+    window.render_final_response = render_final_response
+
+    # 用 10ms 定时器探测界面事件循环的延迟
+    lags = []
+    probe_interval = 0.010
+    last_tick = [time.perf_counter()]
+
+    def probe():
+        now = time.perf_counter()
+        lags.append(max(0.0, now - last_tick[0] - probe_interval))
+        last_tick[0] = now
+
+    probe_timer = QTimer()
+    probe_timer.timeout.connect(probe)
+    probe_timer.start(int(probe_interval * 1000))
+
+    ttfts, totals, rates = [], [], []
+    errors = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for round_index in range(args.rounds):
+        first_visible.clear()
+        finished_at.clear()
+        replies.clear()
+        window.clear_memory()
+        window.input_box.setPlainText(f"benchmark round {round_index}")
+        sent_at = time.perf_counter()
+        window.send_message()
+
+        deadline = sent_at + args.timeout
+        loop = QEventLoop()
+        while any(request is not None for request in window.active_requests) and time.perf_counter() < deadline:
+            QTimer.singleShot(5, loop.quit)
+            loop.exec()
+
+        for i in range(args.panels):
+            if i not in finished_at:
+                errors += 1
+                continue
+            ttfts.append(first_visible.get(i, finished_at[i]) - sent_at)
+            totals.append(finished_at[i] - sent_at)
+            streaming = finished_at[i] - first_visible.get(i, finished_at[i])
+            if streaming > 0:
+                rates.append(TokenUtils.count_tokens(replies[i]) / streaming)
+
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    probe_timer.stop()
+    window.close()
+
+    return {
+        "mode": args.mode,
+        "panels": args.panels,
+        "rounds": args.rounds,
+        "errors": errors,
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "ttft": {"p50": percentile(ttfts, 50), "p95": percentile(ttfts, 95), "max": max(ttfts, default=None)},
+        "total_time": {"p50": percentile(totals, 50), "p95": percentile(totals, 95),
+                       "max": max(totals, default=None)},
+        "tokens_per_sec": {"p50": percentile(rates, 50), "p5": percentile(rates, 5)},
+        "event_loop_lag": {"p50": percentile(lags, 50), "p95": percentile(lags, 95), "max": max(lags, default=None)},
+    }
+
+
+def format_report(result):
+    def fmt(value, unit="s"):
+        return "-" if value is None else f"{value:.3f}{unit}"
+
+    lines = [
+        f"模式: {result['mode']}  面板: {result['panels']}  轮数: {result['rounds']}  失败: {result['errors']}",
+        f"总耗时 {fmt(result['wall_time'])}  CPU 时间 {fmt(result['cpu_time'])}",
+        f"首字延迟  p50 {fmt(result['ttft']['p50'])}  p95 {fmt(result['ttft']['p95'])}  "
+        f"max {fmt(result['ttft']['max'])}",
+        f"完成耗时  p50 {fmt(result['total_time']['p50'])}  p95 {fmt(result['total_time']['p95'])}  "
+        f"max {fmt(result['total_time']['max'])}",
+        f"输出速度  p50 {fmt(result['tokens_per_sec']['p50'], ' tok/s')}  "
+        f"p5 {fmt(result['tokens_per_sec']['p5'], ' tok/s')}",
+        f"事件循环延迟  p50 {fmt(result['event_loop_lag']['p50'])}  p95 {fmt(result['event_loop_lag']['p95'])}  "
+        f"max {fmt(result['event_loop_lag']['max'])}",
+    ]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线端到端基准测试")
+    parser.add_argument("--mode", choices=["engine", "worker"], default="engine")
+    parser.add_argument("--panels", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--flush-hz", type=int, default=60, help="界面刷新频率，0 表示逐片段刷新")
+    parser.add_argument("--same-model", action="store_true", help="所有面板使用同一模型（会触发请求合并）")
+    parser.add_argument("--url", help="使用已运行的服务，不启动内置模拟服务")
+    parser.add_argument("--timeout", type=float, default=120, help="每轮最长等待时间（秒）")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--max-ttft-p95", type=float, help="首字延迟 p95 上限（秒）")
+    parser.add_argument("--max-lag-p95", type=float, help="事件循环延迟 p95 上限（秒）")
+    add_option_arguments(parser)
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = MockServer(port=0, options=options_from_args(args)).start()
+        base_url = server.base_url
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    os.chdir(prepare_workdir(base_url, args.panels, args.flush_hz, args.same_model, direct=server is not None))
+    try:
+        result = run_benchmark(args, base_url)
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(format_report(result))
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    failed = result["errors"] > 0
+    if args.max_ttft_p95 is not None and (result["ttft"]["p95"] or 0) > args.max_ttft_p95:
+        print(f"首字延迟 p95 超过上限 {args.max_ttft_p95}s")
+        failed = True
+    if args.max_lag_p95 is not None and (result["event_loop_lag"]["p95"] or 0) > args.max_lag_p95:
+        print(f"事件循环延迟 p95 超过上限 {args.max_lag_p95}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
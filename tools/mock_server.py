@@ -0,0 +1,227 @@
+"""
+本地模拟的 OpenAI 兼容流式服务
+提供 /v1/chat/completions（SSE 流式与非流式）和 /v1/models，
+可配置首字延迟、输出速度、分片大小和错误注入，用于离线测试和基准测试
+
+用法:
+    python tools/mock_server.py --port 8765 --ttft 0.3 --token-rate 80 --error-rate 0.05
+
+在 configFiles/config.json 中把模型的 url 指向 http://127.0.0.1:8765/v1 即可
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict, replace
+
+WORDS = ("the quick brown fox jumps over lazy dog while streaming tokens "
+         "from a local mock server for offline benchmarks").split()
+
+
+@dataclass
+class MockOptions:
+    ttft: float = 0.2  # 首字延迟（秒）
+    ttft_jitter: float = 0.0  # 首字延迟的随机抖动（秒）
+    token_rate: float = 100.0  # 每秒输出的 token 数，0 表示不限速
+    chunk_tokens: int = 1  # 每个 SSE 片段包含的 token 数
+    reply_tokens: int = 200  # 每次回复的 token 数
+    error_rate: float = 0.0  # 错误注入概率
+    error_status: int = 503  # 注入错误的状态码
+    retry_after: float = 0.0  # 注入错误时返回的 Retry-After（秒），0 表示不返回
+
+
+class MockServer:
+    """
+    模拟服务
+    profiles 可按请求中的模型名称覆盖默认参数，例如 {"slow": {"ttft": 3}}
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, options=None, profiles=None):
+        self.host = host
+        self.port = port
+        self.options = options or MockOptions()
+        self.profiles = profiles or {}
+        self.request_count = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def options_for(self, model):
+        overrides = self.profiles.get(model)
+        return replace(self.options, **overrides) if overrides else self.options
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        """在后台线程中启动，返回后即可接收请求"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="MockServer", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                if method == "GET" and path.rstrip("/").endswith("/models"):
+                    await self._send_json(writer, 200, {
+                        "object": "list",
+                        "data": [{"id": name, "object": "model"} for name in self.profiles or ["mock"]]
+                    })
+                elif method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    await self._handle_completion(writer, json.loads(body or b"{}"))
+                else:
+                    await self._send_json(writer, 404, {"error": {"message": f"unknown path {path}"}})
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_completion(self, writer, body):
+        self.request_count += 1
+        model = body.get("model", "mock")
+        options = self.options_for(model)
+
+        if random.random() < options.error_rate:
+            extra = {"retry-after": f"{options.retry_after:g}"} if options.retry_after else {}
+            await self._send_json(writer, options.error_status,
+                                  {"error": {"message": "injected error", "type": "mock_error"}}, extra)
+            return
+
+        await asyncio.sleep(max(0.0, options.ttft + random.uniform(-1, 1) * options.ttft_jitter))
+        completion_id = f"chatcmpl-mock-{self.request_count}"
+        tokens = [WORDS[i % len(WORDS)] + " " for i in range(options.reply_tokens)]
+
+        if not body.get("stream"):
+            await self._send_json(writer, 200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}]
+            })
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\n"
+                     b"cache-control: no-cache\r\ntransfer-encoding: chunked\r\n\r\n")
+        interval = options.chunk_tokens / options.token_rate if options.token_rate > 0 else 0
+        started = time.monotonic()
+        for index, start in enumerate(range(0, len(tokens), options.chunk_tokens)):
+            content = "".join(tokens[start:start + options.chunk_tokens])
+            self._write_event(writer, self._chunk(completion_id, model, {"content": content}, None))
+            await writer.drain()
+            if interval:
+                # 按绝对时间对齐，避免 sleep 误差累积
+                delay = started + (index + 1) * interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        self._write_event(writer, self._chunk(completion_id, model, {}, "stop"))
+        self._write_raw(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _chunk(completion_id, model, delta, finish_reason):
+        return {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+
+    def _write_event(self, writer, data):
+        self._write_raw(writer, f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    @staticmethod
+    def _write_raw(writer, data):
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    @staticmethod
+    async def _send_json(writer, status, data, extra_headers=None):
+        body = json.dumps(data).encode("utf-8")
+        headers = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                   "content-type: application/json", f"content-length: {len(body)}"]
+        headers += [f"{name}: {value}" for name, value in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+def add_option_arguments(parser):
+    """把 MockOptions 的字段注册为命令行参数"""
+    for name, value in asdict(MockOptions()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+
+def options_from_args(args):
+    return MockOptions(**{name: getattr(args, name) for name in asdict(MockOptions())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容流式服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profiles", help="按模型名称覆盖参数的 JSON 文件")
+    add_option_arguments(parser)
+    args = parser.parse_args()
+
+    profiles = {}
+    if args.profiles:
+        with open(args.profiles, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+
+    server = MockServer(args.host, args.port, options_from_args(args), profiles)
+
+    async def run():
+        await server.serve()
+        print(f"模拟服务已启动: {server.base_url}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
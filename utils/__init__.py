@@ -1,3 +1,4 @@
 from .proxy_utils import ProxyUtils
+from .token_utils import TokenUtils
 
-__all__ = ['ProxyUtils']
\ No newline at end of file
+__all__ = ['ProxyUtils', 'TokenUtils']
\ No newline at end of file
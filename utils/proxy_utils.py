@@ -1,9 +1,31 @@
-import winreg
+import fnmatch
+import os
+import sys
+import threading
+from urllib.parse import urlparse
+
+from config import ConfigManager
 
 
 class ProxyUtils:
+    """
+    代理设置解析，启动后只解析一次并缓存
+    优先使用 config.json 中的 proxy 设置:
+        "proxy": "http://127.0.0.1:7890"                          所有请求使用该代理
+        "proxy": {"http": "...", "https": "...", "no_proxy": "localhost,.lan"}
+        "proxy": false                                            直连，忽略系统设置
+    未配置时 Windows 读取注册表中的系统代理，其他平台读取 HTTP(S)_PROXY / NO_PROXY 环境变量
+    """
+    _settings = None
+    _lock = threading.Lock()
+
     @staticmethod
     def get_win11_proxy_settings():
+        """读取 Windows 注册表中的系统代理，非 Windows 平台或读取失败时返回 None"""
+        if sys.platform != "win32":
+            return None
+        import winreg
+
         try:
             reg_key = winreg.OpenKey(
                 winreg.HKEY_CURRENT_USER,
@@ -11,12 +33,138 @@ class ProxyUtils:
             )
             proxy_enable = winreg.QueryValueEx(reg_key, "ProxyEnable")[0]
             proxy_server = winreg.QueryValueEx(reg_key, "ProxyServer")[0]
+            try:
+                proxy_override = winreg.QueryValueEx(reg_key, "ProxyOverride")[0]
+            except OSError:
+                proxy_override = ""
             winreg.CloseKey(reg_key)
 
             return {
                 "enabled": bool(proxy_enable),
-                "server": proxy_server if proxy_enable else None
+                "server": proxy_server if proxy_enable else None,
+                "override": proxy_override
             }
-        except WindowsError as e:
+        except OSError as e:
             print(f"读取注册表错误: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    @classmethod
+    def get_proxy_settings(cls):
+        """
+        获取缓存的代理设置
+
+        Returns:
+            dict: {"proxies": {协议: 代理地址}, "bypass": [不走代理的主机规则], "source": 来源}
+        """
+        with cls._lock:
+            if cls._settings is None:
+                cls._settings = cls._resolve()
+                if cls._settings["proxies"]:
+                    print(f"使用代理（{cls._settings['source']}）: {cls._settings['proxies']}")
+            return cls._settings
+
+    @classmethod
+    def refresh(cls):
+        """丢弃缓存，下次使用时重新解析"""
+        with cls._lock:
+            cls._settings = None
+
+    @classmethod
+    def get_proxy(cls, url):
+        """
+        获取访问 url 应使用的代理
+
+        Returns:
+            str: 代理地址，直连时返回 None
+        """
+        settings = cls.get_proxy_settings()
+        parsed = urlparse(url)
+        if cls._bypassed(parsed.hostname or "", parsed.port, settings["bypass"]):
+            return None
+        return settings["proxies"].get(parsed.scheme or "https")
+
+    @classmethod
+    def _resolve(cls):
+        override = ConfigManager.get_setting("proxy")
+        if override is not None:
+            return cls._from_config(override)
+
+        if sys.platform == "win32":
+            registry = cls.get_win11_proxy_settings()
+            if registry and registry["enabled"] and registry["server"]:
+                return {
+                    "proxies": cls._parse_registry_server(registry["server"]),
+                    "bypass": [rule.strip() for rule in registry["override"].split(";") if rule.strip()],
+                    "source": "registry"
+                }
+            return {"proxies": {}, "bypass": [], "source": "registry"}
+
+        return cls._from_env()
+
+    @classmethod
+    def _from_config(cls, override):
+        if not override:
+            return {"proxies": {}, "bypass": [], "source": "config"}
+        if isinstance(override, str):
+            server = cls._with_scheme(override)
+            return {"proxies": {"http": server, "https": server}, "bypass": [], "source": "config"}
+        proxies = {scheme: cls._with_scheme(override[scheme]) for scheme in ("http", "https") if override.get(scheme)}
+        return {"proxies": proxies, "bypass": cls._split(override.get("no_proxy", "")), "source": "config"}
+
+    @classmethod
+    def _from_env(cls):
+        def env(name):
+            return os.environ.get(name.lower()) or os.environ.get(name.upper()) or ""
+
+        fallback = env("all_proxy")
+        proxies = {}
+        for scheme in ("http", "https"):
+            server = env(f"{scheme}_proxy") or fallback
+            if server:
+                proxies[scheme] = cls._with_scheme(server)
+        return {"proxies": proxies, "bypass": cls._split(env("no_proxy")), "source": "env"}
+
+    @classmethod
+    def _parse_registry_server(cls, server):
+        """注册表中的代理可能是 host:port，也可能是 http=host:port;https=host:port"""
+        if "=" not in server:
+            server = cls._with_scheme(server)
+            return {"http": server, "https": server}
+        proxies = {}
+        for part in server.split(";"):
+            scheme, _, address = part.partition("=")
+            if scheme.strip().lower() in ("http", "https") and address.strip():
+                proxies[scheme.strip().lower()] = cls._with_scheme(address.strip())
+        return proxies
+
+    @staticmethod
+    def _with_scheme(server):
+        server = server.strip()
+        return server if "://" in server else f"http://{server}"
+
+    @staticmethod
+    def _split(value):
+        return [rule.strip() for rule in value.split(",") if rule.strip()]
+
+    @staticmethod
+    def _bypassed(host, port, rules):
+        """按 NO_PROXY / ProxyOverride 规则判断主机是否直连"""
+        host = host.lower()
+        for rule in rules:
+            rule = rule.lower()
+            if rule == "*":
+                return True
+            if rule == "<local>":
+                if "." not in host:
+                    return True
+                continue
+            if ":" in rule and not rule.startswith("["):
+                rule, _, rule_port = rule.rpartition(":")
+                if rule_port.isdigit() and port is not None and int(rule_port) != port:
+                    continue
+            if "*" in rule or "?" in rule:
+                if fnmatch.fnmatch(host, rule):
+                    return True
+            elif host == rule.lstrip(".") or host.endswith("." + rule.lstrip(".")):
+                return True
+        return False
@@ -0,0 +1,85 @@
+import threading
+
+import tiktoken
+
+
+class TokenUtils:
+    """
+    基于 tiktoken 的 token 计数
+    编码按模型缓存；模型未知时使用 cl100k_base，编码文件无法加载（如离线）时按字符数估算
+    """
+    default_encoding = "cl100k_base"
+
+    _encodings = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_encoding(cls, model_name=None):
+        """获取模型对应的编码，无法加载时返回 None"""
+        key = model_name or cls.default_encoding
+        with cls._lock:
+            if key in cls._encodings:
+                return cls._encodings[key]
+            encoding = None
+            try:
+                encoding = tiktoken.encoding_for_model(model_name) if model_name else None
+            except KeyError:
+                pass
+            except Exception as e:
+                print(f"加载 {model_name} 的编码失败: {e}")
+            if encoding is None:
+                encoding = cls._load_default()
+            cls._encodings[key] = encoding
+            return encoding
+
+    @classmethod
+    def _load_default(cls):
+        if cls.default_encoding in cls._encodings:
+            return cls._encodings[cls.default_encoding]
+        try:
+            encoding = tiktoken.get_encoding(cls.default_encoding)
+        except Exception as e:
+            print(f"加载默认编码失败，将按字符数估算 token: {e}")
+            encoding = None
+        cls._encodings[cls.default_encoding] = encoding
+        return encoding
+
+    @classmethod
+    def count_tokens(cls, text, model_name=None):
+        """计算文本的 token 数"""
+        if not text:
+            return 0
+        encoding = cls.get_encoding(model_name)
+        if encoding is None:
+            return cls.estimate_tokens(text)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    @classmethod
+    def truncate(cls, text, max_tokens, model_name=None):
+        """截取文本开头不超过 max_tokens 个 token 的部分"""
+        if max_tokens <= 0:
+            return ""
+        encoding = cls.get_encoding(model_name)
+        if encoding is None:
+            total = cls.estimate_tokens(text)
+            if total <= max_tokens:
+                return text
+            # 中英文混排时按比例截取不准确，二分查找不超过 max_tokens 的最长开头（每个 token 至多 4 个字符）
+            low, high = 0, min(len(text), max_tokens * 4 + 3)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if cls.estimate_tokens(text[:middle]) <= max_tokens:
+                    low = middle
+                else:
+                    high = middle - 1
+            return text[:low]
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+
+    @staticmethod
+    def estimate_tokens(text):
+        """粗略估算：ASCII 约 4 个字符一个 token，其余字符约一个字符一个 token"""
+        ascii_count = len(text.encode('ascii', 'ignore'))
+        return (ascii_count + 3) // 4 + (len(text) - ascii_count)